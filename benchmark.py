@@ -0,0 +1,178 @@
+import argparse
+import json
+import logging
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from cache import breakdown_cache
+from helper import PackBreaker, numpy
+from models.bakery import Bakery
+from models.order import Order
+from models.product import Product
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = range(1, 9)  # how many pack sizes, 1 to 8
+MAGNITUDES = {"small": 20, "medium": 100, "large": 500}  # upper bound of pack size
+KINDS = ("perfect", "off_by_one", "infeasible")
+TARGETS = ("pack_breaker", "pack_order", "process_order")
+
+
+def generate_cases(seed, dimensions=DIMENSIONS, magnitudes=MAGNITUDES):
+    """
+    seeded benchmark matrix, same seed always gives same cases
+    :return: list of (name, pack sizes, quantity)
+    """
+    rng = random.Random(seed)
+    cases = []
+    for dimension in dimensions:
+        for magnitude, upper_bound in magnitudes.items():
+            # pack size from 2, so min size - 1 is never reachable
+            pack_sizes = rng.sample(range(2, max(upper_bound, dimension + 2)), dimension)
+            pack_sizes.sort(reverse=True)
+            amounts = [rng.randrange(1, 6) for i in range(dimension)]
+            perfect = sum(size * amount for size, amount in zip(pack_sizes, amounts))
+            quantities = {
+                "perfect": perfect,
+                "off_by_one": perfect + 1,
+                "infeasible": min(pack_sizes) - 1,
+            }
+            for kind in KINDS:
+                name = f"{dimension}/{magnitude}/{kind}"
+                cases.append((name, pack_sizes, quantities[kind]))
+    return cases
+
+
+def percentile(values, percent):
+    """nearest-rank percentile of values"""
+    ordered = sorted(values)
+    return ordered[max(int(math.ceil(percent / 100 * len(ordered))) - 1, 0)]
+
+
+def measure(func, repeat, setup=None):
+    """
+    :param func: callable to measure
+    :param repeat: run times
+    :param setup: callable run before each run, not measured
+    :return: dict of median, p95 latency in ms and peak memory in KB
+    """
+    # warm up, so one-off table building is not counted
+    func()
+
+    timings = []
+    for i in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "median_ms": statistics.median(timings),
+        "p95_ms": percentile(timings, 95),
+        "peak_kb": peak / 1024,
+    }
+
+
+def run_benchmark(seed=0, repeat=20, targets=TARGETS, dimensions=DIMENSIONS, magnitudes=MAGNITUDES):
+    """
+    :return: dict of run meta and measurements keyed by `target/dimension/magnitude/kind`
+    """
+    results = {}
+    for name, pack_sizes, quantity in generate_cases(seed, dimensions, magnitudes):
+        product = Product("Benchmark", "BENCH", {size: 1 for size in pack_sizes})
+        bakery = Bakery([product])
+        funcs = {
+            "pack_breaker": lambda: PackBreaker(quantity, list(pack_sizes)).solve(),
+            "pack_order": lambda: product.pack_order(quantity),
+            "process_order": lambda: bakery.process_order(Order({product.code: quantity})),
+        }
+        for target in targets:
+            # measure the solve, not the shared result cache
+            results[f"{target}/{name}"] = measure(funcs[target], repeat, setup=breakdown_cache.clear)
+            logger.debug(f"{target}/{name}: {results[f'{target}/{name}']}")
+
+    return {
+        "meta": {
+            "seed": seed,
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "numpy": numpy is not None,
+        },
+        "cases": results,
+    }
+
+
+def find_regressions(report, baseline, tolerance=0.2, noise_ms=0.05):
+    """
+    :param report: result of `run_benchmark`
+    :param baseline: a stored result of `run_benchmark`
+    :param tolerance: allowed ratio over baseline
+    :param noise_ms: latency change under this is ignored
+    :return: list of regression messages, empty if no regression
+    """
+    regressions = []
+    for name, result in report["cases"].items():
+        if name not in baseline["cases"]:
+            continue
+        base = baseline["cases"][name]
+        for metric in ("median_ms", "p95_ms"):
+            limit = base[metric] * (1 + tolerance)
+            if result[metric] > limit and result[metric] - base[metric] > noise_ms:
+                regressions.append(
+                    f"{name} {metric}: {result[metric]:.3f} > {base[metric]:.3f} baseline"
+                )
+        if result["peak_kb"] > base["peak_kb"] * (1 + tolerance) + 1:
+            regressions.append(
+                f"{name} peak_kb: {result['peak_kb']:.1f} > {base['peak_kb']:.1f} baseline"
+            )
+    return regressions
+
+
+def print_report(report):
+    print("%-40s %12s %12s %12s" % ("Case", "Median(ms)", "P95(ms)", "Peak(KB)"))
+    print("-" * 80)
+    for name, result in report["cases"].items():
+        print(
+            "%-40s %12.3f %12.3f %12.1f"
+            % (name, result["median_ms"], result["p95_ms"], result["peak_kb"])
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pack breakdown engines")
+    parser.add_argument("--seed", type=int, default=0, help="seed of benchmark matrix")
+    parser.add_argument("--repeat", type=int, default=20, help="run times of each case")
+    parser.add_argument("--target", choices=TARGETS, action="append", help="only run these targets")
+    parser.add_argument("--output", help="write result as JSON to this file")
+    parser.add_argument("--baseline", help="fail if regressed past this JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed ratio over baseline")
+    args = parser.parse_args()
+
+    report = run_benchmark(seed=args.seed, repeat=args.repeat, targets=args.target or TARGETS)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,78 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from config import BREAKDOWN_CACHE_SIZE
+from helper import normalize_pack_sizes
+
+logger = logging.getLogger(__name__)
+
+
+class BreakdownCache:
+    """
+    bounded LRU cache of breakdown results, keyed by pack size set, quantity and an optional variant
+    (e.g. prices and pricing mode). price is not cached, products sharing same pack sizes may have different prices.
+    """
+
+    def __init__(self, max_size=BREAKDOWN_CACHE_SIZE):
+        """
+        :param max_size: max entries, least recently used one is evicted when full, 0 to disable
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_solve(self, pack_sizes, quantity, solve, variant=None):
+        """
+        :param pack_sizes: pack size list, normalized as part of the key
+        :param quantity: order quantity
+        :param solve: callable return (breakdown dict, remainder), only called on cache miss
+        :param variant: hashable, anything else the result depends on
+        :return: copy of breakdown dict, remainder
+        """
+        key = (normalize_pack_sizes(pack_sizes), quantity, variant)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                breakdown, remainder = self._entries[key]
+                return dict(breakdown), remainder
+            self.misses += 1
+
+        breakdown, remainder = solve()
+        if self.max_size > 0:
+            with self._lock:
+                self._entries[key] = (dict(breakdown), remainder)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return breakdown, remainder
+
+    def stats(self):
+        """
+        :return: dict of hits, misses, evictions and current size
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
+
+    def clear(self):
+        """
+        drop all entries and reset counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+# process wide cache shared by all products and orders
+breakdown_cache = BreakdownCache()
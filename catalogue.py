@@ -0,0 +1,70 @@
+import csv
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+FORMAT_JSON = "json"
+FORMAT_CSV = "csv"
+CATALOGUE_FORMATS = (FORMAT_JSON, FORMAT_CSV)
+
+
+def guess_catalogue_format(path):
+    """
+    guess catalogue format by file extension, JSON by default
+    """
+    if path and path.lower().endswith(".csv"):
+        return FORMAT_CSV
+    return FORMAT_JSON
+
+
+def read_catalogue(f, input_format=FORMAT_JSON):
+    """
+    read raw product records, pack sizes and prices are kept as they are and converted when the product is created.
+
+    JSON: list of `{"code": "VS5", "name": "Vegemite Scroll", "packs": {"3": 6.99, "5": 8.99}}`,
+          or object of code and `{"name": ..., "packs": ...}`
+    CSV: header row `code,name,size,price`, one pack per row, rows of same code are merged
+    :param f: opened text file
+    :return: generator of (code, name, pack price dict)
+    """
+    if input_format == FORMAT_CSV:
+        products = {}  # code -> (name, pack price dict), in order of appearance
+        for row in csv.DictReader(f):
+            code = (row.get("code") or "").strip()
+            if not code:
+                # skip row without code
+                continue
+            name, packs = products.setdefault(code, (row.get("name") or code, {}))
+            packs[row.get("size")] = row.get("price")
+        for code, (name, packs) in products.items():
+            yield code, name, packs
+        return
+
+    records = json.load(f)
+    if isinstance(records, dict):
+        records = [dict(record, code=code) for code, record in records.items()]
+    for record in records:
+        if not isinstance(record, dict) or not record.get("code"):
+            # skip invalid record
+            continue
+        yield record["code"], record.get("name", record["code"]), record.get("packs") or {}
+
+
+def load_catalogue(bakery, path, input_format=None):
+    """
+    register products of a catalogue file into bakery, products are created and solved on first use
+    or by `Bakery.warmup`
+    :return: dict of products registered and elapsed seconds
+    """
+    start = time.perf_counter()
+    input_format = input_format or guess_catalogue_format(path)
+    count = 0
+    with open(path, newline="") as f:
+        for code, name, packs in read_catalogue(f, input_format):
+            bakery.register(code, name, packs)
+            count += 1
+    elapsed = time.perf_counter() - start
+    logger.debug(f"{count} products registered from {path} in {elapsed:.3f}s")
+    return {"products": count, "elapsed": elapsed}
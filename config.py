@@ -48,3 +48,64 @@ logging.basicConfig(level=LOG_LEVEL)
 PRICE_DECIMAL_PLACES = env_int("PRICE_DECIMAL_PLACES", 2)  # 10 ** -2 = 0.01
 
 PRICE_DECIMAL_UNIT = Decimal(str(10 ** (-1 * PRICE_DECIMAL_PLACES)))
+
+# PACK ENGINE
+# ------------------------------------------------------------------------------
+# engine used by PackBreaker.solve, `dp` (iterative) or `recursive`
+PACK_ENGINE = os.getenv("PACK_ENGINE", "dp")
+
+# BREAKDOWN CACHE
+# ------------------------------------------------------------------------------
+# max entries of the process wide LRU cache of breakdown results, 0 to disable
+BREAKDOWN_CACHE_SIZE = env_int("BREAKDOWN_CACHE_SIZE", 4096)
+
+# NUMPY
+# ------------------------------------------------------------------------------
+# vectorise pack table builder by numpy if it is installed, pure python otherwise
+USE_NUMPY = env_bool("USE_NUMPY", default=True)
+
+# PROCESS POOL
+# ------------------------------------------------------------------------------
+# worker processes of Bakery.process_orders_parallel, 0 means cpu count
+PROCESS_WORKERS = env_int("PROCESS_WORKERS", 0)
+# work items sent to a worker at a time
+PROCESS_CHUNK_SIZE = env_int("PROCESS_CHUNK_SIZE", 256)
+
+# INSTRUMENT
+# ------------------------------------------------------------------------------
+# collect solver and order stats by hooks and log them at process exit
+INSTRUMENT = env_bool("INSTRUMENT", default=False)
+
+# ORDER SERVICE
+# ------------------------------------------------------------------------------
+# max pending requests of server.py, readers wait when it is full
+SERVICE_QUEUE_SIZE = env_int("SERVICE_QUEUE_SIZE", 1024)
+# max orders processed at a time by server.py
+SERVICE_WORKERS = env_int("SERVICE_WORKERS", 64)
+
+# PRICING MODE
+# ------------------------------------------------------------------------------
+# default pricing mode of Bakery, `packs`, `packs_price` or `price`
+PRICING_MODE = os.getenv("PRICING_MODE", "packs")
+
+# TABLE SIZE LIMIT
+# ------------------------------------------------------------------------------
+# max entries of a pack table, about largest size * second largest size. larger pack size sets are solved
+# with one entry per residue of the largest size instead, small quantities with a table up to the quantity only
+TABLE_SIZE_LIMIT = env_int("TABLE_SIZE_LIMIT", 1 << 20)
+
+# STOCK NODE BUDGET
+# ------------------------------------------------------------------------------
+# max search nodes of an order short of more stock than TABLE_SIZE_LIMIT quantity, if the caller gives no budget.
+# such orders are searched instead of solved in full, and marked `optimal = False` if not proven best
+STOCK_NODE_BUDGET = env_int("STOCK_NODE_BUDGET", 100000)
+
+# TABLE CACHE DIR
+# ------------------------------------------------------------------------------
+# directory of memory-mapped pack table files shared by processes, empty to keep tables in memory only
+TABLE_CACHE_DIR = os.getenv("TABLE_CACHE_DIR", "")
+
+# SHARED TABLES
+# ------------------------------------------------------------------------------
+# name prefix of shared memory segments of pack tables, different deployments on one box should not share it
+SHARED_TABLE_PREFIX = os.getenv("SHARED_TABLE_PREFIX", "rbpt_")
@@ -0,0 +1,299 @@
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmark import percentile
+from helper import ENGINE_DP, ENGINE_RECURSIVE, PackBreaker, get_pack_table, get_table_key
+from models.product import Product
+
+logger = logging.getLogger(__name__)
+
+
+def solve_recursive(quantity, pack_sizes):
+    return PackBreaker(quantity, pack_sizes, engine=ENGINE_RECURSIVE).solve()
+
+
+def solve_dp(quantity, pack_sizes):
+    return PackBreaker(quantity, pack_sizes, engine=ENGINE_DP).solve()
+
+
+def solve_table(quantity, pack_sizes):
+    return get_pack_table(*get_table_key(pack_sizes)).breakdown(quantity)
+
+
+def solve_anytime(quantity, pack_sizes):
+    packs, remainder, proven = PackBreaker(quantity, pack_sizes).solve_anytime()
+    return packs, remainder
+
+
+def solve_pack_order(quantity, pack_sizes):
+    # greedy, table or cache path, whichever the product takes
+    return Product("Fuzz", "FUZZ", {size: 1 for size in pack_sizes}).pack_order(quantity)[:2]
+
+
+FUZZ_ENGINES = {
+    "recursive": solve_recursive,
+    "dp": solve_dp,
+    "table": solve_table,
+    "anytime": solve_anytime,
+    "pack_order": solve_pack_order,
+}
+
+# recursive engine stops at the first perfect breakdown, not always least packs, so it is known to fail.
+# only fuzzed if asked by `--engine recursive`
+DEFAULT_ENGINES = tuple(engine for engine in FUZZ_ENGINES if engine != "recursive")
+
+
+def oracle_objective(quantity, pack_sizes):
+    """
+    exhaustive oracle, every pack combination is enumerated by pack amount, one more pack at a time,
+    combinations of same total are kept once. no table, period or pruning is shared with the engines
+    :return: least remainder, least packs amount of it
+    """
+    best = (quantity, 0)
+    layer = {0}
+    packs = 0
+    while layer:
+        packs += 1
+        layer = {total + size for total in layer for size in pack_sizes if total + size <= quantity}
+        if layer and quantity - max(layer) < best[0]:
+            best = (quantity - max(layer), packs)
+    return best
+
+
+def generate_case(seed, index, max_sizes=4, max_size=30, max_quantity=300):
+    """
+    same (seed, index) always gives same case, so any case is reproduced by its index alone
+    :return: quantity, descending pack sizes
+    """
+    rng = random.Random(f"{seed}:{index}")
+    pack_sizes = sorted(rng.sample(range(1, max_size + 1), rng.randint(1, max_sizes)), reverse=True)
+    return rng.randrange(max_quantity + 1), pack_sizes
+
+
+def check_case(engine, quantity, pack_sizes):
+    """
+    solve one case by engine and compare it with the oracle on (remainder, packs amount)
+    :return: dict of engine, quantity, pack sizes, solve time in ms and error message, None if correct
+    """
+    start = time.perf_counter()
+    try:
+        packs, remainder = FUZZ_ENGINES[engine](quantity, list(pack_sizes))
+        error = None
+    except Exception as e:
+        packs, remainder, error = {}, quantity, f"{type(e).__name__}: {e}"
+    elapsed = (time.perf_counter() - start) * 1000
+
+    if error is None:
+        if any(size not in pack_sizes or amount < 0 for size, amount in packs.items()):
+            error = f"invalid breakdown {packs}"
+        elif quantity - sum(size * amount for size, amount in packs.items()) != remainder:
+            error = f"remainder {remainder} does not match breakdown {packs}"
+        else:
+            expected = oracle_objective(quantity, pack_sizes)
+            objective = (remainder, sum(packs.values()))
+            if objective != expected:
+                error = f"(remainder, packs) {objective} but oracle {expected}"
+    return {"engine": engine, "quantity": quantity, "pack_sizes": list(pack_sizes), "ms": elapsed, "error": error}
+
+
+def check_chunk(args):
+    """
+    work item of a worker process, stops at the deadline
+    :param args: engines, seed, case indexes, case options and deadline as `time.time()`
+    :return: list of records of `check_case` with case index
+    """
+    engines, seed, indexes, case_options, deadline = args
+    records = []
+    for index in indexes:
+        if time.time() >= deadline:
+            break
+        quantity, pack_sizes = generate_case(seed, index, **case_options)
+        for engine in engines:
+            record = check_case(engine, quantity, pack_sizes)
+            record["index"] = index
+            records.append(record)
+    return records
+
+
+def is_failing(record):
+    return record["error"] is not None
+
+
+def is_slow(record, slow_ms):
+    return record["error"] is None and record["ms"] > slow_ms
+
+
+def shrink_candidates(quantity, pack_sizes):
+    """
+    smaller cases of a case, most reducing first
+    """
+    for index in range(len(pack_sizes)):
+        if len(pack_sizes) > 1:
+            yield quantity, pack_sizes[:index] + pack_sizes[index + 1 :]
+    for smaller in (0, quantity // 2, quantity - 1):
+        if 0 <= smaller < quantity:
+            yield smaller, pack_sizes
+    for index, size in enumerate(pack_sizes):
+        for smaller in (1, size // 2, size - 1):
+            if 0 < smaller < size and smaller not in pack_sizes:
+                yield quantity, sorted(pack_sizes[:index] + [smaller] + pack_sizes[index + 1 :], reverse=True)
+
+
+def shrink_case(engine, quantity, pack_sizes, is_bad, deadline=None):
+    """
+    greedy shrink, take the first smaller case still bad until none is
+    :param is_bad: callable of a `check_case` record, True if the case still fails or is slow
+    :param deadline: `time.time()` to stop at with the smallest case so far
+    :return: record of the smallest bad case
+    """
+    record = check_case(engine, quantity, pack_sizes)
+    shrunk = True
+    while shrunk and (deadline is None or time.time() < deadline):
+        shrunk = False
+        for candidate in shrink_candidates(record["quantity"], record["pack_sizes"]):
+            candidate_record = check_case(engine, *candidate)
+            if is_bad(candidate_record):
+                record = candidate_record
+                shrunk = True
+                break
+    return record
+
+
+def run_fuzz(
+    seed=0,
+    cases=1000,
+    time_budget=None,
+    engines=DEFAULT_ENGINES,
+    workers=0,
+    chunk_size=50,
+    slow_ms=50.0,
+    case_options=None,
+):
+    """
+    differential test of engines against the oracle on seeded random cases
+    :param cases: max cases, each is solved by every engine
+    :param time_budget: seconds, cases not started by then are skipped, shrinking also stops at it. no limit if None
+    :param workers: worker processes, 0 to run in this process
+    :param slow_ms: a solve slower than this is reported and shrunk as slow
+    :param case_options: dict of `max_sizes`, `max_size` and `max_quantity` of `generate_case`
+    :return: dict of run meta, timing stats per engine, failures and slow cases with shrunk reproducers
+    """
+    start = time.time()
+    deadline = start + time_budget if time_budget is not None else float("inf")
+    case_options = case_options or {}
+    chunks = [
+        (tuple(engines), seed, range(begin, min(begin + chunk_size, cases)), case_options, deadline)
+        for begin in range(0, cases, chunk_size)
+    ]
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            records = [record for chunk in executor.map(check_chunk, chunks) for record in chunk]
+    else:
+        records = [record for chunk in chunks for record in check_chunk(chunk)]
+
+    timings = {}
+    for record in records:
+        timings.setdefault(record["engine"], []).append(record["ms"])
+    stats = {
+        engine: {
+            "cases": len(values),
+            "p50_ms": percentile(values, 50),
+            "p99_ms": percentile(values, 99),
+            "max_ms": max(values),
+        }
+        for engine, values in timings.items()
+    }
+
+    # shrink each failing or slow engine once, by its first bad case
+    failures = {}
+    slow = {}
+    for record in records:
+        engine = record["engine"]
+        if is_failing(record) and engine not in failures:
+            failures[engine] = dict(
+                record, shrunk=shrink_case(engine, record["quantity"], record["pack_sizes"], is_failing, deadline)
+            )
+        elif is_slow(record, slow_ms) and engine not in slow:
+            slow[engine] = dict(
+                record,
+                shrunk=shrink_case(
+                    engine, record["quantity"], record["pack_sizes"], lambda r: is_slow(r, slow_ms), deadline
+                ),
+            )
+
+    return {
+        "meta": {
+            "seed": seed,
+            "cases": len(set(record["index"] for record in records)),
+            "engines": list(engines),
+            "elapsed": time.time() - start,
+            "slow_ms": slow_ms,
+        },
+        "stats": stats,
+        "failures": failures,
+        "slow": slow,
+        "records": records,
+    }
+
+
+def describe_case(record):
+    outcome = record["error"] or f"{record['ms']:.1f}ms"
+    return f"quantity {record['quantity']}, pack sizes {record['pack_sizes']}, {outcome}"
+
+
+def print_fuzz_report(report):
+    meta = report["meta"]
+    print(f"seed {meta['seed']}, {meta['cases']} cases in {meta['elapsed']:.3f}s")
+    print("%-16s %8s %12s %12s %12s" % ("Engine", "Cases", "P50(ms)", "P99(ms)", "Max(ms)"))
+    print("-" * 64)
+    for engine, stat in report["stats"].items():
+        print(
+            "%-16s %8d %12.3f %12.3f %12.3f" % (engine, stat["cases"], stat["p50_ms"], stat["p99_ms"], stat["max_ms"])
+        )
+    for title, cases in (("FAIL", report["failures"]), ("SLOW", report["slow"])):
+        for engine, record in cases.items():
+            print(f"{title} {engine} case {record['index']}: {describe_case(record)}")
+            print(f"  shrunk: {describe_case(record['shrunk'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Differential fuzzing of pack breakdown engines against an exhaustive oracle"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="seed of random cases")
+    parser.add_argument("--cases", type=int, default=1000, help="max cases")
+    parser.add_argument("--time-budget", type=float, help="stop after this many seconds")
+    parser.add_argument(
+        "--engine",
+        choices=tuple(FUZZ_ENGINES),
+        action="append",
+        help="only test these engines, all but recursive by default",
+    )
+    parser.add_argument("--workers", type=int, default=0, help="worker processes, 0 to run in this process")
+    parser.add_argument("--slow-ms", type=float, default=50.0, help="report solves slower than this")
+    parser.add_argument("--max-quantity", type=int, default=300, help="max random quantity")
+    parser.add_argument("--output", help="write report as JSON to this file")
+    args = parser.parse_args()
+
+    report = run_fuzz(
+        seed=args.seed,
+        cases=args.cases,
+        time_budget=args.time_budget,
+        engines=args.engine or DEFAULT_ENGINES,
+        workers=args.workers,
+        slow_ms=args.slow_ms,
+        case_options={"max_quantity": args.max_quantity},
+    )
+    print_fuzz_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if report["failures"]:
+        sys.exit(1)
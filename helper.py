@@ -1,18 +1,1180 @@
 import logging
+import math
+import os
+import threading
+import time
+from array import array
+from collections import deque
+from fractions import Fraction
+from heapq import heappop, heappush
+
+from config import PACK_ENGINE, TABLE_CACHE_DIR, TABLE_SIZE_LIMIT, USE_NUMPY
+from table_file import read_table_file, table_file_path, write_table_file
+
+try:
+    import numpy
+except ImportError:
+    # numpy is optional, table builder falls back to pure python
+    numpy = None
 
 logger = logging.getLogger(__name__)
 
+ENGINE_RECURSIVE = "recursive"
+ENGINE_DP = "dp"
+ENGINES = (ENGINE_RECURSIVE, ENGINE_DP)
+
+# all pricing modes minimise remainder first
+PRICING_PACKS = "packs"  # then packs amount, price not compared
+PRICING_PACKS_PRICE = "packs_price"  # then packs amount, then total price on ties
+PRICING_PRICE = "price"  # then total price, then packs amount
+PRICINGS = (PRICING_PACKS, PRICING_PACKS_PRICE, PRICING_PRICE)
+
+
+def normalize_pack_sizes(pack_sizes):
+    """
+    unique positive pack sizes as a tuple with descending sort
+    """
+    return tuple(sorted(set(size for size in pack_sizes if size > 0), reverse=True))
+
+
+def get_table_key(pack_sizes, prices=None, pricing=PRICING_PACKS):
+    """
+    normalized hashable key of a pack table, prices are only part of it when pricing compares them
+    :param pack_sizes: pack size list
+    :param prices: int price in cents of each pack size, same order as pack_sizes
+    :param pricing: pricing mode
+    :return: (pack sizes tuple with descending sort, cents tuple of them or None, pricing)
+    """
+    if pricing not in PRICINGS:
+        raise KeyError(f"{pricing} is not a pricing mode")
+    if pricing == PRICING_PACKS:
+        return normalize_pack_sizes(pack_sizes), None, pricing
+    if prices is None:
+        raise Exception(f"prices are required by pricing mode {pricing}")
+
+    cents = dict((size, int(price)) for size, price in zip(pack_sizes, prices) if size > 0)
+    sizes = tuple(sorted(cents, reverse=True))
+    return sizes, tuple(cents[size] for size in sizes), pricing
+
+
+def build_pack_table(pack_sizes, limit, prices=None, pricing=PRICING_PACKS):
+    """
+    iterative dynamic programming over quantity, no recursion.
+    vectorised by numpy if it is importable, otherwise pure python, both have same output
+    :param pack_sizes: pack sizes with descending sort
+    :param limit: max quantity of the table
+    :param prices: int price in cents of each pack size, only used by pricing modes comparing price
+    :param pricing: pricing mode
+    :return: three arrays indexed by quantity, `packs` is the min pack amount to fill it exactly
+             (-1 if not reachable), `choice` is the largest pack size used by a best fill,
+             `filled` is the largest reachable quantity no more than it (so min remainder is quantity - filled)
+    """
+    if numpy is not None and USE_NUMPY:
+        if pricing == PRICING_PACKS:
+            return _build_pack_table_numpy(pack_sizes, limit)
+        columns = _build_priced_table_numpy(pack_sizes, prices, limit, pricing == PRICING_PRICE)
+        if columns is not None:
+            return columns
+    if pricing != PRICING_PACKS:
+        return _build_priced_table_python(pack_sizes, prices, limit, pricing == PRICING_PRICE)
+    return _build_pack_table_python(pack_sizes, limit)
+
+
+def _build_pack_table_python(pack_sizes, limit):
+    packs = array("q", [-1]) * (limit + 1)
+    choice = array("q", [0]) * (limit + 1)
+    filled = array("q", [0]) * (limit + 1)
+    packs[0] = 0
+
+    for quantity in range(1, limit + 1):
+        best_packs, best_size = -1, 0
+        # descending sizes and strict less-than keep the largest size on ties
+        for size in pack_sizes:
+            if size > quantity:
+                continue
+            previous = packs[quantity - size]
+            if previous >= 0 and (best_packs < 0 or previous + 1 < best_packs):
+                best_packs, best_size = previous + 1, size
+        packs[quantity] = best_packs
+        choice[quantity] = best_size
+        filled[quantity] = quantity if best_packs >= 0 else filled[quantity - 1]
+    return packs, choice, filled
+
+
+def _build_priced_table_python(pack_sizes, prices, limit, price_first):
+    """
+    same as `_build_pack_table_python` but total price in integer cents is also compared,
+    no Decimal in the loop. `price_first` to compare price before packs amount
+    """
+    packs = array("q", [-1]) * (limit + 1)
+    cost = array("q", [0]) * (limit + 1)
+    choice = array("q", [0]) * (limit + 1)
+    filled = array("q", [0]) * (limit + 1)
+    packs[0] = 0
+    pack_prices = list(zip(pack_sizes, prices))
+
+    for quantity in range(1, limit + 1):
+        best_key, best_size = None, 0
+        for size, price in pack_prices:
+            if size > quantity or packs[quantity - size] < 0:
+                continue
+            candidate_packs = packs[quantity - size] + 1
+            candidate_cost = cost[quantity - size] + price
+            if price_first:
+                key = (candidate_cost, candidate_packs)
+            else:
+                key = (candidate_packs, candidate_cost)
+            # descending sizes and strict less-than keep the largest size on ties
+            if best_key is None or key < best_key:
+                best_key, best_size = key, size
+        if best_key is not None:
+            packs[quantity] = best_key[1] if price_first else best_key[0]
+            cost[quantity] = best_key[0] if price_first else best_key[1]
+        choice[quantity] = best_size
+        filled[quantity] = quantity if best_key is not None else filled[quantity - 1]
+    return packs, choice, filled
+
+
+def _build_pack_table_numpy(pack_sizes, limit):
+    infinity = numpy.iinfo(numpy.int64).max // 2  # no overflow after adding pack amount
+    packs = numpy.full(limit + 1, infinity, dtype=numpy.int64)
+    packs[0] = 0
+    for size in pack_sizes:
+        packs = _relax_packs_numpy(packs, size, infinity)
+    return _pack_columns_numpy(pack_sizes, packs, infinity, (1,) * len(pack_sizes), packs)
+
+
+def _build_priced_table_numpy(pack_sizes, prices, limit, price_first):
+    """
+    same as `_build_priced_table_python`, packs amount and cents of a fill are compared as one additive int64 key:
+    the first compared one times a base over the most the other can be, plus the other
+    :return: same columns, None if keys could overflow int64
+    """
+    most_packs = limit // pack_sizes[-1] if pack_sizes else 0
+    most_cost = most_packs * max(prices, default=0)
+    if (most_packs + 1) * (most_cost + 1) >= 2 ** 62:
+        return None
+    if price_first:
+        base = most_packs + 1
+        weights = [price * base + 1 for price in prices]
+    else:
+        base = most_cost + 1
+        weights = [base + price for price in prices]
+
+    infinity = numpy.iinfo(numpy.int64).max // 2
+    keys = numpy.full(limit + 1, infinity, dtype=numpy.int64)
+    keys[0] = 0
+    for size, weight in zip(pack_sizes, weights):
+        keys = _relax_packs_numpy(keys, size, infinity, weight)
+    packs = keys % base if price_first else keys // base
+    return _pack_columns_numpy(pack_sizes, keys, infinity, weights, packs)
+
+
+def _relax_packs_numpy(keys, size, infinity, weight=1):
+    """
+    :param keys: min key (pack amount if weight is 1) of each quantity, infinity if not reachable
+    :param weight: key added by one pack of size
+    :return: keys relaxed by any amount of size
+    """
+    limit = len(keys) - 1
+    if size > limit:
+        return keys
+    # one update per size, residue classes of size as columns:
+    # keys[r + j * size] = min(keys[r + i * size] + (j - i) * weight) for all i <= j
+    rows = -(-(limit + 1) // size)
+    grid = numpy.full(rows * size, infinity, dtype=numpy.int64)
+    grid[: limit + 1] = keys
+    steps = numpy.arange(rows, dtype=numpy.int64)[:, None] * weight
+    grid = numpy.minimum.accumulate(grid.reshape(rows, size) - steps, axis=0) + steps
+    return numpy.minimum(grid.reshape(-1)[: limit + 1], infinity)
+
+
+def _pack_columns_numpy(pack_sizes, keys, infinity, weights, packs):
+    """
+    :param keys: min key of each quantity by all pack sizes, infinity if not reachable
+    :param weights: key added by one pack of each size
+    :param packs: pack amount of each key
+    :return: (packs, choice, filled) columns, same as `_build_pack_table_python`
+    """
+    limit = len(keys) - 1
+    reachable = keys < infinity
+    choice = numpy.zeros(limit + 1, dtype=numpy.int64)
+    for size, weight in zip(pack_sizes, weights):
+        if size > limit:
+            continue
+        # descending sizes, first matched size is the largest one
+        matched = numpy.zeros(limit + 1, dtype=bool)
+        matched[size:] = reachable[size:] & (keys[:-size] + weight == keys[size:])
+        choice[matched & (choice == 0)] = size
+
+    quantities = numpy.arange(limit + 1, dtype=numpy.int64)
+    filled = numpy.maximum.accumulate(numpy.where(reachable, quantities, 0))
+    packs = numpy.where(reachable, packs, -1)
+
+    # same array type as pure python builder, so values are plain int
+    return tuple(array("q", column.astype(numpy.int64).tobytes()) for column in (packs, choice, filled))
+
+
+def table_breakdown(choice, filled, quantity):
+    """
+    read best breakdown of quantity from a table built by `build_pack_table`
+    :return: dict of pack size and amount in descending size order, remainder
+    """
+    breakdown = {}
+    rest = filled[quantity]
+    while rest:
+        size = choice[rest]
+        breakdown[size] = breakdown.get(size, 0) + 1
+        rest -= size
+    return breakdown, quantity - filled[quantity]
+
+
+def get_table_period(pack_sizes, prices, pricing):
+    """
+    :param pack_sizes, prices, pricing: a normalized table key, see `get_table_key`
+    :return: period size, threshold quantity past which breakdowns repeat by period, max quantity to table
+    """
+    period = pack_sizes[0] if pack_sizes else 0
+    if pricing == PRICING_PRICE and pack_sizes:
+        # lowest unit price, largest size on ties
+        unit_prices = dict(zip(pack_sizes, prices))
+        period = min(pack_sizes, key=lambda size: (Fraction(unit_prices[size], size), -size))
+    others = [size for size in pack_sizes if size != period]
+
+    threshold = (period - 1) * max(others, default=0) + 1
+    return period, threshold, threshold + period
+
+
+class PackTable:
+    """
+    precomputed best breakdowns for a pack size set, answer any quantity in O(1)
+
+    with period size P (the largest size, or the lowest unit price size when price is compared first)
+    and S the largest of other sizes, any best fill over (P - 1) * S contains at least one P
+    (P or more other packs always have a subset summing to a multiple of P, which fewer P packs can replace
+    at no higher price). so best breakdown of quantity Q equals best breakdown of Q - P plus one P past that threshold,
+    only the prefix up to threshold plus one period of P need to be tabled.
+    """
+
+    def __init__(self, pack_sizes, prices=None, pricing=PRICING_PACKS, columns=None):
+        """
+        :param pack_sizes: pack size list
+        :param prices: int price in cents of each pack size, same order as pack_sizes
+        :param pricing: pricing mode
+        :param columns: prebuilt (packs, choice, filled) columns, e.g. mapped from a table file
+        """
+        self.pack_sizes, self.prices, self.pricing = get_table_key(pack_sizes, prices, pricing)
+
+        self.period, self.threshold, self.limit = get_table_period(*self.key)
+        if columns is None:
+            columns = build_pack_table(self.pack_sizes, self.limit, self.prices, self.pricing)
+        self.packs, self.choice, self.filled = columns
+
+    @property
+    def key(self):
+        return self.pack_sizes, self.prices, self.pricing
+
+    def breakdown(self, quantity):
+        """
+        :param quantity: any int quantity, no upper bound
+        :return: dict of pack size and amount in descending size order, remainder
+        """
+        if quantity <= 0 or not self.pack_sizes:
+            return {}, quantity
+
+        periods = 0
+        if quantity > self.limit:
+            # fold back into the last tabled period
+            periods = (quantity - self.limit - 1) // self.period + 1
+        filled = self.filled[quantity - periods * self.period]
+
+        breakdown = {self.period: periods} if periods else {}
+        rest = filled
+        while rest:
+            size = self.choice[rest]
+            breakdown[size] = breakdown.get(size, 0) + 1
+            rest -= size
+
+        if periods and self.period != self.pack_sizes[0]:
+            # keep descending size order
+            breakdown = dict((size, breakdown[size]) for size in self.pack_sizes if size in breakdown)
+        return breakdown, quantity - filled - periods * self.period
+
+    def iter_breakdowns(self, start, stop):
+        """
+        breakdowns of quantities from start to stop - 1 in one sweep, same as `breakdown` of each.
+        a best fill is the best fill without its chosen pack plus that pack, so each one is built from a recent one
+        kept in a window instead of walking the table. memory is bounded by the pack sizes, not by the range
+        :return: generator of (quantity, dict of pack size and amount in descending size order, remainder)
+        """
+        sizes = self.pack_sizes
+        for quantity in range(start, min(stop, 1) if sizes else stop):
+            yield quantity, {}, quantity
+        if not sizes:
+            return
+        start = max(start, 1)
+        index = dict((size, i) for i, size in enumerate(sizes))
+
+        # fill -> pack amount of each size, of fills within largest size plus one period below the latest one,
+        # enough to cover the previous fill of any fill and all fills of the last tabled period
+        window = {0: (0,) * len(sizes)}
+        fills = deque([0])
+        span = sizes[0] + self.period
+
+        def fill_amounts(fill):
+            if fill in window:
+                return window[fill]
+            size = self.choice[fill]
+            previous = window.get(fill - size)
+            if previous is None:
+                # below the window, only near start of the range
+                breakdown = self.breakdown(fill)[0]
+                return tuple(breakdown.get(size, 0) for size in sizes)
+            amounts = list(previous)
+            amounts[index[size]] += 1
+            return tuple(amounts)
+
+        def to_dict(amounts):
+            return dict((size, amount) for size, amount in zip(sizes, amounts) if amount)
+
+        for quantity in range(start, min(stop, self.limit + 1)):
+            fill = self.filled[quantity]
+            if fill != fills[-1]:
+                window[fill] = fill_amounts(fill)
+                fills.append(fill)
+                while fills[0] < fill - span:
+                    del window[fills.popleft()]
+            yield quantity, to_dict(window[fill]), quantity - fill
+
+        quantity = max(start, self.limit + 1)
+        if quantity >= stop:
+            return
+        # past the table, fold into the last tabled period and move along it, no division per quantity
+        periods = (quantity - self.limit - 1) // self.period + 1
+        folded = quantity - periods * self.period
+        period_index = index[self.period]
+        tail = {}  # folded quantity -> pack amounts of its fill, one period at most
+        for quantity in range(quantity, stop):
+            if folded not in tail:
+                tail[folded] = fill_amounts(self.filled[folded])
+            amounts = list(tail[folded])
+            amounts[period_index] += periods
+            yield quantity, to_dict(amounts), folded - self.filled[folded]
+            folded += 1
+            if folded > self.limit:
+                folded -= self.period
+                periods += 1
+
+    def best_fill(self, quantity):
+        """
+        :param quantity: any int quantity, no upper bound
+        :return: largest quantity no more than it can be filled, packs amount of its best fill. O(1), no breakdown built
+        """
+        if quantity <= 0 or not self.pack_sizes:
+            return 0, 0
+
+        periods = 0
+        if quantity > self.limit:
+            periods = (quantity - self.limit - 1) // self.period + 1
+        filled = self.filled[quantity - periods * self.period]
+        return filled + periods * self.period, self.packs[filled] + periods
+
+    def exact_packs(self, quantity):
+        """
+        :param quantity: any int quantity, no upper bound
+        :return: packs amount of the best fill of exactly quantity, -1 if it can not be filled exactly
+        """
+        if quantity <= 0 or not self.pack_sizes:
+            return 0 if quantity == 0 else -1
+
+        periods = 0
+        if quantity > self.limit:
+            periods = (quantity - self.limit - 1) // self.period + 1
+        packs = self.packs[quantity - periods * self.period]
+        return packs + periods if packs >= 0 else -1
+
+    def exact_breakdown(self, quantity):
+        """
+        :return: dict of pack size and amount of the best fill of exactly quantity, None if it can not be filled exactly
+        """
+        if self.exact_packs(quantity) < 0:
+            return None
+        return self.breakdown(quantity)[0]
+
+
+class ResidueTable:
+    """
+    best breakdowns of a pack size set whose PackTable is over TABLE_SIZE_LIMIT entries, one entry per residue
+    of the period size P instead of one per quantity, so memory is O(P * number of sizes).
+
+    a fill f is some other packs (its tail) plus P packs for the rest. per pack of other size x against P packs
+    of same quantity, P - x is P times the packs amount added, P * c(x) - x * c(P) is P times the cents added and
+    x is P times one P pack less, so weighing a tail by these sums (in the order the pricing mode compares them)
+    ranks its fills for any f. the lightest tail of each residue r mod P is found by Dijkstra over residues,
+    each other size an edge r -> r + x, all weights are positive as P is the largest (or lowest unit price) size.
+    f is best filled by that tail plus P packs if f is no less than its sum, a smaller f is split on its amount of P
+    over the table of the other sizes. remainder is read from the least fill of each residue
+    """
+
+    def __init__(self, pack_sizes, prices=None, pricing=PRICING_PACKS):
+        self.pack_sizes, self.prices, self.pricing = get_table_key(pack_sizes, prices, pricing)
+        self.period, self.threshold, self.limit = get_table_period(*self.key)
+        sizes, period = self.pack_sizes, self.period
+        self.cents = dict(zip(sizes, self.prices or (0,) * len(sizes)))
+        self.gcd = 0
+        for size in sizes:
+            self.gcd = math.gcd(self.gcd, size)
+        self.others = tuple(size for size in sizes if size != period)
+        self._others_table = None
+
+        # least fill of each residue, -1 if not reachable
+        least = _residue_paths(period, [(size, size) for size in self.others], 0)[0]
+        self.reach = array("q", (-1 if fill is None else fill for fill in least))
+
+        # lightest tail of each residue, as pack amount of each size and its sum
+        edges = []
+        for size in self.others:
+            packs, cents = period - size, period * self.cents[size] - size * self.cents[period]
+            if self.pricing == PRICING_PRICE:
+                costs = (cents, packs)
+            elif self.pricing == PRICING_PACKS_PRICE:
+                costs = (packs, cents)
+            else:
+                costs = (packs,)
+            # ties: fewer P packs then more of each larger size
+            edges.append((size, costs + tuple(size if s == period else -(s == size) for s in sizes)))
+        weights, last, order = _residue_paths(period, edges, (0,) * len(edges[0][1]) if edges else ())
+        width = len(sizes)
+        index = dict((size, i) for i, size in enumerate(sizes))
+        self.tails = array("q", [0]) * (period * width)
+        self.tail_sums = array("q", [0]) * period
+        for residue in order[1:]:
+            size = last[residue]
+            previous = (residue - size) % period
+            self.tails[residue * width : (residue + 1) * width] = self.tails[previous * width : (previous + 1) * width]
+            self.tails[residue * width + index[size]] += 1
+            self.tail_sums[residue] = self.tail_sums[previous] + size
+
+    @property
+    def key(self):
+        return self.pack_sizes, self.prices, self.pricing
+
+    def breakdown(self, quantity):
+        """
+        :param quantity: any int quantity, no upper bound
+        :return: dict of pack size and amount in descending size order, remainder
+        """
+        if quantity <= 0 or not self.pack_sizes:
+            return {}, quantity
+        fill = quantity - self.min_remainder(quantity)
+        return self.exact_breakdown(fill), quantity - fill
+
+    def min_remainder(self, quantity):
+        """
+        :param quantity: int quantity over 0
+        :return: quantity minus the largest sum of packs not over it
+        """
+        # exact fills are never more than the smallest size apart
+        fill = quantity - quantity % self.gcd
+        while fill < self.reach[fill % self.period]:
+            fill -= self.gcd
+        return quantity - fill
+
+    def iter_breakdowns(self, start, stop):
+        """
+        breakdowns of quantities from start to stop - 1, same as `breakdown` of each
+        :return: generator of (quantity, dict of pack size and amount in descending size order, remainder)
+        """
+        for quantity in range(start, stop):
+            yield (quantity,) + self.breakdown(quantity)
+
+    def best_fill(self, quantity):
+        """
+        :return: largest quantity no more than it can be filled, packs amount of its best fill
+        """
+        breakdown, remainder = self.breakdown(quantity)
+        return max(quantity, 0) - max(remainder, 0), sum(breakdown.values())
+
+    def exact_packs(self, quantity):
+        """
+        :return: packs amount of the best fill of exactly quantity, -1 if it can not be filled exactly
+        """
+        breakdown = self.exact_breakdown(quantity)
+        return -1 if breakdown is None else sum(breakdown.values())
+
+    def exact_breakdown(self, quantity):
+        """
+        :return: dict of pack size and amount of the best fill of exactly quantity, None if it can not be filled exactly
+        """
+        if quantity <= 0 or not self.pack_sizes:
+            return {} if quantity == 0 else None
+        residue = quantity % self.period
+        if quantity % self.gcd or quantity < self.reach[residue]:
+            return None
+        if quantity < self.tail_sums[residue]:
+            return self._split_breakdown(quantity)
+
+        width = len(self.pack_sizes)
+        amounts = self.tails[residue * width : (residue + 1) * width]
+        amounts[self.pack_sizes.index(self.period)] += (quantity - self.tail_sums[residue]) // self.period
+        return dict((size, amount) for size, amount in zip(self.pack_sizes, amounts) if amount)
+
+    def _split_breakdown(self, quantity):
+        """
+        best of each amount m of P plus the best exact fill of the rest by other sizes, from the most P down.
+        the first cost compared is at least m * cost(P) plus the rest at the lowest per quantity cost of other sizes,
+        which never falls as m falls, so the loop stops once it is over the best one
+        """
+        if self._others_table is None:
+            self._others_table = get_pack_solver(self.others, [self.cents[size] for size in self.others], self.pricing)
+        period, cents = self.period, self.cents
+        if self.pricing == PRICING_PRICE:
+            first_cost, ratio = cents[period], min(Fraction(cents[size], size) for size in self.others)
+        else:
+            first_cost, ratio = 1, Fraction(1, self.others[0])
+
+        best, best_rank = None, None
+        for amount in range(quantity // period, -1, -1):
+            rest = quantity - amount * period
+            if best_rank is not None and amount * first_cost + math.ceil(rest * ratio) > best_rank[0]:
+                break
+            breakdown = self._others_table.exact_breakdown(rest)
+            if breakdown is None:
+                continue
+            breakdown = dict(breakdown)
+            breakdown[period] = amount
+            rank = self._rank(breakdown)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = breakdown, rank
+        return dict((size, best[size]) for size in self.pack_sizes if best.get(size))
+
+    def _rank(self, breakdown):
+        packs = sum(breakdown.values())
+        cents = sum(self.cents[size] * amount for size, amount in breakdown.items())
+        ties = tuple(-breakdown.get(size, 0) for size in self.pack_sizes)
+        if self.pricing == PRICING_PRICE:
+            return (cents, packs) + ties
+        if self.pricing == PRICING_PACKS_PRICE:
+            return (packs, cents) + ties
+        return (packs,) + ties
+
+
+def _residue_paths(period, edges, zero):
+    """
+    Dijkstra from residue 0 over residues mod period
+    :param edges: list of (size, weight), size is an edge from each residue r to r + size, weight is an int or tuple
+    :param zero: weight of the empty path
+    :return: lightest weight of each residue (None if not reachable), last size of its path, residues in settled order
+    """
+    weights = [None] * period
+    last = [0] * period
+    settled = bytearray(period)
+    order = []
+    weights[0] = zero
+    heap = [(zero, 0)]
+    tuples = isinstance(zero, tuple)
+    while heap:
+        weight, residue = heappop(heap)
+        if settled[residue]:
+            continue
+        settled[residue] = 1
+        order.append(residue)
+        for size, step in edges:
+            target = (residue + size) % period
+            if settled[target]:
+                continue
+            candidate = tuple(map(int.__add__, weight, step)) if tuples else weight + step
+            if weights[target] is None or candidate < weights[target]:
+                weights[target] = candidate
+                last[target] = size
+                heappush(heap, (candidate, target))
+    return weights, last, order
+
+
+# pack tables are shared by all products with same table key
+_pack_tables = {}
+
+# table key -> lock held while its table is built, so threads racing on first use build it once
+_build_locks = {}
+
+
+def _build_once(tables, key, build):
+    """
+    :param tables: registry of built tables
+    :param build: callable building the table of key
+    :return: the table registered for key, built by this thread if none yet
+    """
+    # setdefault is atomic, all threads get the same lock
+    with _build_locks.setdefault(key, threading.RLock()):
+        table = tables.get(key)
+        if table is None:
+            table = tables.setdefault(key, build())
+    return table
+
+
+def get_pack_table(pack_sizes, prices=None, pricing=PRICING_PACKS):
+    """
+    get the precomputed PackTable of a pack size set (and prices if pricing compares them), build it on first use
+    """
+    key = get_table_key(pack_sizes, prices, pricing)
+    table = _pack_tables.get(key)
+    if table is None:
+        if TABLE_CACHE_DIR:
+            table = _build_once(_pack_tables, key, lambda: load_pack_table(key, TABLE_CACHE_DIR))
+        else:
+            table = _build_once(_pack_tables, key, lambda: PackTable(*key))
+    return table
+
+
+# residue tables of pack size sets too large for a PackTable
+_residue_tables = {}
+
+
+def get_pack_solver(pack_sizes, prices=None, pricing=PRICING_PACKS):
+    """
+    get the PackTable of a pack size set, or its ResidueTable if the PackTable would be over TABLE_SIZE_LIMIT entries.
+    a PackTable already built or shared is used whatever its size
+    """
+    key = get_table_key(pack_sizes, prices, pricing)
+    table = _pack_tables.get(key)
+    if table is not None or get_table_period(*key)[2] <= TABLE_SIZE_LIMIT:
+        return table or get_pack_table(*key)
+    return get_residue_table(*key)
+
+
+def get_residue_table(pack_sizes, prices=None, pricing=PRICING_PACKS):
+    """
+    get the ResidueTable of a pack size set, build it on first use
+    """
+    key = get_table_key(pack_sizes, prices, pricing)
+    table = _residue_tables.get(key)
+    if table is None:
+        table = _build_once(_residue_tables, key, lambda: ResidueTable(*key))
+    return table
+
+
+# table key -> table entries solved by `key_breakdown` without its table so far
+_bounded_entries = {}
+
+
+def key_breakdown(table_key, quantity):
+    """
+    best breakdown of quantity by a normalized table key, same as its PackTable.
+    a quantity below the table limit is solved by a table up to the quantity only, until such solves add up to
+    the cost of the whole table (or of its ResidueTable), so a few small orders never build a large table
+    :return: dict of pack size and amount in descending size order, remainder
+    """
+    if quantity <= 0:
+        return {}, quantity
+    table = _pack_tables.get(table_key) or _residue_tables.get(table_key)
+    if table is None and quantity <= TABLE_SIZE_LIMIT:
+        period, threshold, limit = get_table_period(*table_key)
+        budget = limit if limit <= TABLE_SIZE_LIMIT else period * len(table_key[0])
+        spent = _bounded_entries.get(table_key, 0)
+        if quantity < limit and spent < budget:
+            _bounded_entries[table_key] = spent + quantity
+            packs, choice, filled = build_pack_table(table_key[0], quantity, table_key[1], table_key[2])
+            return table_breakdown(choice, filled, quantity)
+    return (table or get_pack_solver(*table_key)).breakdown(quantity)
+
+
+def register_pack_table(table):
+    """
+    share a PackTable built or mapped elsewhere, e.g. from shared memory. a table already registered is kept
+    :return: the registered PackTable of its key
+    """
+    return _pack_tables.setdefault(table.key, table)
+
+
+def unregister_pack_table(table):
+    """
+    stop sharing a PackTable, if it is the registered one of its key
+    """
+    if _pack_tables.get(table.key) is table:
+        del _pack_tables[table.key]
+
+
+def get_extended_pack_table(table, size):
+    """
+    get PackTable of table's pack sizes plus one more size, incrementally extended from table if not built yet.
+    same as `get_pack_solver` if table is a ResidueTable or the new PackTable would be over TABLE_SIZE_LIMIT entries
+    """
+    key = get_table_key(table.pack_sizes + (size,))
+    if not isinstance(table, PackTable) or get_table_period(*key)[2] > TABLE_SIZE_LIMIT:
+        return get_pack_solver(*key)
+    extended = _pack_tables.get(key)
+    if extended is None:
+        extended = _pack_tables.setdefault(key, extend_pack_table(table, size))
+    return extended
+
+
+def extend_pack_table(table, size):
+    """
+    incremental update instead of rebuilding, existing pack amounts are bulk copied and only relaxed by the new
+    pack size, vectorised by numpy. rebuilt from scratch without numpy, a per entry update is no faster than that.
+    same result as building the new pack sizes from scratch, only for `packs` pricing mode
+    :param table: PackTable in `packs` pricing mode
+    :param size: new pack size
+    :return: new PackTable
+    """
+    if table.pricing != PRICING_PACKS:
+        raise Exception(f"only {PRICING_PACKS} pricing mode table can be extended")
+    pack_sizes = normalize_pack_sizes(table.pack_sizes + (size,))
+    if pack_sizes == table.pack_sizes:
+        return table
+    if numpy is None or not USE_NUMPY or not table.pack_sizes:
+        return PackTable(pack_sizes)
+    limit = get_table_period(pack_sizes, None, PRICING_PACKS)[2]
+
+    # existing entries, folded by period past the old table
+    infinity = numpy.iinfo(numpy.int64).max // 2
+    old_packs = numpy.frombuffer(table.packs, dtype=numpy.int64)
+    quantities = numpy.arange(limit + 1, dtype=numpy.int64)
+    periods = numpy.maximum((quantities - table.limit - 1) // table.period + 1, 0)
+    packs = old_packs[quantities - periods * table.period]
+    packs = numpy.where(packs >= 0, packs + periods, infinity)
+
+    packs = _relax_packs_numpy(packs, size, infinity)
+    columns = _pack_columns_numpy(pack_sizes, packs, infinity, (1,) * len(pack_sizes), packs)
+    return PackTable(pack_sizes, columns=columns)
+
+
+def load_pack_table(key, directory=TABLE_CACHE_DIR):
+    """
+    load PackTable from its memory-mapped table file, lookups are zero-copy and pages are shared between processes.
+    missing, stale or corrupt file is rebuilt
+    :param key: table key, see `get_table_key`
+    :param directory: directory of table files
+    """
+    pack_sizes, prices, pricing = key
+    limit = get_table_period(*key)[2]
+    path = table_file_path(directory, key)
+    columns = read_table_file(path, key, limit)
+    if columns is None:
+        logger.info(f"build table file {path}")
+        built = build_pack_table(pack_sizes, limit, prices, pricing)
+        os.makedirs(directory, exist_ok=True)
+        write_table_file(path, key, built)
+        # serve from the mapped file, so pages are shared with other processes
+        columns = read_table_file(path, key, limit) or built
+    return PackTable(*key, columns=columns)
+
+
+# pack sets not canonical are checked quantity by quantity, only if the periodic range is no larger than this
+GREEDY_CHECK_LIMIT = 1 << 12
+
+# greedy thresholds are shared by all products with same pack sizes
+_greedy_thresholds = {}
+
+
+def is_canonical(pack_sizes):
+    """
+    Pearson's O(n^3) test of a coin system containing 1, if greedy breakdown uses the fewest packs for every quantity.
+    the smallest counterexample, if any, is greedy of c[i - 1] - 1 cut after c[j] with one more c[j]
+    :param pack_sizes: pack sizes with descending sort, the smallest is 1
+    """
+    for i in range(1, len(pack_sizes)):
+        amounts = [greedy_breakdown(pack_sizes[i - 1] - 1, pack_sizes)[0].get(size, 0) for size in pack_sizes]
+        for j in range(i, len(pack_sizes)):
+            candidate = amounts[:j] + [amounts[j] + 1]
+            quantity = sum(size * amount for size, amount in zip(pack_sizes, candidate))
+            if sum(greedy_breakdown(quantity, pack_sizes)[0].values()) > sum(candidate):
+                return False
+    return True
+
+
+def get_greedy_threshold(pack_sizes):
+    """
+    from which quantity greedy breakdown is the best one (least remainder then fewest packs), so same as PackTable.
+
+    if the smallest size s divides every size, both greedy and any best fill leave quantity mod s,
+    so it is the coin system of sizes / s (which contains 1) on quantity // s, canonical by Pearson's test
+    means greedy is best for all quantities. otherwise past the table limit both greedy and best breakdowns
+    repeat with the largest size as period, so greedy is best from the last failure within the table on,
+    unless it fails in the last period and fails forever
+    :param pack_sizes: pack size list
+    :return: min quantity greedy is proven best from, 0 for all quantities, None if never or not checked
+    """
+    sizes = normalize_pack_sizes(pack_sizes)
+    if sizes not in _greedy_thresholds:
+        smallest = sizes[-1] if sizes else 1
+        if all(size % smallest == 0 for size in sizes) and is_canonical([size // smallest for size in sizes]):
+            threshold = 0
+        else:
+            threshold = _check_greedy(sizes)
+        _greedy_thresholds[sizes] = threshold
+    return _greedy_thresholds[sizes]
+
+
+def _check_greedy(sizes):
+    """
+    compare greedy with best breakdown of each quantity within the periodic range, None if it is too large
+    """
+    period, threshold, limit = get_table_period(sizes, None, PRICING_PACKS)
+    if period != sizes[0] or limit > GREEDY_CHECK_LIMIT:
+        return None
+    packs, choice, filled = _build_pack_table_python(sizes, limit)
+    last_failure = 0
+    for quantity in range(1, limit + 1):
+        breakdown, rest = greedy_breakdown(quantity, sizes)
+        if (rest, sum(breakdown.values())) != (quantity - filled[quantity], packs[filled[quantity]]):
+            last_failure = quantity
+    if last_failure > limit - period:
+        return None
+    return last_failure + 1 if last_failure else 0
+
+
+def find_pack_table(pack_sizes, prices=None, pricing=PRICING_PACKS):
+    """
+    get the PackTable of a pack size set only if already built, never build it
+    """
+    return _pack_tables.get(get_table_key(pack_sizes, prices, pricing))
+
+
+class ReachSet:
+    """
+    quantities a pack size set fills exactly, as a bitset where bit Q is set if Q is a sum of packs.
+    with g the gcd of the sizes, a and b the smallest and largest size over g, every multiple of g
+    from g * (a - 1) * (b - 1) on is a sum of packs (Schur's bound), so only bits up to it are kept.
+    over TABLE_SIZE_LIMIT bits, the least fill of each residue of the ResidueTable is read instead
+    """
+
+    def __init__(self, pack_sizes):
+        self.pack_sizes = normalize_pack_sizes(pack_sizes)
+        sizes = self.pack_sizes
+        self.gcd = 0
+        for size in sizes:
+            self.gcd = math.gcd(self.gcd, size)
+        self.smallest = sizes[-1] if sizes else 0
+        self.limit = (sizes[-1] // self.gcd - 1) * (sizes[0] - self.gcd) if sizes else 0
+        self.residues = None
+        if self.limit > TABLE_SIZE_LIMIT:
+            self.residues = get_residue_table(sizes)
+            self.bits = None
+            return
+
+        # shift-or by size, 2 * size, 4 * size ... adds any amount of the size up to limit
+        mask = (1 << (self.limit + 1)) - 1
+        bits = 1
+        for size in sizes:
+            shift = size
+            while shift <= self.limit:
+                bits = (bits | bits << shift) & mask
+                shift *= 2
+        # bytes, a query reads a few of them instead of shifting the whole int
+        self.bits = bits.to_bytes(self.limit // 8 + 1, "little")
+
+    def can_fill(self, quantity):
+        """
+        :return: True if quantity is a sum of packs, no remainder
+        """
+        if quantity <= 0 or not self.pack_sizes:
+            return quantity == 0
+        if quantity > self.limit:
+            return quantity % self.gcd == 0
+        if self.residues is not None:
+            return quantity % self.gcd == 0 and quantity >= self.residues.reach[quantity % self.residues.period]
+        return bool(self.bits[quantity >> 3] >> (quantity & 7) & 1)
+
+    def min_remainder(self, quantity):
+        """
+        exact fills are never more than the smallest size apart, so only the bits of one smallest size
+        below quantity are read
+        :return: quantity minus the largest sum of packs not over it
+        """
+        if quantity <= 0 or not self.pack_sizes:
+            return quantity
+        if quantity > self.limit:
+            return quantity % self.gcd
+        if self.residues is not None:
+            return self.residues.min_remainder(quantity)
+        low = max(quantity - self.smallest + 1, 0)
+        window = int.from_bytes(self.bits[low >> 3 : (quantity >> 3) + 1], "little") >> (low & 7)
+        window &= (1 << (quantity - low + 1)) - 1
+        return quantity - low - window.bit_length() + 1
+
+
+_reach_sets = {}
+
+
+def get_reach_set(pack_sizes):
+    """
+    get the ReachSet of a pack size set, build it on first use
+    """
+    key = normalize_pack_sizes(pack_sizes)
+    reach_set = _reach_sets.get(key)
+    if reach_set is None:
+        reach_set = _reach_sets.setdefault(key, ReachSet(key))
+    return reach_set
+
+
+def greedy_breakdown(quantity, pack_sizes):
+    """
+    most greedy way, as many packs of larger size as possible. quick but not always best
+    :param pack_sizes: pack sizes with descending sort
+    :return: dict of pack size and amount (0 included) until filled, rest quantity
+    """
+    result = {}
+    rest = quantity
+    for size in pack_sizes:
+        result[size], rest = divmod(rest, size)
+        if rest == 0:
+            break
+    return result, rest
+
+
+def solve_breakdown(total_quantity, pack_sizes, engine=None):
+    """
+    stateless and reentrant, safe to call from many threads at once. search state lives in a PackBreaker
+    owned by this call, pack_sizes is not changed
+    :return: dict of pack size and amount, remainder
+    """
+    return PackBreaker(total_quantity, pack_sizes, engine).solve()
+
+
+def is_short(quantity, pack_sizes, stock):
+    """
+    :param stock: dict of pack size and packs available, size not in it is unlimited
+    :return: True if stock of any size is less than quantity needs at most
+    """
+    return bool(stock) and any(size in stock and stock[size] < quantity // size for size in pack_sizes)
+
+
+def bounded_breakdown(quantity, pack_sizes, stock, prices=None, pricing=PRICING_PACKS):
+    """
+    best breakdown with limited packs of some sizes, same objective as PackTable.
+
+    a size whose stock covers quantity // size is never short, it is solved with the shared unbounded table
+    of such sizes. a short size s never needs lcm(s, u) / s packs if the same quantity of an unlimited size u
+    is no worse, they would be swapped for less short stock, so its stock is capped below that.
+    each short size of stock c is then split into 0/1 items of 1, 2, 4 ... packs summing to c, so a 0/1 knapsack
+    over the capacity B of short stock takes O(B * log c) instead of trying every amount. then every exact fill x
+    of short packs is combined with the best unbounded fill of quantity - x. on ties less short stock is used
+    :param quantity: order quantity
+    :param pack_sizes: pack size list
+    :param stock: dict of pack size and packs available, size not in it is unlimited
+    :param prices: int price in cents of each pack size, same order as pack_sizes
+    :param pricing: pricing mode
+    :return: dict of pack size and amount in descending size order, remainder.
+             None if the capacity of short stock is over TABLE_SIZE_LIMIT
+    """
+    sizes, cents, pricing = get_table_key(pack_sizes, prices, pricing)
+    cents = dict(zip(sizes, cents or (0,) * len(sizes)))
+    if quantity <= 0 or not sizes:
+        return {}, quantity
+
+    short = dict((size, max(stock[size], 0)) for size in sizes if is_short(quantity, (size,), stock))
+    unlimited = [size for size in sizes if size not in short]
+    table = get_pack_solver(unlimited, [cents[size] for size in unlimited], pricing)
+    if not short:
+        return table.breakdown(quantity)
+
+    for size in short:
+        for other in unlimited:
+            # lcm(size, other) as packs of size and as packs of other, compared in the order of the pricing mode
+            packs, swapped = other // math.gcd(size, other), size // math.gcd(size, other)
+            costs = (swapped - packs, swapped * cents[other] - packs * cents[size])
+            if pricing == PRICING_PRICE:
+                costs = costs[::-1]
+            elif pricing == PRICING_PACKS:
+                costs = costs[:1]
+            if costs <= (0,) * len(costs):
+                short[size] = min(short[size], packs - 1)
+
+    bound = min(quantity, sum(size * count for size, count in short.items()))
+    if bound > TABLE_SIZE_LIMIT:
+        return None
+
+    # packs amount and cost of short packs in one comparable int per fill, both are additive
+    max_packs = sum(short.values())
+    max_cost = sum(cents[size] * count for size, count in short.items())
+    if pricing == PRICING_PRICE:
+        weigh = lambda packs, cost: cost * (max_packs + 1) + packs
+    else:
+        weigh = lambda packs, cost: packs * (max_cost + 1) + cost
+
+    # 0/1 items of (packs, rank) of each short size, by binary splitting of stock
+    groups = []
+    for size, count in short.items():
+        items, take = [], 1
+        while count > 0:
+            packs = min(take, count)
+            items.append((packs, weigh(packs, cents[size] * packs)))
+            count -= packs
+            take *= 2
+        groups.append((size, items))
+    ranks, counts = _relax_bounded_items(bound, groups)
+
+    # fills leaving a rest past the table limit only differ by packs of the table period P within a residue mod P,
+    # so only the best of each residue is looked up, plus every fill leaving a rest within the table
+    end = min(max(quantity - table.limit, 0), bound + 1) if table.pack_sizes else 0
+    period, period_cost = table.period, cents.get(table.period, 0)
+    if pricing == PRICING_PRICE:
+        scores = lambda fills, ranks: (
+            ranks // (max_packs + 1) * period - fills * period_cost,
+            ranks % (max_packs + 1) * period - fills,
+        )
+    elif pricing == PRICING_PACKS_PRICE:
+        scores = lambda fills, ranks: (
+            ranks // (max_cost + 1) * period - fills,
+            ranks % (max_cost + 1) * period - fills * period_cost,
+        )
+    else:
+        scores = lambda fills, ranks: (ranks // (max_cost + 1) * period - fills,)
+    top = (max_cost + max_packs + bound) * (period + period_cost)
+    candidates = _best_fill_per_residue(ranks, end, period, scores, top)
+    candidates.extend(range(end, bound + 1))
+
+    best, best_fill = None, 0
+    for fill in candidates:
+        rank = int(ranks[fill])
+        if rank < 0:
+            continue
+        if pricing == PRICING_PACKS:
+            filled, packs = table.best_fill(quantity - fill)
+            key = (quantity - fill - filled, rank // (max_cost + 1) + packs)
+        else:
+            breakdown, remainder = table.breakdown(quantity - fill)
+            packs = sum(breakdown.values())
+            cost = sum(cents[size] * amount for size, amount in breakdown.items())
+            if pricing == PRICING_PRICE:
+                short_cost, short_packs = divmod(rank, max_packs + 1)
+                key = (remainder, short_cost + cost, short_packs + packs)
+            else:
+                short_packs, short_cost = divmod(rank, max_cost + 1)
+                key = (remainder, short_packs + packs, short_cost + cost)
+        if best is None or (key, fill) < (best, best_fill):
+            best, best_fill = key, fill
+
+    # walk back the packs of each short size
+    amounts, fill = {}, best_fill
+    for (size, items), size_counts in reversed(list(zip(groups, counts))):
+        amounts[size] = int(size_counts[fill])
+        fill -= size * amounts[size]
+
+    breakdown, remainder = table.breakdown(quantity - best_fill)
+    for size, amount in breakdown.items():
+        amounts[size] = amounts.get(size, 0) + amount
+    return dict((size, amounts[size]) for size in sizes if amounts.get(size)), remainder
+
+
+def _relax_bounded_items(bound, groups):
+    """
+    0/1 knapsack of exact fills up to bound, vectorised by numpy if it is importable and ranks fit in int64
+    :param groups: list of (size, list of (packs, rank) of each item of the size)
+    :return: best rank of each fill (-1 if not reachable) as numpy array or list,
+             packs of each size in the best fill of each fill once the items of the size are added
+    """
+    top = sum(rank for size, items in groups for packs, rank in items)
+    if numpy is not None and USE_NUMPY and top < 2 ** 62:
+        infinity = numpy.iinfo(numpy.int64).max // 2
+        ranks = numpy.full(bound + 1, infinity, dtype=numpy.int64)
+        ranks[0] = 0
+        counts = []
+        for size, items in groups:
+            size_counts = numpy.zeros(bound + 1, dtype=numpy.min_scalar_type(sum(packs for packs, rank in items)))
+            for packs, rank in items:
+                quantity = size * packs
+                if quantity <= bound:
+                    candidate = ranks[: bound + 1 - quantity] + rank
+                    improved = candidate < ranks[quantity:]
+                    ranks[quantity:] = numpy.where(improved, candidate, ranks[quantity:])
+                    size_counts[quantity:] = numpy.where(
+                        improved, size_counts[: bound + 1 - quantity] + packs, size_counts[quantity:]
+                    )
+            counts.append(size_counts)
+        ranks[ranks == infinity] = -1
+        return ranks, counts
+
+    ranks = [-1] * (bound + 1)
+    ranks[0] = 0
+    counts = []
+    for size, items in groups:
+        size_counts = array("l", [0]) * (bound + 1)
+        for packs, rank in items:
+            quantity = size * packs
+            # descending, so each item is used once
+            for fill in range(bound, quantity - 1, -1):
+                previous = ranks[fill - quantity]
+                if previous >= 0 and (ranks[fill] < 0 or previous + rank < ranks[fill]):
+                    ranks[fill] = previous + rank
+                    size_counts[fill] = size_counts[fill - quantity] + packs
+        counts.append(size_counts)
+    return ranks, counts
+
+
+def _best_fill_per_residue(ranks, end, period, scores, top):
+    """
+    the fill with the least scores (then the least fill) of each residue mod period, among reachable fills below end.
+    vectorised by numpy if ranks is a numpy array and scores are below top < 2 ** 62
+    :param ranks: best rank of each fill, -1 if not reachable
+    :param scores: callable of (fills, ranks) to a tuple of scores compared in order, of ints or numpy arrays
+    :return: list of fills
+    """
+    if not end:
+        return []
+    if numpy is not None and isinstance(ranks, numpy.ndarray) and top < 2 ** 62:
+        infinity = numpy.iinfo(numpy.int64).max
+        rows = -(-end // period)
+        reachable = numpy.zeros(rows * period, dtype=bool)
+        reachable[:end] = ranks[:end] >= 0
+        # residues as columns, least score of each column among fills with the least scores before it
+        candidates = reachable.reshape(rows, period)
+        for score in scores(numpy.arange(end, dtype=numpy.int64), ranks[:end]):
+            grid = numpy.full(rows * period, infinity, dtype=numpy.int64)
+            grid[:end] = score
+            grid = numpy.where(candidates, grid.reshape(rows, period), infinity)
+            candidates = candidates & (grid == grid.min(axis=0))
+        # first row of each column, the least fill
+        picked = candidates.argmax(axis=0) * period + numpy.arange(period)
+        return [int(fill) for fill in picked[candidates.any(axis=0)]]
+
+    best = {}  # residue -> (scores, fill)
+    for fill in range(end):
+        rank = int(ranks[fill])
+        if rank < 0:
+            continue
+        candidate = (scores(fill, rank), fill)
+        if fill % period not in best or candidate < best[fill % period]:
+            best[fill % period] = candidate
+    return [fill for score, fill in best.values()]
+
+
+def breakdown_work_item(work_item):
+    """
+    solve a compact (table key, quantity) work item, top level so process pool can pickle it
+    :return: dict of pack size and amount, remainder
+    """
+    return key_breakdown(*work_item)
+
 
 class PackBreaker:
-    def __init__(self, total_quantity, pack_sizes):
+    # instrumentation callbacks, each is called with a stats dict after every solve.
+    # nothing is timed or collected when it is empty
+    hooks = []
+
+    def __init__(self, total_quantity, pack_sizes, engine=None):
+        """
+        search state is kept on the instance, so one instance solves once and is not shared between threads,
+        use `solve_breakdown` for a stateless call
+        :param pack_sizes: pack size list, copied with descending sort, caller's list is not changed
+        """
         self.total_quantity = total_quantity
-        self.pack_sizes = pack_sizes
-        self.pack_sizes.sort(reverse=True)
+        self.pack_sizes = sorted(pack_sizes, reverse=True)
+
+        self.engine = engine or PACK_ENGINE
+        if self.engine not in ENGINES:
+            raise KeyError(f"{self.engine} is not an engine of PackBreaker")
 
         # global variable to contain the minimized remainder solution with pack amount minimized
         self.best_remainder = total_quantity
         self.best_remainder_packs = {}
 
+        # search counters, reported to hooks
+        self.nodes_visited = 0
+        self.candidates_evaluated = 0
+        self.early_exits = 0
+
     def remove_zero(self, breakdown):
         """
         remove pack if amount is zero
@@ -22,12 +1184,180 @@ class PackBreaker:
 
     def solve(self):
         """
-        simply call `pack_breakdown`
+        solve by the selected engine, `dp_breakdown` or `pack_breakdown`
         """
-        self.pack_breakdown(self.total_quantity, self.pack_sizes)
+        start = time.perf_counter() if PackBreaker.hooks else None
+
+        if self.engine == ENGINE_DP:
+            self.dp_breakdown()
+        else:
+            self.pack_breakdown(self.total_quantity, self.pack_sizes)
         result = self.remove_zero(self.best_remainder_packs)
+
+        if start is not None:
+            stats = {
+                "event": "solve",
+                "engine": self.engine,
+                "quantity": self.total_quantity,
+                "nodes_visited": self.nodes_visited,
+                "candidates_evaluated": self.candidates_evaluated,
+                "early_exits": self.early_exits,
+                "wall_time": time.perf_counter() - start,
+            }
+            for hook in list(PackBreaker.hooks):
+                hook(stats)
         return result, self.best_remainder
 
+    def solve_anytime(self, time_budget=None, node_budget=None, initial=None, stock=None):
+        """
+        depth first branch and bound from an initial breakdown (greedy by default), stop at the budget
+        with the best breakdown found so far. a subtree is pruned if it can not beat the best one:
+        its remainder is at least rest mod gcd of the smaller sizes, and filling the rest needs at least
+        rest / next size packs
+        :param time_budget: max seconds, no limit if None
+        :param node_budget: max search nodes, no limit if None
+        :param initial: dict of pack size and amount to start from, greedy breakdown within stock if None
+        :param stock: dict of pack size and packs available, size not in it is unlimited
+        :return: dict of pack size and amount, remainder, True if proven optimal
+        """
+        quantity = self.total_quantity
+        sizes = normalize_pack_sizes(self.pack_sizes)
+        if quantity <= 0 or not sizes:
+            return {}, quantity, True
+
+        # most packs of each size worth trying, the bounds below hold for fewer packs too
+        caps = [max(stock[size], 0) if stock and size in stock else quantity // size for size in sizes]
+        if initial is None:
+            initial, rest = {}, quantity
+            for size, cap in zip(sizes, caps):
+                initial[size] = min(rest // size, cap)
+                rest -= size * initial[size]
+        best_amounts = [initial.get(size, 0) for size in sizes]
+        best = (quantity - sum(size * amount for size, amount in zip(sizes, best_amounts)), sum(best_amounts))
+
+        # gcd of each size and all smaller ones, no fill of them leaves less than rest mod it
+        gcds = list(sizes)
+        for index in reversed(range(len(sizes) - 1)):
+            gcds[index] = math.gcd(sizes[index], gcds[index + 1])
+        least_remainder = quantity % gcds[0]
+
+        def bound(level, rest, packs):
+            remainder = rest % gcds[level]
+            return remainder, packs - (-(rest - remainder) // sizes[level])
+
+        end = time.perf_counter() + time_budget if time_budget is not None else None
+        last = len(sizes) - 1
+        rests = [quantity] + [0] * last  # quantity left before each level
+        counts = [0] * len(sizes)  # packs amount before each level
+        amounts = [min(quantity // sizes[0], caps[0])] + [0] * last  # current amount of each size, tried descending
+        level = 0
+        proven = bound(0, quantity, 0) >= best
+        while level >= 0 and not proven:
+            if amounts[level] < 0:
+                level -= 1
+                if level >= 0:
+                    amounts[level] -= 1
+                continue
+
+            self.nodes_visited += 1
+            if node_budget is not None and self.nodes_visited > node_budget:
+                break
+            if end is not None and not self.nodes_visited & 1023 and time.perf_counter() > end:
+                break
+
+            rest = rests[level] - amounts[level] * sizes[level]
+            packs = counts[level] + amounts[level]
+            if level == last:
+                # fewer packs of smallest size only leave more remainder
+                self.candidates_evaluated += 1
+                if (rest, packs) < best:
+                    best, best_amounts = (rest, packs), list(amounts)
+                amounts[level] = -1
+            elif best[0] == least_remainder and packs - (-(rest - best[0]) // sizes[level + 1]) >= best[1]:
+                # no remainder beats the best one, and fewer packs of this size need even more smaller packs
+                self.early_exits += 1
+                amounts[level] = -1
+            elif bound(level + 1, rest, packs) >= best:
+                amounts[level] -= 1
+            else:
+                level += 1
+                rests[level], counts[level] = rest, packs
+                amounts[level] = min(rest // sizes[level], caps[level])
+        else:
+            proven = True
+
+        breakdown = dict((size, amount) for size, amount in zip(sizes, best_amounts) if amount)
+        return breakdown, best[0], proven
+
+    def iter_optimal(self):
+        """
+        lazily yield every breakdown reaching the optimal (remainder, packs amount), by descending pack amounts
+        from the largest size, so the first one is same as `solve`. iterative depth first search with
+        O(number of sizes) working memory, each pack amount is pruned by exact min packs of the smaller sizes
+        from shared pack tables, the search space is never materialised
+        """
+        sizes = normalize_pack_sizes(self.pack_sizes)
+        breakdown, remainder = get_pack_solver(sizes).breakdown(self.total_quantity)
+        if not breakdown:
+            yield {}
+            return
+
+        last = len(sizes) - 1
+        suffix_tables = [get_pack_solver(sizes[i + 1 :]) for i in range(last)]
+        rests = [0] * len(sizes)  # quantity left to fill from this size on
+        counts = [0] * len(sizes)  # packs amount left from this size on
+        amounts = [0] * len(sizes)  # current pack amount of each size, tried descending
+        lows = [0] * len(sizes)  # lowest pack amount worth trying of each size
+
+        def enter(level, rest, count):
+            rests[level], counts[level] = rest, count
+            if level == last:
+                # smallest size must take exactly all the rest
+                amounts[level] = lows[level] = count
+                return
+            size, next_size = sizes[level], sizes[level + 1]
+            amounts[level] = min(rest // size, count)
+            # every smaller pack fills no more than next_size
+            lows[level] = max(-(-(rest - count * next_size) // (size - next_size)), 0)
+
+        enter(0, self.total_quantity - remainder, sum(breakdown.values()))
+        level = 0
+        while level >= 0:
+            if amounts[level] < lows[level]:
+                # all amounts of this size tried, back to larger size
+                level -= 1
+                if level >= 0:
+                    amounts[level] -= 1
+                continue
+
+            rest = rests[level] - amounts[level] * sizes[level]
+            count = counts[level] - amounts[level]
+            if level == last:
+                if rest == 0:
+                    yield dict((size, amount) for size, amount in zip(sizes, amounts) if amount)
+                amounts[level] -= 1
+            elif suffix_tables[level].exact_packs(rest) == count:
+                level += 1
+                enter(level, rest, count)
+            else:
+                amounts[level] -= 1
+
+    def dp_breakdown(self):
+        """
+        iterative dynamic programming, read from the shared periodic PackTable of the pack sizes
+        (or solved by `key_breakdown` without it), so memory is bounded by the pack sizes, not by quantity.
+        minimise remainder first then packs amount, ties prefer more larger packs
+        """
+        if self.total_quantity <= 0:
+            return
+        breakdown, remainder = key_breakdown(get_table_key(self.pack_sizes), self.total_quantity)
+        # one table lookup, every size a candidate
+        self.nodes_visited = 1
+        self.candidates_evaluated = len(self.pack_sizes)
+        if remainder < self.best_remainder:
+            self.best_remainder_packs = breakdown
+            self.best_remainder = remainder
+
     def pack_breakdown(self, rest_quantity, pack_sizes, filled_pack_amount=()):
         """
         loop possible solution space by the order of packs total amount ascending
@@ -35,10 +1365,12 @@ class PackBreaker:
         :param pack_sizes:
         :return:
         """
+        self.nodes_visited += 1
         if self.best_remainder == 0:
             # best already found not need continue anymore
+            self.early_exits += 1
             return []
-        pack_sizes.sort(reverse=True)
+        pack_sizes = sorted(pack_sizes, reverse=True)
 
         pack_choice_number = len(pack_sizes)
         current_pack_size = pack_sizes[0]
@@ -48,6 +1380,7 @@ class PackBreaker:
             pack_amount = int(rest_quantity / current_pack_size)
             packs_amount = filled_pack_amount + (pack_amount,)
             remainder = self.get_remainder(packs_amount)
+            self.candidates_evaluated += 1
             if remainder >= 0 and remainder < self.best_remainder:
                 # got better best_remainder, record it
                 self.best_remainder_packs = self.amount_to_breakdown(packs_amount)
@@ -60,8 +1393,9 @@ class PackBreaker:
         )  # make sure the this solution not over rest_quantity quantity
 
         for j in reversed(range(possible_pack_amount)):
+            # lazy %-format, string is not built unless debug log enabled
             logger.debug(
-                f"{rest_quantity}, {current_pack_size}, {possible_pack_amount}"
+                "%s, %s, %s", rest_quantity, current_pack_size, possible_pack_amount
             )
             next_pack_amount = filled_pack_amount + (j,)
             for k in self.pack_breakdown(
@@ -72,8 +1406,9 @@ class PackBreaker:
                 packs_amount = (j,) + k
                 remainder = self.get_remainder(packs_amount)
                 result.append(packs_amount)
+                self.candidates_evaluated += 1
 
-                logger.debug(f"{packs_amount}, {remainder}")
+                logger.debug("%s, %s", packs_amount, remainder)
                 if remainder >= 0 and remainder < self.best_remainder:
                     self.best_remainder_packs = self.amount_to_breakdown(packs_amount)
                     self.best_remainder = remainder
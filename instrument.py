@@ -0,0 +1,58 @@
+import atexit
+import logging
+
+from helper import PackBreaker
+from models.bakery import Bakery
+
+logger = logging.getLogger(__name__)
+
+
+class StatsCollector:
+    """
+    hook aggregating stats dicts by event and engine (if any), register it to `PackBreaker.hooks` or `Bakery.hooks`
+    """
+
+    def __init__(self):
+        self._totals = {}
+
+    def __call__(self, stats):
+        key = f"{stats['event']}/{stats['engine']}" if "engine" in stats else stats["event"]
+        totals = self._totals.setdefault(key, {"calls": 0})
+        totals["calls"] += 1
+        for name, value in stats.items():
+            # sum all numeric counters, wall time included
+            if isinstance(value, (int, float)) and name != "quantity":
+                totals[name] = totals.get(name, 0) + value
+
+    def dump(self):
+        """
+        :return: dict of `event/engine` (or `event`) and its aggregated counters
+        """
+        return {key: dict(totals) for key, totals in self._totals.items()}
+
+    def log(self):
+        for key, totals in self.dump().items():
+            logger.info(f"{key}: {totals}")
+
+
+def install_collector(dump_at_exit=True):
+    """
+    register a StatsCollector to both PackBreaker and Bakery hooks
+    :param dump_at_exit: log aggregated stats at process exit
+    :return: the collector
+    """
+    collector = StatsCollector()
+    PackBreaker.hooks.append(collector)
+    Bakery.hooks.append(collector)
+    if dump_at_exit:
+        atexit.register(collector.log)
+    return collector
+
+
+def uninstall_collector(collector):
+    """
+    remove a collector from both PackBreaker and Bakery hooks
+    """
+    for hooks in (PackBreaker.hooks, Bakery.hooks):
+        if collector in hooks:
+            hooks.remove(collector)
@@ -0,0 +1,263 @@
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+
+from benchmark import percentile
+from main import catalogue_bakery, default_bakery
+from models.order import Order
+from stream import FORMAT_JSONL, FORMATS, guess_format, read_orders
+
+try:
+    import resource
+except ImportError:
+    # unix only, memory is not reported on other platforms
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss_kb():
+    """
+    resident memory of this process in KB, peak resident memory if current is not available, 0 if neither
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except (OSError, AttributeError):
+        pass
+    if resource is not None:
+        # KB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak
+    return 0
+
+
+def generate_orders(
+    codes,
+    count,
+    seed=0,
+    skew=1.0,
+    max_lines=3,
+    max_quantity=50,
+    burst_rate=0.002,
+    burst_length=20,
+    bulk_factor=100,
+    huge_rate=0.0005,
+):
+    """
+    seeded synthetic day of orders, same seed always gives same orders
+    :param codes: product codes, in order of popularity
+    :param skew: Zipf exponent of product popularity, product of rank r is picked by weight 1 / r ** skew, 0 for uniform
+    :param max_lines: max product lines of an order
+    :param max_quantity: max quantity of a normal line
+    :param burst_rate: chance of a burst of bulk orders starting at an order
+    :param burst_length: orders in a burst, each quantity is multiplied by `bulk_factor`
+    :param huge_rate: chance of a line quantity being huge, 10 ** 9 to 10 ** 18
+    :return: generator of order dict
+    """
+    rng = random.Random(seed)
+    weights = [1 / rank ** skew for rank in range(1, len(codes) + 1)]
+    burst = 0
+    for i in range(count):
+        if not burst and rng.random() < burst_rate:
+            burst = burst_length
+        factor = bulk_factor if burst else 1
+        burst = max(burst - 1, 0)
+
+        order_dict = {}
+        for code in rng.choices(codes, weights, k=rng.randint(1, max_lines)):
+            if rng.random() < huge_rate:
+                quantity = rng.randrange(10 ** 9, 10 ** 18)
+            else:
+                quantity = rng.randint(1, max_quantity) * factor
+            order_dict[code] = order_dict.get(code, 0) + quantity
+        yield order_dict
+
+
+def write_order_log(order_dicts, f):
+    """
+    record orders as JSON lines of `{"id": ..., "products": ...}`, replayable by `read_order_log` and `main.py --stream`
+    :return: orders written
+    """
+    count = 0
+    for count, order_dict in enumerate(order_dicts, start=1):
+        f.write(json.dumps({"id": count, "products": order_dict}) + "\n")
+    return count
+
+
+def read_order_log(lines, input_format=FORMAT_JSONL):
+    """
+    :param lines: iterable of text lines of a recorded order log, JSON lines or CSV same as `main.py --stream`
+    :return: generator of order dict, invalid records are skipped
+    """
+    for order_id, order_dict, error in read_orders(lines, input_format):
+        if error is None:
+            yield order_dict
+        else:
+            logger.warning(f"order {order_id} skipped: {error}")
+
+
+def run_load_test(bakery, order_dicts, window=1.0):
+    """
+    process orders one after another by `Bakery.process_order`, as fast as they are done
+    :param order_dicts: iterable of order dict, consumed lazily
+    :param window: seconds of each time window
+    :return: dict of orders, errors, elapsed seconds, sustained orders per second, latency percentiles in ms,
+             peak resident memory in KB and a list of windows with same stats of each time window
+    """
+    latencies = []
+    windows = []
+    window_latencies = []
+    errors = 0
+    start = window_start = time.perf_counter()
+
+    def close_window(now):
+        windows.append(
+            {
+                "elapsed": now - start,
+                "orders": len(window_latencies),
+                "orders_per_second": len(window_latencies) / (now - window_start) if now > window_start else 0.0,
+                "p50_ms": percentile(window_latencies, 50) if window_latencies else 0.0,
+                "p99_ms": percentile(window_latencies, 99) if window_latencies else 0.0,
+                "rss_kb": current_rss_kb(),
+            }
+        )
+
+    for order_dict in order_dicts:
+        order_start = time.perf_counter()
+        try:
+            bakery.process_order(Order(order_dict))
+        except Exception as e:
+            errors += 1
+            logger.warning(f"order skipped: {e}")
+        else:
+            latency = (time.perf_counter() - order_start) * 1000
+            latencies.append(latency)
+            window_latencies.append(latency)
+
+        now = time.perf_counter()
+        if now - window_start >= window:
+            close_window(now)
+            window_start = now
+            window_latencies = []
+
+    now = time.perf_counter()
+    if window_latencies or not windows:
+        close_window(now)
+    elapsed = now - start
+    return {
+        "orders": len(latencies),
+        "errors": errors,
+        "elapsed": elapsed,
+        "orders_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) if latencies else 0.0,
+        "p95_ms": percentile(latencies, 95) if latencies else 0.0,
+        "p99_ms": percentile(latencies, 99) if latencies else 0.0,
+        "max_ms": max(latencies) if latencies else 0.0,
+        "peak_rss_kb": max(w["rss_kb"] for w in windows),
+        "windows": windows,
+    }
+
+
+def find_load_regressions(report, baseline, tolerance=0.2, noise_ms=0.05):
+    """
+    :param report: result of `run_load_test`
+    :param baseline: a stored result of `run_load_test` of same orders
+    :param tolerance: allowed ratio worse than baseline
+    :param noise_ms: latency change under this is ignored
+    :return: list of regression messages, empty if no regression
+    """
+    regressions = []
+    if report["orders_per_second"] < baseline["orders_per_second"] * (1 - tolerance):
+        regressions.append(
+            f"orders_per_second: {report['orders_per_second']:.1f} < {baseline['orders_per_second']:.1f} baseline"
+        )
+    for metric in ("p50_ms", "p99_ms"):
+        if report[metric] > baseline[metric] * (1 + tolerance) and report[metric] - baseline[metric] > noise_ms:
+            regressions.append(f"{metric}: {report[metric]:.3f} > {baseline[metric]:.3f} baseline")
+    if report["peak_rss_kb"] > baseline["peak_rss_kb"] * (1 + tolerance):
+        regressions.append(f"peak_rss_kb: {report['peak_rss_kb']} > {baseline['peak_rss_kb']} baseline")
+    return regressions
+
+
+def print_load_report(report):
+    print("%10s %10s %12s %12s %12s %12s" % ("Time(s)", "Orders", "Orders/s", "P50(ms)", "P99(ms)", "RSS(KB)"))
+    print("-" * 72)
+    for w in report["windows"]:
+        print(
+            "%10.1f %10d %12.1f %12.3f %12.3f %12d"
+            % (w["elapsed"], w["orders"], w["orders_per_second"], w["p50_ms"], w["p99_ms"], w["rss_kb"])
+        )
+    print(
+        f"{report['orders']} orders, {report['errors']} errors in {report['elapsed']:.3f}s, "
+        f"{report['orders_per_second']:.1f} orders/s, p50 {report['p50_ms']:.3f}ms, p95 {report['p95_ms']:.3f}ms, "
+        f"p99 {report['p99_ms']:.3f}ms, max {report['max_ms']:.3f}ms, peak RSS {report['peak_rss_kb']}KB"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate or replay a day of orders through the bakery")
+    parser.add_argument("--replay", metavar="FILE", help="replay a recorded order log instead of generating orders")
+    parser.add_argument("--format", choices=FORMATS, help="format of --replay, guessed by file extension")
+    parser.add_argument("--record", metavar="FILE", help="only write generated orders as a JSON lines log, no run")
+    parser.add_argument("--catalogue", metavar="FILE", help="load products from JSON or CSV file instead of default ones")
+    parser.add_argument("--orders", type=int, default=100000, help="generated orders")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated orders")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of product popularity, 0 for uniform")
+    parser.add_argument("--max-lines", type=int, default=3, help="max product lines of an order")
+    parser.add_argument("--max-quantity", type=int, default=50, help="max quantity of a normal line")
+    parser.add_argument("--burst-rate", type=float, default=0.002, help="chance of a burst of bulk orders")
+    parser.add_argument("--burst-length", type=int, default=20, help="orders in a burst")
+    parser.add_argument("--bulk-factor", type=int, default=100, help="quantity multiplier of bulk orders")
+    parser.add_argument("--huge-rate", type=float, default=0.0005, help="chance of a huge line quantity")
+    parser.add_argument("--window", type=float, default=1.0, help="seconds of each reported window")
+    parser.add_argument("--output", help="write report as JSON to this file")
+    parser.add_argument("--baseline", help="fail if regressed past this JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed ratio worse than baseline")
+    args = parser.parse_args()
+
+    bakery = catalogue_bakery(args.catalogue, None, None) if args.catalogue else default_bakery()
+    log_file = None
+    if args.replay:
+        log_file = open(args.replay, newline="")
+        order_dicts = read_order_log(log_file, args.format or guess_format(args.replay))
+    else:
+        order_dicts = generate_orders(
+            list(bakery.products),
+            args.orders,
+            seed=args.seed,
+            skew=args.skew,
+            max_lines=args.max_lines,
+            max_quantity=args.max_quantity,
+            burst_rate=args.burst_rate,
+            burst_length=args.burst_length,
+            bulk_factor=args.bulk_factor,
+            huge_rate=args.huge_rate,
+        )
+
+    if args.record:
+        with open(args.record, "w") as f:
+            count = write_order_log(order_dicts, f)
+        print(f"{count} orders written to {args.record}")
+        sys.exit(0)
+
+    report = run_load_test(bakery, order_dicts, args.window)
+    if log_file is not None:
+        log_file.close()
+    print_load_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_load_regressions(report, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
@@ -1,8 +1,13 @@
+import argparse
 import sys
 
+from catalogue import CATALOGUE_FORMATS, load_catalogue
+from config import INSTRUMENT
+from instrument import install_collector
 from models.bakery import Bakery
 from models.order import Order
 from models.product import Product
+from stream import FORMATS, guess_format, run_stream
 
 
 def print_product(product):
@@ -23,7 +28,7 @@ def print_order(order, bakery):
 def print_result(order, bakery):
     for code, order_product in order.products.items():
         product = bakery.get_product(code)
-        print("%-20s %s" % (f"{product.name}:", product.pack_sizes))
+        print("%-20s %s" % (f"{product.name}:", list(product.pack_sizes)))
         print("%-20s %s" % (f"Pack breakdown:", order_product["quantity"]))
         if not order_product["packs"]:
             print("%-10s %s" % ("", f"Non pack matches"))
@@ -45,7 +50,7 @@ def print_result(order, bakery):
         print("-" * 50)
 
 
-if __name__ == "__main__":
+def default_bakery():
     vs = Product(
         name="Vegemite Scroll",
         code="VS5",
@@ -61,8 +66,10 @@ if __name__ == "__main__":
         code="CF",
         pack_price_dict={3: 5.95, 5: 9.95, 9: 16.99}
     )
-    bakery = Bakery([vs, mb, cf])
+    return Bakery([vs, mb, cf])
+
 
+def interactive(bakery):
     print("Welcome to Rubix bakery, we provide:")
     print("=" * 60)
 
@@ -92,3 +99,72 @@ if __name__ == "__main__":
     print(f"\n\nYour best pack breakdown:")
     print("=" * 60)
     print_result(order, bakery)
+
+
+def stream(bakery, path, input_format):
+    """
+    non-interactive mode, read orders from file or stdin, write JSON line results to stdout
+    """
+    input_format = input_format or guess_format(path)
+    if path in (None, "-"):
+        summary = run_stream(bakery, sys.stdin, sys.stdout, input_format)
+    else:
+        with open(path, newline="") as f:
+            summary = run_stream(bakery, f, sys.stdout, input_format)
+
+    print(
+        f"{summary['orders']} orders processed, {summary['errors']} errors in {summary['elapsed']:.3f}s, "
+        f"{summary['orders_per_second']:.1f} orders/s, first order {summary['first_order_ms']:.3f}ms",
+        file=sys.stderr,
+    )
+
+
+def catalogue_bakery(path, input_format, warmup_quantity):
+    """
+    bakery of products in catalogue file, startup timings are written to stderr
+    :param warmup_quantity: warm up all products with this max quantity, no warm up if None
+    """
+    bakery = Bakery([])
+    summary = load_catalogue(bakery, path, input_format)
+    print(f"{summary['products']} products loaded in {summary['elapsed']:.3f}s", file=sys.stderr)
+    if warmup_quantity is not None:
+        summary = bakery.warmup(max_quantity=warmup_quantity)
+        print(f"{summary['products']} products warmed up in {summary['elapsed']:.3f}s", file=sys.stderr)
+    return bakery
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rubix bakery pack breakdown")
+    parser.add_argument(
+        "--stream",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="process orders from JSON Lines or CSV file (stdin if omitted) instead of interactive input",
+    )
+    parser.add_argument("--format", choices=FORMATS, help="input format of --stream, guessed by file extension")
+    parser.add_argument("--catalogue", metavar="FILE", help="load products from JSON or CSV file instead of default ones")
+    parser.add_argument(
+        "--catalogue-format", choices=CATALOGUE_FORMATS, help="format of --catalogue, guessed by file extension"
+    )
+    parser.add_argument(
+        "--warmup",
+        nargs="?",
+        type=int,
+        const=0,
+        metavar="MAX_QUANTITY",
+        help="prepare all catalogue products at startup, optionally solve quantities up to MAX_QUANTITY",
+    )
+    args = parser.parse_args()
+
+    if INSTRUMENT:
+        install_collector(dump_at_exit=True)
+
+    if args.catalogue:
+        bakery = catalogue_bakery(args.catalogue, args.catalogue_format, args.warmup)
+    else:
+        bakery = default_bakery()
+    if args.stream:
+        stream(bakery, args.stream, args.format)
+    else:
+        interactive(bakery)
@@ -1,16 +1,63 @@
 import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-from models.product import Product
+from cache import breakdown_cache
+from config import PRICING_MODE, PROCESS_CHUNK_SIZE, PROCESS_WORKERS
+from helper import PRICINGS, breakdown_work_item, is_short, key_breakdown
+from models.product import Product, to_quantity
 
 logger = logging.getLogger(__name__)
 
 
+def take_stock(stock, packs):
+    """
+    take used packs from stock of a product, size not in stock is unlimited
+    """
+    if stock:
+        for size, amount in packs.items():
+            if size in stock:
+                stock[size] -= amount
+
+
+def report_order(order, skipped_lines, unproven_lines, paths, start, hits, misses):
+    """
+    call `Bakery.hooks` with stats of a processed order
+    :param paths: path each line was solved by, in order of lines
+    :param start: perf_counter time the order started
+    :param hits: breakdown cache hits when the order started, misses same
+    """
+    stats = {
+        "event": "process_order",
+        "order_lines": len(order.products),
+        "skipped_lines": skipped_lines,
+        "unproven_lines": unproven_lines,
+        "paths": paths,
+        "cache_hits": breakdown_cache.hits - hits,
+        "cache_misses": breakdown_cache.misses - misses,
+        "wall_time": time.perf_counter() - start,
+    }
+    for hook in list(Bakery.hooks):
+        hook(stats)
+
+
 class Bakery:
-    def __init__(self, products):
+    # instrumentation callbacks, each is called with a stats dict after every `process_order`.
+    # nothing is timed or collected when it is empty
+    hooks = []
+
+    def __init__(self, products, pricing=PRICING_MODE):
         """
         :param products: list of product object
+        :param pricing: pricing mode of all orders, `packs`, `packs_price` or `price`
         """
+        if pricing not in PRICINGS:
+            raise KeyError(f"{pricing} is not a pricing mode")
+        self.pricing = pricing
         self._products = {}
+        self._pending = {}  # product code -> (name, pack price dict), registered but not created yet
+        self._lock = threading.Lock()  # create a registered product only once
 
         for product in products:
             # skip if type not match
@@ -20,29 +67,222 @@ class Bakery:
     # expose as property to make sure immutable from outside
     @property
     def products(self):
+        """all products, registered ones are created here, use `has_product` to only check a code"""
+        for code in list(self._pending):
+            self.get_product(code)
         return self._products
 
-    def process_order(self, order):
+    def register(self, code, name, pack_price_dict):
+        """
+        register a product without creating it, it is created on first use by `get_product`
+        :param pack_price_dict: dict of pack size and price, same as Product
+        """
+        code = str(code)
+        with self._lock:
+            self._products.pop(code, None)
+            self._pending[code] = (name, pack_price_dict)
+
+    def has_product(self, code):
+        return code in self._products or code in self._pending
+
+    def warmup(self, codes=None, max_quantity=0):
+        """
+        create products and build their pack tables now instead of on first order
+        :param codes: product codes to warm up, all products if None
+        :param max_quantity: also solve quantities 1 to max_quantity into the breakdown cache,
+                             as many as the cache can hold
+        :return: dict of products warmed up and elapsed seconds
+        """
+        start = time.perf_counter()
+        codes = list(self._products) + list(self._pending) if codes is None else codes
+        for code in codes:
+            product = self.get_product(code)
+            product.get_pack_table(self.pricing)
+            for quantity in range(1, max_quantity + 1):
+                product.pack_order(quantity, self.pricing)
+        return {"products": len(codes), "elapsed": time.perf_counter() - start}
+
+    def process_order(self, order, executor=None, stock=None, deadline=None, node_budget=None):
         """
         :param order: order object
+        :param executor: thread pool to solve product lines concurrently, lines are solved one by one if None.
+                         results are written into order by this thread only, in order of lines
+        :param stock: dict of product code and its dict of pack size and packs available, packs used are taken from it.
+                      product or size not in it is unlimited
+        :param deadline: max seconds for the whole order, lines not solved by a built pack table are searched
+                         until then and marked `optimal = False` if not proven best. no limit if None
+        :param node_budget: max search nodes of each line not solved by a built pack table, same as deadline
+                            but deterministic. no limit if None
         :return: order object
         """
+        if Bakery.hooks:
+            start = time.perf_counter()
+            hits, misses = breakdown_cache.hits, breakdown_cache.misses
+        end = time.perf_counter() + deadline if deadline is not None else None
+
+        skipped_lines = unproven_lines = 0
+        paths = []  # path each line was solved by, in order of lines
+        futures = []  # (product code, future of line result, stock of product)
         for product_code, order_product in order.products.items():
             quantity = order_product.get("quantity")
-            if product_code not in self._products:
+            if not self.has_product(product_code):
                 # skip invalid product code
+                skipped_lines += 1
+                continue
+
+            product = self.get_product(product_code)
+            product_stock = stock.get(product_code) if stock else None
+            if executor is not None:
+                # lines of different products never share stock
+                future = executor.submit(self._pack_line, product, quantity, product_stock, end, node_budget)
+                futures.append((product_code, future, product_stock))
                 continue
 
+            packs, remainder, total_price, optimal, path = self._pack_line(
+                product, quantity, product_stock, end, node_budget
+            )
+            order.set_product_break_down(product_code, packs, remainder, total_price, optimal)
+            take_stock(product_stock, packs)
+            unproven_lines += not optimal
+            paths.append(path)
+
+        for product_code, future, product_stock in futures:
+            packs, remainder, total_price, optimal, path = future.result()
+            order.set_product_break_down(product_code, packs, remainder, total_price, optimal)
+            take_stock(product_stock, packs)
+            unproven_lines += not optimal
+            paths.append(path)
+
+        if Bakery.hooks:
+            report_order(order, skipped_lines, unproven_lines, paths, start, hits, misses)
+        return order
+
+    def _pack_line(self, product, quantity, stock, end, node_budget=None):
+        """
+        :param end: perf_counter time to stop searching, no limit if None
+        :param node_budget: max search nodes, no limit if None
+        :return: pack match as dict, remainder, total price, True if proven optimal and path it was solved by
+        """
+        quantity = to_quantity(quantity)
+        if end is None and node_budget is None and not is_short(quantity, product.pack_sizes, stock):
             # call product.pack_order to break down quantity
-            packs, remainder, total_price = self.get_product(product_code).pack_order(
-                quantity
+            packs, remainder, total_price, path = product.pack_order_with_path(quantity, self.pricing)
+            return packs, remainder, total_price, True, path
+        # short stock is solved in full, unless it is too large for the bounded solver
+        time_budget = max(end - time.perf_counter(), 0) if end is not None else None
+        return product.pack_order_anytime_with_path(quantity, time_budget, node_budget, self.pricing, stock)
+
+    def process_orders(self, orders, stock=None):
+        """
+        process a batch of orders in one pass, order lines are grouped by table key of the product
+        (pack sizes, and prices if pricing compares them) and quantity, so each distinct group is solved only once
+        :param orders: list of order object, or an OrderBatch
+        :param stock: shared stock, see `process_order`. orders are then processed one by one in order,
+                      each one takes packs from what earlier ones left
+        :return: list of order object, or the OrderBatch
+        """
+        if stock:
+            for order in orders:
+                self.process_order(order, stock=stock)
+            return orders
+
+        lines = self._group_order_lines(orders)
+        for (table_key, quantity), targets in lines.items():
+            packs, remainder = key_breakdown(table_key, quantity)
+            self._set_break_down(targets, packs, remainder)
+        return orders
+
+    def process_orders_parallel(
+        self, orders, workers=PROCESS_WORKERS, chunk_size=PROCESS_CHUNK_SIZE, shared_tables=None
+    ):
+        """
+        same as `process_orders` but solve on a process pool, only compact (table key, quantity)
+        work items are sent to workers, results are written back in order of work items
+        :param orders: list of order object
+        :param workers: worker processes, 0 means cpu count
+        :param chunk_size: work items sent to a worker at a time
+        :param shared_tables: `SharedTables` to publish tables into, workers attach to them
+                              instead of building own copies
+        :return: list of order object
+        """
+        lines = self._group_order_lines(orders)
+        work_items = list(lines)
+        pool_args = {}
+        if shared_tables is not None:
+            # shared memory needs Python 3.8 or above, only imported when used
+            from shared_tables import attach_worker
+
+            keys = sorted(set(key for key, quantity in work_items), key=str)
+            for key in keys:
+                shared_tables.publish(key)
+            pool_args = {"initializer": attach_worker, "initargs": (keys, shared_tables.prefix)}
+        with ProcessPoolExecutor(max_workers=workers or None, **pool_args) as executor:
+            results = executor.map(
+                breakdown_work_item, work_items, chunksize=max(chunk_size, 1)
             )
-            order.set_product_break_down(product_code, packs, remainder, total_price)
+            for work_item, (packs, remainder) in zip(work_items, results):
+                self._set_break_down(lines[work_item], packs, remainder)
+        return orders
+
+    def _group_order_lines(self, orders):
+        """
+        :return: dict of (table key, quantity) and list of (order, product code, catalogue), in order of appearance.
+                 catalogue of each product is taken once, so the batch is consistent even if packs are changed meanwhile
+        """
+        catalogues = {}  # product code -> catalogue
+        lines = {}
+        for order in orders:
+            for product_code, order_product in order.products.items():
+                if not self.has_product(product_code):
+                    # skip invalid product code
+                    continue
+                if product_code not in catalogues:
+                    catalogues[product_code] = self.get_product(product_code).catalogue
+                catalogue = catalogues[product_code]
+                quantity = to_quantity(order_product.get("quantity"))
+                key = (catalogue.table_key(self.pricing), quantity)
+                lines.setdefault(key, []).append((order, product_code, catalogue))
+        return lines
+
+    def _set_break_down(self, targets, packs, remainder):
+        """
+        write one breakdown into all (order, product code, catalogue) targets, price is calculated once per catalogue
+        """
+        prices = {}  # catalogue -> total price
+        for order, product_code, catalogue in targets:
+            if catalogue not in prices:
+                prices[catalogue] = catalogue.get_total_price(packs)
+            order.set_product_break_down(product_code, dict(packs), remainder, prices[catalogue])
+
+    def add_pack(self, code, size, price):
+        """
+        add a pack size to a product, or change its price if exists
+        """
+        self.get_product(code).add_pack(size, price)
+
+    def remove_pack(self, code, size):
+        """
+        remove a pack size from a product
+        """
+        self.get_product(code).remove_pack(size)
+
+    def set_pack_price(self, code, size, price):
+        """
+        change price of a pack size of a product
+        """
+        self.get_product(code).set_pack_price(size, price)
 
     def get_product(self, code):
         """
-        get product by code
+        get product by code, a registered product is created on first get
         """
-        if code not in self._products:
-            raise KeyError(f"{code} is not a code of products")
-        return self._products[code]
+        product = self._products.get(code)
+        if product is None:
+            with self._lock:
+                if code not in self._products:
+                    if code not in self._pending:
+                        raise KeyError(f"{code} is not a code of products")
+                    name, pack_price_dict = self._pending.pop(code)
+                    self._products[code] = Product(name, code, pack_price_dict)
+                product = self._products[code]
+        return product
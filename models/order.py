@@ -1,9 +1,77 @@
 import logging
+from array import array
+from decimal import Decimal
+
+from config import PRICE_DECIMAL_PLACES, PRICE_DECIMAL_UNIT
+from models.product import to_quantity
 
 logger = logging.getLogger(__name__)
 
+LINE_FIELDS = ("quantity", "packs", "remainder", "total_price")
+
+
+class LineAccessMixin:
+    """
+    dict-style accessors of an order line, `line["packs"]` etc. are kept for compatibility
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in LINE_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in LINE_FIELDS else default
+
+    def __contains__(self, key):
+        return key in LINE_FIELDS
+
+    def keys(self):
+        return LINE_FIELDS
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in LINE_FIELDS]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (LineAccessMixin, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class OrderLine(LineAccessMixin):
+    """
+    one product line of an order
+    """
+
+    __slots__ = ("quantity", "_packs", "remainder", "total_price", "optimal")
+
+    def __init__(self, quantity):
+        self.quantity = quantity
+        self._packs = None  # to contain pack breakdown result, no empty dict allocated per line
+        self.remainder = None  # remainder if this product cant be perfectly break down
+        self.total_price = None
+        self.optimal = None  # False if solving stopped at a deadline before the breakdown was proven best
+
+    @property
+    def packs(self):
+        return self._packs if self._packs is not None else {}
+
+    @packs.setter
+    def packs(self, packs):
+        self._packs = packs
+
 
 class Order:
+    __slots__ = ("_products", "total_price")
+
     def __init__(self, order_dict):
         """
         :param order_dict: dict of product code and quantity
@@ -12,13 +80,8 @@ class Order:
         self.total_price = None
 
         for code, quantity in order_dict.items():
-            # init a dict of product, using code as dict key
-            self._products[code] = {
-                "quantity": quantity,
-                "packs": {},  # to contain pack breakdown result
-                "remainder": None,  # remainder if this product cant be perfectly break down
-                "total_price": None,
-            }
+            # init a line of product, using code as dict key
+            self._products[code] = OrderLine(quantity)
 
     # expose as property to make sure immutable from outside
     @property
@@ -30,9 +93,221 @@ class Order:
             raise KeyError(f"{code} is not in this order.")
         return self._products[code]
 
-    def set_product_break_down(self, product_code, packs, remainder, total_price):
+    def set_product_break_down(self, product_code, packs, remainder, total_price, optimal=True):
         if product_code not in self._products:
             raise KeyError(f"{product_code} is not in this order.")
-        self._products[product_code]["packs"] = packs
-        self._products[product_code]["remainder"] = remainder
-        self._products[product_code]["total_price"] = total_price
+        line = self._products[product_code]
+        line.packs = packs
+        line.remainder = remainder
+        line.total_price = total_price
+        line.optimal = optimal
+
+
+class OrderBatch:
+    """
+    array-backed batch of orders, each line field is an `array` column instead of a dict per line.
+    `batch[i]` is an order view with same accessors as Order, so it works with `Bakery.process_order`,
+    `Bakery.process_orders` and `main.print_result`
+    """
+
+    __slots__ = (
+        "codes",
+        "_code_index",
+        "_order_starts",
+        "line_codes",
+        "quantities",
+        "remainders",
+        "pack_counts",
+        "prices",
+        "optimal",
+        "_pack_starts",
+        "_pack_lengths",
+        "_pack_sizes",
+        "_pack_amounts",
+        "_dead_packs",
+    )
+
+    def __init__(self, orders=()):
+        """
+        :param orders: iterable of dict of product code and quantity
+        """
+        self.codes = []  # code index -> product code
+        self._code_index = {}  # product code -> code index
+        self._order_starts = array("q", [0])  # first line of each order, plus end of the last one
+
+        # line columns
+        self.line_codes = array("l")
+        self.quantities = array("q")
+        self.remainders = array("q")
+        self.pack_counts = array("q")  # total packs amount
+        self.prices = []  # total price in cents, a list as it can be over int64 for huge quantities
+        self.optimal = bytearray()  # 0 if breakdown is not proven best
+        self._pack_starts = array("q")  # first item of line's breakdown in pack columns
+        self._pack_lengths = array("l")  # pack sizes in line's breakdown, -1 if not broken down
+
+        # pack columns, breakdown of all lines
+        self._pack_sizes = array("q")
+        self._pack_amounts = array("q")
+        self._dead_packs = 0  # items of pack columns no line refers to any more
+
+        for order_dict in orders:
+            self.add_order(order_dict)
+
+    def add_order(self, order_dict):
+        """
+        :param order_dict: dict of product code and quantity
+        :return: index of the order
+        """
+        for code, quantity in order_dict.items():
+            if code not in self._code_index:
+                self._code_index[code] = len(self.codes)
+                self.codes.append(code)
+            self.line_codes.append(self._code_index[code])
+            self.quantities.append(to_quantity(quantity))
+            self.remainders.append(0)
+            self.pack_counts.append(0)
+            self.prices.append(0)
+            self.optimal.append(0)
+            self._pack_starts.append(0)
+            self._pack_lengths.append(-1)
+        self._order_starts.append(len(self.line_codes))
+        return len(self) - 1
+
+    def __len__(self):
+        return len(self._order_starts) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("order index out of range")
+        return BatchOrder(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield BatchOrder(self, index)
+
+    def find_line(self, index, code):
+        """
+        :return: line number of product code in order of index, raise error if not exist
+        """
+        code_index = self._code_index.get(code)
+        for line in range(self._order_starts[index], self._order_starts[index + 1]):
+            if self.line_codes[line] == code_index:
+                return line
+        raise KeyError(f"{code} is not in this order.")
+
+    def get_packs(self, line):
+        """
+        :return: breakdown dict of line, empty if not broken down
+        """
+        start = self._pack_starts[line]
+        end = start + max(self._pack_lengths[line], 0)
+        return dict(zip(self._pack_sizes[start:end], self._pack_amounts[start:end]))
+
+    def set_break_down(self, line, packs, remainder, total_price, optimal=True):
+        # converted before any column is changed, so an invalid price leaves the line as it was
+        cents = int(Decimal(total_price).scaleb(PRICE_DECIMAL_PLACES))
+        length = max(self._pack_lengths[line], 0)
+        if len(packs) <= length:
+            # solved again, overwrite old breakdown in place
+            start = self._pack_starts[line]
+            self._pack_sizes[start : start + len(packs)] = array("q", packs.keys())
+            self._pack_amounts[start : start + len(packs)] = array("q", packs.values())
+        else:
+            start = len(self._pack_sizes)
+            self._pack_sizes.extend(packs.keys())
+            self._pack_amounts.extend(packs.values())
+        self._dead_packs += length - min(len(packs), length)
+        self._pack_starts[line] = start
+        self._pack_lengths[line] = len(packs)
+        if self._dead_packs * 2 > len(self._pack_sizes):
+            self._compact()
+        self.pack_counts[line] = sum(packs.values())
+        self.remainders[line] = remainder
+        self.prices[line] = cents
+        self.optimal[line] = bool(optimal)
+
+    def _compact(self):
+        """
+        drop pack items no line refers to, so solving lines again never grows pack columns for long
+        """
+        sizes, amounts = array("q"), array("q")
+        for line, length in enumerate(self._pack_lengths):
+            start = self._pack_starts[line]
+            self._pack_starts[line] = len(sizes)
+            if length > 0:
+                sizes.extend(self._pack_sizes[start : start + length])
+                amounts.extend(self._pack_amounts[start : start + length])
+        self._pack_sizes, self._pack_amounts = sizes, amounts
+        self._dead_packs = 0
+
+    def is_broken_down(self, line):
+        return self._pack_lengths[line] >= 0
+
+
+class BatchLine(LineAccessMixin):
+    """
+    view of a line in OrderBatch
+    """
+
+    __slots__ = ("_batch", "_line")
+
+    def __init__(self, batch, line):
+        self._batch = batch
+        self._line = line
+
+    @property
+    def quantity(self):
+        return self._batch.quantities[self._line]
+
+    @property
+    def packs(self):
+        return self._batch.get_packs(self._line)
+
+    @property
+    def remainder(self):
+        if not self._batch.is_broken_down(self._line):
+            return None
+        return self._batch.remainders[self._line]
+
+    @property
+    def total_price(self):
+        if not self._batch.is_broken_down(self._line):
+            return None
+        return self._batch.prices[self._line] * PRICE_DECIMAL_UNIT
+
+    @property
+    def optimal(self):
+        if not self._batch.is_broken_down(self._line):
+            return None
+        return bool(self._batch.optimal[self._line])
+
+
+class BatchOrder:
+    """
+    view of an order in OrderBatch, same accessors as Order
+    """
+
+    __slots__ = ("_batch", "_index")
+
+    def __init__(self, batch, index):
+        self._batch = batch
+        self._index = index
+
+    @property
+    def total_price(self):
+        return None
+
+    @property
+    def products(self):
+        batch = self._batch
+        lines = range(batch._order_starts[self._index], batch._order_starts[self._index + 1])
+        return dict((batch.codes[batch.line_codes[line]], BatchLine(batch, line)) for line in lines)
+
+    def get_product(self, code):
+        return BatchLine(self._batch, self._batch.find_line(self._index, code))
+
+    def set_product_break_down(self, product_code, packs, remainder, total_price, optimal=True):
+        line = self._batch.find_line(self._index, product_code)
+        self._batch.set_break_down(line, packs, remainder, total_price, optimal)
@@ -1,13 +1,124 @@
 import logging
+import time
 from decimal import Decimal, ROUND_DOWN
 
-from config import PRICE_DECIMAL_UNIT
-from helper import PackBreaker
+from cache import breakdown_cache
+from config import PRICE_DECIMAL_PLACES, PRICE_DECIMAL_UNIT, STOCK_NODE_BUDGET
+from helper import (
+    PRICING_PACKS,
+    PackBreaker,
+    bounded_breakdown,
+    find_pack_table,
+    get_extended_pack_table,
+    get_greedy_threshold,
+    get_pack_solver,
+    get_reach_set,
+    get_table_key,
+    greedy_breakdown,
+    is_short,
+    key_breakdown,
+)
 
 logger = logging.getLogger(__name__)
 
+# how `pack_order` solved a quantity
+PATH_GREEDY = "greedy"  # greedy is proven best for the quantity, O(number of sizes)
+PATH_TABLE = "table"  # shared breakdown cache or pack table
+PATH_STOCK = "stock"  # short of stock, bounded solver, searched as PATH_SEARCH if short stock is too large for it
+PATH_SEARCH = "search"  # anytime search of `pack_order_anytime`, may stop before proven best
+
+
+def to_quantity(quantity):
+    """convert order quantity to int, raise error if invalid"""
+    try:
+        return int(quantity)
+    except:
+        raise Exception("invalid quantity, should be int")
+
+
+def report_solve(path, quantity, start, nodes_visited=0):
+    """
+    call `PackBreaker.hooks` with stats of a product solve, the path taken is reported as its engine
+    :param start: perf_counter time the solve started
+    """
+    stats = {
+        "event": "solve",
+        "engine": path,
+        "quantity": quantity,
+        "nodes_visited": nodes_visited,
+        "wall_time": time.perf_counter() - start,
+    }
+    for hook in list(PackBreaker.hooks):
+        hook(stats)
+
+
+def to_price(price):
+    """convert price to Decimal with PRICE_DECIMAL_PLACES, simply ignore more digits, 1.999 -> 1.99"""
+    return Decimal(str(price)).quantize(PRICE_DECIMAL_UNIT, rounding=ROUND_DOWN)
+
+
+class PackCatalogue:
+    """
+    pack sizes and prices of a product, never changed after created. product replaces it as a whole on change,
+    so an in-flight order always works on one consistent catalogue
+    """
+
+    __slots__ = ("packs", "pack_sizes", "pack_cents", "table_keys", "pack_tables", "greedy_from", "reach_set")
+
+    def __init__(self, packs, pack_tables=None):
+        """
+        :param packs: dict of pack size and Decimal price
+        :param pack_tables: dict of pricing and PackTable (or ResidueTable) still valid for these packs
+        """
+        self.packs = packs
+        self.pack_cents = dict((size, int(price.scaleb(PRICE_DECIMAL_PLACES))) for size, price in packs.items())
+        # sort once, pack sizes are read on every order
+        self.pack_sizes = tuple(sorted(packs, reverse=True))
+        self.table_keys = {}  # pricing -> table key
+        self.pack_tables = dict(pack_tables or {})  # pricing -> PackTable or ResidueTable
+        # greedy breakdown is proven best from this quantity on, None if never
+        self.greedy_from = get_greedy_threshold(self.pack_sizes)
+        self.reach_set = None  # shared ReachSet of pack sizes, got on first query
+
+    def get_reach_set(self):
+        if self.reach_set is None:
+            self.reach_set = get_reach_set(self.pack_sizes)
+        return self.reach_set
+
+    def table_key(self, pricing=PRICING_PACKS):
+        key = self.table_keys.get(pricing)
+        if key is None:
+            cents = [self.pack_cents[size] for size in self.pack_sizes]
+            key = self.table_keys.setdefault(pricing, get_table_key(self.pack_sizes, cents, pricing))
+        return key
+
+    def get_pack_table(self, pricing=PRICING_PACKS):
+        table = self.pack_tables.get(pricing)
+        if table is None:
+            table = self.pack_tables.setdefault(pricing, get_pack_solver(*self.table_key(pricing)))
+        return table
+
+    def breakdown(self, quantity, pricing=PRICING_PACKS):
+        """
+        best breakdown by the table of pricing, a small quantity is solved without building the table
+        """
+        table = self.pack_tables.get(pricing)
+        if table is None:
+            return key_breakdown(self.table_key(pricing), quantity)
+        return table.breakdown(quantity)
+
+    def get_total_price(self, order_dict):
+        total_price = 0
+        for pack_size, pack_amount in order_dict.items():
+            # invalid pack size, skip
+            if pack_size in self.packs:
+                total_price += self.packs[pack_size] * pack_amount
+        return total_price
+
 
 class Product:
+    __slots__ = ("_name", "_code", "_catalogue")
+
     def __init__(self, name, code, pack_price_dict):
         """
         :param name: name of product
@@ -16,23 +127,22 @@ class Product:
         """
         self._name = str(name)
         self._code = str(code)
-        self._packs = {}
+        packs = {}
 
         # init pack quantity and price
         for quantity, price in pack_price_dict.items():
             try:
-                # simply ignore more digits, 1.999 -> 1.99
-                self._packs[int(quantity)] = Decimal(str(price)).quantize(
-                    PRICE_DECIMAL_UNIT, rounding=ROUND_DOWN
-                )
+                packs[int(quantity)] = to_price(price)
             except:
                 # skip invalid input, quantity must be int, price must be decimal
                 pass
 
+        self._catalogue = PackCatalogue(packs)
+
     # expose as property to make sure immutable from outside
     @property
     def packs(self):
-        return self._packs
+        return self._catalogue.packs
 
     @property
     def name(self):
@@ -44,61 +154,245 @@ class Product:
 
     @property
     def pack_sizes(self):
-        """quantity list of available packs with descending sort"""
-        quantity_options = list(self._packs.keys())
-        quantity_options.sort(reverse=True)
-        return quantity_options
+        """immutable quantity tuple of available packs with descending sort"""
+        return self._catalogue.pack_sizes
+
+    @property
+    def greedy_from(self):
+        """min quantity greedy breakdown is proven best from, 0 for all quantities, None if never"""
+        return self._catalogue.greedy_from
+
+    @property
+    def catalogue(self):
+        """current PackCatalogue, keep it to work on a consistent snapshot"""
+        return self._catalogue
+
+    def table_key(self, pricing=PRICING_PACKS):
+        """key of the PackTable solving this product, products with same key share one table"""
+        return self._catalogue.table_key(pricing)
+
+    def get_pack_table(self, pricing=PRICING_PACKS):
+        """precomputed PackTable of this product, or ResidueTable if the pack sizes are too large, built on first use"""
+        return self._catalogue.get_pack_table(pricing)
+
+    def add_pack(self, size, price):
+        """
+        add a pack size, or change its price if exists. pack table of `packs` pricing mode is extended
+        incrementally if already built, instead of rebuilt
+        """
+        try:
+            size, price = int(size), to_price(price)
+        except:
+            raise Exception("invalid pack, quantity must be int, price must be decimal")
+        if size <= 0:
+            raise Exception("invalid pack, quantity must be positive")
+        if size in self._catalogue.packs:
+            self.set_pack_price(size, price)
+            return
+
+        catalogue = self._catalogue
+        packs = dict(catalogue.packs)
+        packs[size] = price
+        pack_tables = {}
+        if PRICING_PACKS in catalogue.pack_tables:
+            pack_tables[PRICING_PACKS] = get_extended_pack_table(catalogue.pack_tables[PRICING_PACKS], size)
+        self._catalogue = PackCatalogue(packs, pack_tables)
+
+    def remove_pack(self, size):
+        """
+        remove a pack size, raise error if not exist. pack tables are rebuilt on next use
+        """
+        if size not in self._catalogue.packs:
+            raise KeyError(f"{size} is not in {self.code}'s pack options")
+        packs = dict(self._catalogue.packs)
+        del packs[size]
+        self._catalogue = PackCatalogue(packs)
+
+    def set_pack_price(self, size, price):
+        """
+        change price of a pack size, raise error if not exist. pack table of `packs` pricing mode is kept as it is
+        """
+        if size not in self._catalogue.packs:
+            raise KeyError(f"{size} is not in {self.code}'s pack options")
+        catalogue = self._catalogue
+        packs = dict(catalogue.packs)
+        packs[size] = to_price(price)
+        pack_tables = {}
+        if PRICING_PACKS in catalogue.pack_tables:
+            # counts do not depend on price
+            pack_tables[PRICING_PACKS] = catalogue.pack_tables[PRICING_PACKS]
+        self._catalogue = PackCatalogue(packs, pack_tables)
 
     def get_pack_price(self, quantity):
         """
         :param quantity: pack quantity
         :return: price for specified quantity pack, raise error if not exist
         """
-        if quantity not in self._packs:
+        if quantity not in self._catalogue.packs:
             raise KeyError(f"{quantity} is not in {self.code}'s pack options")
-        return self._packs[quantity]
+        return self._catalogue.packs[quantity]
 
     def get_total_price(self, order_dict):
         """
         :param order_dict: pack size and amount
         :return: total price
         """
-        total_price = 0
-        for pack_size, pack_amount in order_dict.items():
-            # invalid pack size, skip
-            if pack_size in self._packs:
-                total_price += self.get_pack_price(pack_size) * pack_amount
+        return self._catalogue.get_total_price(order_dict)
 
-        return total_price
-
-    def _quick_pack(self, quantity):
+    def _quick_pack(self, quantity, catalogue=None):
         """
         most greedy way to match the order, so if perfect match exist it will get quick response
         :param quantity:
-        :return: dict of pack size, pack amount and total price
-        """
-        result = {}
-        rest = quantity
-        for i in self.pack_sizes:
-            pack_amount, rest = int(rest / i), rest % i
-            result[i] = pack_amount
-            if rest == 0:
-                break
-        return result, rest
-
-    def pack_order(self, quantity):
-        """return pack match as dict and remainder"""
-        try:
-            quantity = int(quantity)
-        except:
-            raise Exception("invalid quantity, should be int")
+        :param catalogue: catalogue to use, current one if None
+        :return: dict of pack size and pack amount, rest quantity
+        """
+        return greedy_breakdown(quantity, (catalogue or self._catalogue).pack_sizes)
+
+    def _greedy_covers(self, quantity, pricing, catalogue):
+        """
+        :return: True if greedy breakdown is proven best for quantity, price is not compared by greedy
+        """
+        greedy_from = catalogue.greedy_from
+        return pricing == PRICING_PACKS and greedy_from is not None and quantity >= max(greedy_from, 1)
+
+    def _pack_short(self, quantity, pricing, stock, catalogue, time_budget=None, node_budget=None):
+        """
+        solve a quantity short of stock of some sizes by the bounded solver. if short stock is too large for it,
+        searched within the budgets instead, STOCK_NODE_BUDGET nodes if no budget is given
+        :return: pack match as dict, remainder, True if proven optimal, path and search nodes visited
+        """
+        pack_sizes, prices, pricing = catalogue.table_key(pricing)
+        cents = [catalogue.pack_cents[size] for size in pack_sizes]
+        result = bounded_breakdown(quantity, pack_sizes, stock, cents, pricing)
+        if result is not None:
+            return result[0], result[1], True, PATH_STOCK, 0
+
+        if time_budget is None and node_budget is None:
+            node_budget = STOCK_NODE_BUDGET
+        breaker = PackBreaker(quantity, pack_sizes)
+        pack_dict, remainder, proven = breaker.solve_anytime(time_budget, node_budget, stock=stock)
+        # search only compares packs amount
+        return pack_dict, remainder, proven and pricing == PRICING_PACKS, PATH_SEARCH, breaker.nodes_visited
+
+    def pack_order_anytime(self, quantity, time_budget=None, node_budget=None, pricing=PRICING_PACKS, stock=None):
+        """
+        same as `pack_order` but bounded, for latency sensitive callers. answered by the pack table if already built,
+        otherwise searched from the greedy breakdown until the budget runs out
+        :param time_budget: max seconds, no limit if None
+        :param node_budget: max search nodes, no limit if None
+        :param pricing: pricing mode, price is only compared if the pack table is built
+        :param stock: dict of pack size and packs available, size not in it is unlimited. not changed here
+        :return: pack match as dict, remainder, total price and True if proven optimal
+        """
+        return self.pack_order_anytime_with_path(quantity, time_budget, node_budget, pricing, stock)[:4]
+
+    def pack_order_anytime_with_path(
+        self, quantity, time_budget=None, node_budget=None, pricing=PRICING_PACKS, stock=None
+    ):
+        """
+        same as `pack_order_anytime`, plus the path it was solved by, PATH_SEARCH if searched
+        :return: pack match as dict, remainder, total price, True if proven optimal and path
+        """
+        quantity = to_quantity(quantity)
+        catalogue = self._catalogue
+        if is_short(quantity, catalogue.pack_sizes, stock):
+            start = time.perf_counter() if PackBreaker.hooks else None
+            pack_dict, remainder, proven, path, nodes_visited = self._pack_short(
+                quantity, pricing, stock, catalogue, time_budget, node_budget
+            )
+            if start is not None:
+                report_solve(path, quantity, start, nodes_visited)
+            return pack_dict, remainder, catalogue.get_total_price(pack_dict), proven, path
+
+        if (
+            self._greedy_covers(quantity, pricing, catalogue)
+            or pricing in catalogue.pack_tables
+            or find_pack_table(*catalogue.table_key(pricing)) is not None
+        ):
+            pack_dict, remainder, total_price, path = self.pack_order_with_path(quantity, pricing)
+            return pack_dict, remainder, total_price, True, path
+
+        start = time.perf_counter() if PackBreaker.hooks else None
+        initial = self._quick_pack(quantity, catalogue)[0]
+        breaker = PackBreaker(quantity, catalogue.pack_sizes)
+        pack_dict, remainder, proven = breaker.solve_anytime(time_budget, node_budget, initial)
+        # search only compares packs amount
+        proven = proven and pricing == PRICING_PACKS
+        if start is not None:
+            report_solve(PATH_SEARCH, quantity, start, breaker.nodes_visited)
+        return pack_dict, remainder, catalogue.get_total_price(pack_dict), proven, PATH_SEARCH
+
+    def quote_range(self, start, stop, pricing=PRICING_PACKS):
+        """
+        quote every quantity from start to stop - 1 in one incremental sweep, much faster than `pack_order` of each.
+        results are streamed, not kept, and the breakdown cache is not touched
+        :param pricing: pricing mode, if compare price of breakdowns
+        :return: generator of (quantity, pack match as dict, remainder, total price), same as `pack_order`
+        """
+        start, stop = to_quantity(start), to_quantity(stop)
+        catalogue = self._catalogue
+        for quantity, pack_dict, remainder in catalogue.get_pack_table(pricing).iter_breakdowns(start, stop):
+            yield quantity, pack_dict, remainder, catalogue.get_total_price(pack_dict)
+
+    def can_fulfill(self, quantity):
+        """
+        if quantity can be packed with no remainder, nothing is solved and no breakdown is built
+        """
+        return self._catalogue.get_reach_set().can_fill(to_quantity(quantity))
+
+    def min_remainder(self, quantity):
+        """
+        least remainder of quantity, same as remainder of `pack_order` in any pricing mode without stock,
+        nothing is solved and no breakdown is built
+        """
+        return self._catalogue.get_reach_set().min_remainder(to_quantity(quantity))
+
+    def pack_order(self, quantity, pricing=PRICING_PACKS, stock=None):
+        """
+        :param quantity: order quantity
+        :param pricing: pricing mode, if compare price of breakdowns
+        :param stock: dict of pack size and packs available, size not in it is unlimited. not changed here
+        :return: pack match as dict, remainder and total price
+        """
+        return self.pack_order_with_path(quantity, pricing, stock)[:3]
+
+    def pack_order_with_path(self, quantity, pricing=PRICING_PACKS, stock=None):
+        """
+        same as `pack_order`, plus the path it was solved by, PATH_GREEDY, PATH_TABLE or PATH_STOCK.
+        returned instead of kept on the product, so concurrent orders never see each other's path.
+        short stock too large for the bounded solver is searched within STOCK_NODE_BUDGET nodes, PATH_SEARCH,
+        use `pack_order_anytime` to know if it was proven best
+        :return: pack match as dict, remainder, total price and path
+        """
+        quantity = to_quantity(quantity)
+        start = time.perf_counter() if PackBreaker.hooks else None
+        # one catalogue for the whole order, even if packs are changed meanwhile
+        catalogue = self._catalogue
+        nodes_visited = 0
 
-        # self.pack_sizes is in descending sort, so prior to put large size pack in
-        breaker = PackBreaker(quantity, self.pack_sizes)
-        pack_dict, remainder=breaker.solve()
+        pack_sizes, prices, pricing = catalogue.table_key(pricing)
+        if is_short(quantity, pack_sizes, stock):
+            # short of some packs, depends on stock so not cached
+            pack_dict, remainder, proven, path, nodes_visited = self._pack_short(quantity, pricing, stock, catalogue)
+        elif self._greedy_covers(quantity, pricing, catalogue):
+            # same breakdown as the table, no table or cache needed
+            path = PATH_GREEDY
+            pack_dict, remainder = self._quick_pack(quantity, catalogue)
+        else:
+            path = PATH_TABLE
+            # constant time for any quantity, same result as PackBreaker.solve in `packs` pricing mode
+            # repeated pack sizes and quantity are served from the shared cache
+            pack_dict, remainder = breakdown_cache.get_or_solve(
+                pack_sizes,
+                quantity,
+                lambda: catalogue.breakdown(quantity, pricing),
+                variant=(prices, pricing),
+            )
 
         # remove pack size if amount == 0, pack_dict can be empty dict
         if pack_dict:
             pack_dict = dict([x for x in pack_dict.items() if x[1]])
 
-        return pack_dict, remainder, self.get_total_price(pack_dict)
+        if start is not None:
+            report_solve(path, quantity, start, nodes_visited)
+        return pack_dict, remainder, catalogue.get_total_price(pack_dict), path
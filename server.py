@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from benchmark import percentile
+from cache import breakdown_cache
+from config import SERVICE_QUEUE_SIZE, SERVICE_WORKERS
+from main import default_bakery
+from models.bakery import Bakery, report_order, take_stock
+from models.order import Order
+from models.product import to_quantity
+from stream import format_result, read_orders
+
+logger = logging.getLogger(__name__)
+
+# bakery of a worker process of a process pool, lines are solved by it instead of sending the bakery with each line
+_worker_bakery = None
+
+
+def attach_bakery_worker(keys, prefix):
+    """
+    process pool initializer, attach shared pack tables and build the bakery of this worker
+    :param keys: table keys published by `SharedTables.publish_bakery`
+    :param prefix: name prefix of the shared memory segments
+    """
+    global _worker_bakery
+    # shared memory needs Python 3.8 or above, only imported when used
+    from shared_tables import attach_worker
+
+    attach_worker(keys, prefix)
+    _worker_bakery = default_bakery()
+
+
+def pack_line_work_item(product_code, quantity, stock, end, node_budget):
+    """
+    solve an order line by the bakery of this worker process, top level so process pool can pickle it
+    :return: same as `Bakery._pack_line`
+    """
+    return _worker_bakery._pack_line(_worker_bakery.get_product(product_code), quantity, stock, end, node_budget)
+
+
+class OrderService:
+    """
+    asyncio order service, a JSON object per line over TCP, same request and response format as `main.py --stream`.
+    order lines are solved by `Bakery._pack_line` in an executor, so results, paths and `Bakery.hooks` stats are same as
+    `Bakery.process_order`. concurrent lines of same catalogue and quantity share one solve,
+    pending requests are bounded by a queue so readers stop reading when it is full.
+    """
+
+    def __init__(self, bakery, executor=None, queue_size=SERVICE_QUEUE_SIZE, workers=SERVICE_WORKERS):
+        """
+        :param bakery: bakery object
+        :param executor: executor to run solves, default executor of the loop if None.
+                         a process pool must be initialized by `attach_bakery_worker`
+        :param queue_size: max pending requests
+        :param workers: max orders processed at a time
+        """
+        self.bakery = bakery
+        self.executor = executor
+        self.queue_size = queue_size
+        self.workers = workers
+        self._queue = None  # created on start, within the running loop
+        self._worker_tasks = []
+        self._in_flight = {}  # (catalogue, quantity, node budget) -> future of the solve
+
+        self.solves = 0
+        self.coalesced = 0
+
+    async def solve(self, product, quantity, stock=None, end=None, node_budget=None):
+        """
+        :param product: product of the bakery
+        :param stock: dict of pack size and packs available of the product, not changed here
+        :param end: perf_counter time to stop searching, no limit if None
+        :return: same as `Bakery._pack_line` with a copy of the breakdown dict. a line without stock or end
+                 joins the in-flight solve of same catalogue, quantity and node budget if one exists
+        """
+        key = None if stock or end is not None else (product.catalogue, quantity, node_budget)
+        future = self._in_flight.get(key) if key is not None else None
+        if future is None:
+            self.solves += 1
+            if isinstance(self.executor, ProcessPoolExecutor):
+                # the bakery is not sent to worker processes, each one solves by its own
+                call = partial(pack_line_work_item, product.code, quantity, stock, end, node_budget)
+            else:
+                call = partial(self.bakery._pack_line, product, quantity, stock, end, node_budget)
+            future = asyncio.get_running_loop().run_in_executor(self.executor, call)
+            if key is not None:
+                self._in_flight[key] = future
+                future.add_done_callback(lambda done: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # shield, a cancelled waiter should not cancel the solve shared with others
+        packs, remainder, total_price, optimal, path = await asyncio.shield(future)
+        return dict(packs), remainder, total_price, optimal, path
+
+    async def process_order(self, order, stock=None, deadline=None, node_budget=None):
+        """
+        same as `Bakery.process_order` with an executor, lines are awaited off the event loop
+        """
+        bakery = self.bakery
+        if Bakery.hooks:
+            start = time.perf_counter()
+            hits, misses = breakdown_cache.hits, breakdown_cache.misses
+        end = time.perf_counter() + deadline if deadline is not None else None
+
+        skipped_lines = 0
+        lines = []  # (product code, product, quantity, stock of product)
+        for product_code, order_product in order.products.items():
+            if not bakery.has_product(product_code):
+                # skip invalid product code
+                skipped_lines += 1
+                continue
+            quantity = to_quantity(order_product.get("quantity"))
+            product_stock = stock.get(product_code) if stock else None
+            lines.append((product_code, bakery.get_product(product_code), quantity, product_stock))
+
+        # lines of different products never share stock, all are solved at once
+        solves = []
+        for product_code, product, quantity, product_stock in lines:
+            solves.append(self.solve(product, quantity, product_stock, end, node_budget))
+        results = await asyncio.gather(*solves)
+        unproven_lines = 0
+        paths = []  # path each line was solved by, in order of lines
+        for (product_code, product, quantity, product_stock), result in zip(lines, results):
+            packs, remainder, total_price, optimal, path = result
+            order.set_product_break_down(product_code, packs, remainder, total_price, optimal)
+            take_stock(product_stock, packs)
+            unproven_lines += not optimal
+            paths.append(path)
+
+        if Bakery.hooks:
+            report_order(order, skipped_lines, unproven_lines, paths, start, hits, misses)
+        return order
+
+    async def _worker(self):
+        while True:
+            line, response = await self._queue.get()
+            order_id = None
+            try:
+                order_id, order_dict, error = next(read_orders([line]), (None, None, "empty request"))
+                if error is None:
+                    order = await self.process_order(Order(order_dict))
+                    result = format_result(order_id, order)
+                else:
+                    result = json.dumps({"id": order_id, "error": error})
+            except Exception as e:
+                result = json.dumps({"id": order_id, "error": str(e)})
+            finally:
+                self._queue.task_done()
+            if not response.done():
+                response.set_result(result)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = asyncio.get_running_loop().create_future()
+                # backpressure, wait here when queue is full
+                await self._queue.put((line.decode(), response))
+                writer.write((await response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """
+        :return: started asyncio server
+        """
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._worker_tasks = [asyncio.ensure_future(self._worker()) for i in range(self.workers)]
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def stop(self, server):
+        server.close()
+        await server.wait_closed()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+
+
+async def run_load(host, port, order_dicts, concurrency=50):
+    """
+    local load client, send orders over `concurrency` connections
+    :return: dict of requests, errors, elapsed seconds, requests per second and p50 / p99 latency in ms
+    """
+    pending = list(reversed(order_dicts))
+    latencies = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        while pending:
+            order_dict = pending.pop()
+            start = time.perf_counter()
+            writer.write(json.dumps(order_dict).encode() + b"\n")
+            await writer.drain()
+            if "error" in json.loads(await reader.readline()):
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) if latencies else 0.0,
+        "p99_ms": percentile(latencies, 99) if latencies else 0.0,
+    }
+
+
+async def serve(host, port, processes):
+    bakery = default_bakery()
+    shared_tables = None
+    if processes:
+        # shared memory needs Python 3.8 or above, only imported when used
+        from shared_tables import SharedTables
+
+        # tables are built once here, workers attach to them
+        shared_tables = SharedTables()
+        keys = shared_tables.publish_bakery(bakery)
+        executor = ProcessPoolExecutor(initializer=attach_bakery_worker, initargs=(keys, shared_tables.prefix))
+    else:
+        executor = ThreadPoolExecutor()
+    service = OrderService(bakery, executor=executor)
+    server = await service.start(host, port)
+    logger.info(f"serving on {host}:{port}")
+    try:
+        await server.serve_forever()
+    finally:
+        await service.stop(server)
+        executor.shutdown()
+        if shared_tables is not None:
+            shared_tables.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rubix bakery order service")
+    parser.add_argument("command", choices=("serve", "load"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--processes", action="store_true", help="serve: solve on a process pool instead of threads")
+    parser.add_argument("--requests", type=int, default=1000, help="load: total requests")
+    parser.add_argument("--concurrency", type=int, default=50, help="load: concurrent connections")
+    parser.add_argument("--max-quantity", type=int, default=100, help="load: max random quantity")
+    parser.add_argument("--seed", type=int, default=0, help="load: seed of random orders")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(serve(args.host, args.port, args.processes))
+    else:
+        rng = random.Random(args.seed)
+        codes = list(default_bakery().products)
+        orders = [
+            {code: rng.randrange(1, args.max_quantity) for code in codes}
+            for i in range(args.requests)
+        ]
+        summary = asyncio.run(run_load(args.host, args.port, orders, args.concurrency))
+        print(
+            f"{summary['requests']} requests, {summary['errors']} errors in {summary['elapsed']:.3f}s, "
+            f"{summary['requests_per_second']:.1f} req/s, p50 {summary['p50_ms']:.2f}ms, p99 {summary['p99_ms']:.2f}ms"
+        )
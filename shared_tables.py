@@ -0,0 +1,164 @@
+import hashlib
+import logging
+import os
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+from config import SHARED_TABLE_PREFIX, TABLE_SIZE_LIMIT
+from helper import PackTable, find_pack_table, get_table_period, register_pack_table, unregister_pack_table
+from table_file import key_bytes, read_table_buffer, table_bytes
+
+logger = logging.getLogger(__name__)
+
+
+def shared_table_name(key, prefix=SHARED_TABLE_PREFIX):
+    """
+    segment name of a table key, short enough for every platform
+    """
+    return prefix + hashlib.sha256(key_bytes(key)).hexdigest()[:20]
+
+
+# segments closed while a table on them was still in use, mapped until process exit
+_in_use = []
+
+# names of segments created by this process, tracked by its own resource tracker
+_created = set()
+
+
+class SharedTables:
+    """
+    pack tables in `multiprocessing.shared_memory`, same layout as table files.
+    one process `publish`es tables it builds, workers `attach` to them read-only and lookups are zero-copy views
+    of the shared pages, so memory of workers stays flat. tables are registered as the shared PackTable of their key,
+    `Product.pack_order` uses them without any change. `close` releases all, the publisher also removes the segments.
+    needs Python 3.8 or above
+    """
+
+    def __init__(self, prefix=SHARED_TABLE_PREFIX, shared_tracker=False):
+        """
+        :param prefix: name prefix of segments
+        :param shared_tracker: True in worker processes started by the publisher, they share its resource tracker
+        """
+        self.prefix = prefix
+        self.shared_tracker = shared_tracker
+        self._segments = {}  # table key -> (SharedMemory, PackTable, True if created here)
+
+    def publish(self, key):
+        """
+        build a table into a new segment, or reuse the segment if already published
+        :param key: table key, see `helper.get_table_key`
+        :return: PackTable on the segment, None if it would be over TABLE_SIZE_LIMIT entries
+        """
+        if key in self._segments:
+            return self._segments[key][1]
+        table = self.attach(key)
+        if table is not None:
+            return table
+
+        built = find_pack_table(*key)
+        if built is None and get_table_period(*key)[2] > TABLE_SIZE_LIMIT:
+            # each worker solves it by its own ResidueTable, O(largest size) entries
+            logger.info(f"shared table {shared_table_name(key, self.prefix)} is too large, not published")
+            return None
+        built = built or PackTable(*key)
+        data = table_bytes(key, (built.packs, built.choice, built.filled))
+        name = shared_table_name(key, self.prefix)
+        try:
+            segment = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+        except FileExistsError:
+            # stale segment of a crashed publisher
+            logger.warning(f"replace stale shared table {name}")
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            segment = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+        segment.buf[: len(data)] = data
+        _created.add(segment.name)
+        return self._register(key, segment, created=True)
+
+    def attach(self, key):
+        """
+        :param key: table key, see `helper.get_table_key`
+        :return: read-only PackTable on the published segment, None if not published or invalid
+        """
+        if key in self._segments:
+            return self._segments[key][1]
+        name = shared_table_name(key, self.prefix)
+        try:
+            if sys.version_info >= (3, 13):
+                # only the publisher removes the segment
+                segment = shared_memory.SharedMemory(name=name, track=False)
+            else:
+                segment = shared_memory.SharedMemory(name=name)
+                if os.name == "posix" and not self.shared_tracker and name not in _created:
+                    # before 3.13 every attach is tracked and the tracker removes the segment at exit of this process
+                    # (bpo-39959), so it is untracked again by its tracked name with leading slash.
+                    # the publisher and its workers share one tracker, the publisher's entry is kept there
+                    resource_tracker.unregister("/" + segment.name, "shared_memory")
+        except FileNotFoundError:
+            return None
+        return self._register(key, segment, created=False)
+
+    def _register(self, key, segment, created):
+        view = segment.buf.toreadonly()
+        columns = read_table_buffer(view, key, get_table_period(*key)[2], segment.name, exact_size=False)
+        if columns is None:
+            view.release()
+            segment.close()
+            return None
+        table = PackTable(*key, columns=columns)
+        self._segments[key] = (segment, table, created)
+        register_pack_table(table)
+        return table
+
+    def publish_bakery(self, bakery):
+        """
+        publish tables of all products of bakery in its pricing mode
+        :return: list of table keys, for workers to attach
+        """
+        keys = sorted(set(product.table_key(bakery.pricing) for product in bakery.products.values()), key=str)
+        for key in keys:
+            self.publish(key)
+        return keys
+
+    def close(self):
+        """
+        release all segments, tables are no longer shared. a segment still viewed by a product or order
+        is left for process exit
+        """
+        for key in list(self._segments):
+            segment, table, created = self._segments.pop(key)
+            unregister_pack_table(table)
+            del table
+            try:
+                segment.close()
+            except BufferError:
+                logger.info(f"shared table {segment.name} is still in use")
+                _in_use.append(segment)
+            if created:
+                segment.unlink()
+                _created.discard(segment.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._segments)
+
+
+# tables attached by this worker process
+worker_tables = None
+
+
+def attach_worker(keys, prefix=SHARED_TABLE_PREFIX):
+    """
+    initializer of a worker process started by the publisher, attach to published tables of keys
+    """
+    global worker_tables
+    worker_tables = SharedTables(prefix, shared_tracker=True)
+    for key in keys:
+        if worker_tables.attach(key) is None:
+            logger.warning(f"shared table {shared_table_name(key, prefix)} not published, built by worker")
@@ -0,0 +1,113 @@
+import csv
+import json
+import logging
+import sys
+import time
+
+from models.order import Order
+from models.product import to_quantity
+
+logger = logging.getLogger(__name__)
+
+FORMAT_JSONL = "jsonl"
+FORMAT_CSV = "csv"
+FORMATS = (FORMAT_JSONL, FORMAT_CSV)
+
+
+def guess_format(path):
+    """
+    guess input format by file extension, JSON Lines by default
+    """
+    if path and path.lower().endswith(".csv"):
+        return FORMAT_CSV
+    return FORMAT_JSONL
+
+
+def read_orders(lines, input_format=FORMAT_JSONL):
+    """
+    lazily parse orders from an iterable of text lines, nothing is loaded whole.
+
+    JSON Lines: one object per line, either `{"VS5": 10, "CF": 13}` or `{"id": 1, "products": {"VS5": 10}}`
+    CSV: header row with an optional `id` column, other columns are product codes, empty cell is skipped
+    :return: generator of (order id, order dict or None, error message or None)
+    """
+    if input_format == FORMAT_CSV:
+        for index, row in enumerate(csv.DictReader(lines), start=1):
+            order_id = row.pop("id", None) or index
+            yield order_id, {code: value for code, value in row.items() if code and value}, None
+        return
+
+    for index, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield index, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield index, None, "order should be a JSON object"
+        elif isinstance(record.get("products"), dict):
+            yield record.get("id", index), record["products"], None
+        else:
+            yield index, record, None
+
+
+def format_result(order_id, order):
+    """
+    :return: JSON line of processed order, with packs, remainder and total price of each product
+    """
+    products = {}
+    for code, order_product in order.products.items():
+        products[code] = {
+            "quantity": to_quantity(order_product["quantity"]),
+            "packs": {str(size): amount for size, amount in order_product["packs"].items()},
+            "remainder": order_product["remainder"],
+            "total_price": order_product["total_price"],
+        }
+    # total price is Decimal, keep exact digits as string
+    return json.dumps({"id": order_id, "products": products}, default=str)
+
+
+def run_stream(bakery, lines, output=sys.stdout, input_format=FORMAT_JSONL):
+    """
+    process orders one at a time by `Bakery.process_order`, each result is written as soon as it is ready
+    :param bakery: bakery object
+    :param lines: iterable of input text lines, e.g. an opened file or sys.stdin
+    :param output: text stream to write JSON line results
+    :param input_format: `jsonl` or `csv`
+    :return: summary dict of orders, errors, elapsed seconds, orders per second and latency of the first order in ms
+    """
+    start = time.perf_counter()
+    orders = errors = 0
+    first_order_ms = None
+    for order_id, order_dict, error in read_orders(lines, input_format):
+        if error is None:
+            try:
+                order = Order(order_dict)
+                order_start = time.perf_counter()
+                bakery.process_order(order)
+                if first_order_ms is None:
+                    # products not warmed up are created and solved here
+                    first_order_ms = (time.perf_counter() - order_start) * 1000
+            except Exception as e:
+                error = str(e)
+
+        if error is None:
+            orders += 1
+            output.write(format_result(order_id, order) + "\n")
+        else:
+            errors += 1
+            logger.warning(f"order {order_id} skipped: {error}")
+            output.write(json.dumps({"id": order_id, "error": error}) + "\n")
+        output.flush()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "orders": orders,
+        "errors": errors,
+        "elapsed": elapsed,
+        "orders_per_second": orders / elapsed if elapsed else 0.0,
+        "first_order_ms": first_order_ms or 0.0,
+    }
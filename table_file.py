@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RBPT"
+# bump when file layout or table content (e.g. tie breaking) changes, old files are rebuilt
+TABLE_FILE_VERSION = 1
+# magic, version, byte order, key length, limit, crc32 of columns
+HEADER = struct.Struct("<4sHBxIqI4x")
+BYTE_ORDER = 0 if sys.byteorder == "little" else 1
+COLUMNS = 3  # packs, choice, filled
+
+
+def key_bytes(key):
+    """
+    :param key: table key, (pack sizes, prices, pricing)
+    """
+    return json.dumps([list(key[0]), list(key[1]) if key[1] is not None else None, key[2]]).encode()
+
+
+def table_file_path(directory, key):
+    """
+    file of a table key, named by hash of its sorted pack sizes, prices and pricing
+    """
+    return os.path.join(directory, hashlib.sha256(key_bytes(key)).hexdigest()[:32] + ".tbl")
+
+
+def table_bytes(key, columns):
+    """
+    layout: header, key JSON padded to 8 bytes, then each column as native int64 array
+    :param columns: (packs, choice, filled) arrays of same length
+    """
+    key_data = key_bytes(key)
+    key_data += b"\0" * (-(HEADER.size + len(key_data)) % 8)
+    data = b"".join(array("q", column).tobytes() for column in columns)
+    header = HEADER.pack(
+        MAGIC, TABLE_FILE_VERSION, BYTE_ORDER, len(key_data), len(columns[0]) - 1, zlib.crc32(data)
+    )
+    return header + key_data + data
+
+
+def write_table_file(path, key, columns):
+    """
+    write columns of a table atomically, readers never see a partial file.
+    each writer has its own temp file, so threads and processes writing the same table never clash
+    :param columns: (packs, choice, filled) arrays of same length
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(table_bytes(key, columns))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read_table_file(path, key, limit):
+    """
+    map a table file read-only, columns are zero-copy views of the shared pages
+    :param limit: expected max quantity of the table
+    :return: (packs, choice, filled) int64 memoryviews, None if file is missing, stale or corrupt
+    """
+    try:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # not exist or empty
+        return None
+    return read_table_buffer(memoryview(mapped), key, limit, path)
+
+
+def read_table_buffer(view, key, limit, name="", exact_size=True):
+    """
+    :param view: read-only memoryview of a table written by `table_bytes`, e.g. a mapped file or shared memory
+    :param limit: expected max quantity of the table
+    :param name: file or segment name for logging
+    :param exact_size: False if view may be padded past the table, e.g. shared memory rounded up to pages
+    :return: (packs, choice, filled) int64 memoryviews of view, None if stale or corrupt
+    """
+    if len(view) < HEADER.size:
+        return None
+    magic, version, byte_order, key_length, file_limit, crc = HEADER.unpack_from(view)
+    data_start = HEADER.size + key_length
+    column_size = (limit + 1) * 8
+    if (
+        magic != MAGIC
+        or version != TABLE_FILE_VERSION
+        or byte_order != BYTE_ORDER
+        or file_limit != limit
+        or len(view) < data_start + COLUMNS * column_size
+        or exact_size and len(view) != data_start + COLUMNS * column_size
+        or bytes(view[HEADER.size : data_start]).rstrip(b"\0") != key_bytes(key)
+    ):
+        logger.info(f"stale table {name}")
+        return None
+    data_end = data_start + COLUMNS * column_size
+    if zlib.crc32(view[data_start:data_end]) != crc:
+        logger.warning(f"corrupt table {name}")
+        return None
+
+    return tuple(
+        view[data_start + i * column_size : data_start + (i + 1) * column_size].cast("q")
+        for i in range(COLUMNS)
+    )
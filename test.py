@@ -1,13 +1,77 @@
+import asyncio
+import io
+import itertools
+import json
 import os
 import random
+import tempfile
+import threading
+import tracemalloc
 import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest import mock
 from decimal import Decimal
 
-from config import PRICE_DECIMAL_PLACES, env_bool, env_int
-from helper import PackBreaker
+import helper
+from benchmark import find_regressions, generate_cases, run_benchmark
+from cache import BreakdownCache, breakdown_cache
+from catalogue import FORMAT_CSV as CATALOGUE_CSV, load_catalogue, read_catalogue
+from config import PRICE_DECIMAL_PLACES, USE_NUMPY, env_bool, env_int
+from fuzz import (
+    DEFAULT_ENGINES,
+    check_case,
+    generate_case,
+    is_failing,
+    oracle_objective,
+    run_fuzz,
+    shrink_candidates,
+    shrink_case,
+)
+from helper import (
+    ENGINE_DP,
+    ENGINE_RECURSIVE,
+    PRICING_PACKS,
+    PRICING_PACKS_PRICE,
+    PRICING_PRICE,
+    PRICINGS,
+    PackBreaker,
+    PackTable,
+    ResidueTable,
+    _build_pack_table_numpy,
+    _build_pack_table_python,
+    _build_priced_table_numpy,
+    _build_priced_table_python,
+    extend_pack_table,
+    get_pack_table,
+    unregister_pack_table,
+    get_table_key,
+    greedy_breakdown,
+    is_canonical,
+    load_pack_table,
+    bounded_breakdown,
+    find_pack_table,
+    get_greedy_threshold,
+    get_pack_solver,
+    get_reach_set,
+    key_breakdown,
+    numpy,
+    solve_breakdown,
+)
+from instrument import install_collector, uninstall_collector
+from loadgen import find_load_regressions, generate_orders, read_order_log, run_load_test, write_order_log
+from main import default_bakery
 from models.bakery import Bakery
-from models.order import Order
-from models.product import Product
+from models.order import Order, OrderBatch
+from models.product import PATH_GREEDY, PATH_SEARCH, PATH_STOCK, PATH_TABLE, Product
+from server import OrderService, attach_bakery_worker, run_load
+from stream import FORMAT_CSV, guess_format, run_stream
+from table_file import table_file_path
+
+try:
+    # shared memory needs Python 3.8 or above
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
 
 
 def generate_random_list(dimension=None, value_upper_bound=20):
@@ -39,7 +103,63 @@ def generate_random_list(dimension=None, value_upper_bound=20):
     return random_list
 
 
+def brute_force_objective(total_quantity, pack_sizes):
+    """
+    exhaustive (remainder, packs amount) optimum, only for small inputs
+    """
+    best = (total_quantity, 0)
+    reachable = {0: 0}  # filled quantity -> min packs amount
+    for filled in range(total_quantity + 1):
+        if filled not in reachable:
+            continue
+        best = min(best, (total_quantity - filled, reachable[filled]))
+        for size in pack_sizes:
+            if filled + size <= total_quantity:
+                packs = reachable[filled] + 1
+                reachable[filled + size] = min(reachable.get(filled + size, packs), packs)
+    return best
+
+
+def brute_force_priced_objective(total_quantity, pack_prices, price_first):
+    """
+    exhaustive (remainder, packs amount, price) or (remainder, price, packs amount) optimum, only for small inputs
+    """
+    reachable = {0: (0, 0)}  # filled quantity -> best (packs, price) or (price, packs)
+    for filled in range(total_quantity + 1):
+        if filled not in reachable:
+            continue
+        for size, price in pack_prices.items():
+            if filled + size <= total_quantity:
+                first, second = reachable[filled]
+                key = (first + price, second + 1) if price_first else (first + 1, second + price)
+                reachable[filled + size] = min(reachable.get(filled + size, key), key)
+    filled = max(reachable)
+    return (total_quantity - filled,) + reachable[filled]
+
+
+def brute_force_stock_objective(total_quantity, pack_sizes, stock):
+    """
+    exhaustive (remainder, packs amount) optimum with limited packs, only for small inputs
+    """
+    best = (total_quantity, 0)
+    amounts = [range(min(stock.get(size, total_quantity), total_quantity // size) + 1) for size in pack_sizes]
+    for amount in itertools.product(*amounts):
+        filled = sum(size * count for size, count in zip(pack_sizes, amount))
+        if filled <= total_quantity:
+            best = min(best, (total_quantity - filled, sum(amount)))
+    return best
+
+
 class BakeryTestCase(unittest.TestCase):
+    def pin_table_size_limit(self, limit=1 << 20):
+        """
+        run the test with the default TABLE_SIZE_LIMIT, whatever the environment configures
+        :param limit: TABLE_SIZE_LIMIT of the test
+        """
+        patcher = mock.patch.object(helper, "TABLE_SIZE_LIMIT", limit)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_pack_breaker(self):
         for i in range(1000):  # random test 100 times
             random_pack_sizes = generate_random_list()
@@ -65,6 +185,552 @@ class BakeryTestCase(unittest.TestCase):
             pack_amounts, remainder = breaker.solve()
             self.assertTrue(remainder <= 1)  # accept criteria, remainder should no more than 1
 
+    def test_fuzz(self):
+        # exhaustive oracle
+        self.assertEqual(oracle_objective(59, [22, 14, 3]), (0, 5))
+        self.assertEqual(oracle_objective(7, [5, 3]), (1, 2))
+        self.assertEqual(oracle_objective(2, [5, 3]), (2, 0))
+        self.assertEqual(generate_case(7, 3), generate_case(7, 3))
+
+        engines = ("dp", "table", "anytime", "pack_order")
+        self.assertEqual(DEFAULT_ENGINES, engines)  # known failing recursive engine is left out
+        report = run_fuzz(seed=1, cases=200, case_options={"max_quantity": 150})
+        self.assertEqual(report["failures"], {})
+        self.assertEqual(report["meta"]["cases"], 200)
+        self.assertEqual(set(report["stats"]), set(engines))
+        self.assertEqual(len(report["records"]), 200 * len(engines))
+
+        # parallel run of same seed checks same cases
+        parallel = run_fuzz(seed=1, cases=200, engines=engines, workers=2, case_options={"max_quantity": 150})
+        self.assertEqual(
+            [(r["index"], r["quantity"], r["pack_sizes"], r["error"]) for r in parallel["records"]],
+            [(r["index"], r["quantity"], r["pack_sizes"], r["error"]) for r in report["records"]],
+        )
+
+        # cases not started within the time budget are skipped
+        report = run_fuzz(seed=1, cases=10 ** 6, engines=("dp",), time_budget=0)
+        self.assertEqual(report["meta"]["cases"], 0)
+        self.assertEqual(report["records"], [])
+        report = run_fuzz(seed=1, cases=10 ** 6, engines=("dp",), time_budget=0.2)
+        self.assertLess(report["meta"]["cases"], 10 ** 6)
+
+        # recursive engine stops at the first perfect breakdown, not always least packs, shrunk to a smaller reproducer
+        record = check_case("recursive", 122, [22, 14, 3])
+        self.assertTrue(is_failing(record))
+        shrunk = shrink_case("recursive", 122, [22, 14, 3], is_failing)
+        self.assertTrue(is_failing(shrunk))
+        self.assertLessEqual(shrunk["quantity"], 122)
+        self.assertTrue(is_failing(check_case(shrunk["engine"], shrunk["quantity"], shrunk["pack_sizes"])))
+        for candidate in shrink_candidates(shrunk["quantity"], shrunk["pack_sizes"]):
+            self.assertFalse(is_failing(check_case("recursive", *candidate)))
+
+    def test_dp_engine(self):
+        for i in range(300):
+            random_pack_sizes = generate_random_list()
+            quantity = random.randrange(0, 200)
+
+            pack_amounts, remainder = PackBreaker(
+                quantity, list(random_pack_sizes), engine=ENGINE_DP
+            ).solve()
+            packs_total = sum(pack_amounts.values())
+            filled = sum(size * amount for size, amount in pack_amounts.items())
+            self.assertEqual(filled + remainder, quantity)
+            self.assertEqual(
+                (remainder, packs_total),
+                brute_force_objective(quantity, random_pack_sizes),
+            )
+
+            # recursive engine always finds the lowest remainder
+            _, recursive_remainder = PackBreaker(
+                quantity, list(random_pack_sizes), engine=ENGINE_RECURSIVE
+            ).solve()
+            self.assertEqual(remainder, recursive_remainder)
+
+        # fewest packs, recursive engine answers {6: 1, 1: 4}
+        self.assertEqual(PackBreaker(10, [6, 5, 1]).solve(), ({5: 2}, 0))
+        # deep input never recurse
+        pack_amounts, remainder = PackBreaker(100001, [41, 37, 31, 23]).solve()
+        self.assertEqual(remainder, 0)
+
+        # memory is bounded by the pack sizes, not by quantity
+        tracemalloc.start()
+        self.assertEqual(
+            PackBreaker(2 * 10 ** 7 + 1, [8, 5, 2], engine=ENGINE_DP).solve(), ({8: 2499999, 5: 1, 2: 2}, 0)
+        )
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertLess(peak, 1 << 20)
+        self.assertRaises(KeyError, PackBreaker, 10, [5, 3], "NOT_EXIST")
+
+    def test_table_file(self):
+        key = get_table_key([8, 5, 2])
+        expected = PackTable(*key)
+        with tempfile.TemporaryDirectory() as directory:
+            path = table_file_path(directory, key)
+
+            def check():
+                table = load_pack_table(key, directory)
+                self.assertTrue(isinstance(table.packs, memoryview))  # zero-copy mapped
+                for quantity in range(expected.limit * 3):
+                    self.assertEqual(table.breakdown(quantity), expected.breakdown(quantity))
+                return table
+
+            check()  # build file on first load
+            modified = os.path.getmtime(path)
+            check()  # load existing file
+            self.assertEqual(os.path.getmtime(path), modified)
+
+            # corrupt data is detected and rebuilt
+            with open(path, "r+b") as f:
+                f.seek(-8, os.SEEK_END)
+                f.write(b"\xff" * 8)
+            check()
+
+            # stale version and truncated file are rebuilt
+            with open(path, "r+b") as f:
+                f.seek(4)
+                f.write(b"\x00\x00")
+            check()
+            with open(path, "r+b") as f:
+                f.truncate(10)
+            check()
+
+            # priced table has its own file
+            priced_key = get_table_key([8, 5, 2], [2495, 1695, 995], PRICING_PRICE)
+            self.assertNotEqual(table_file_path(directory, priced_key), path)
+            self.assertEqual(
+                load_pack_table(priced_key, directory).breakdown(16),
+                PackTable(*priced_key).breakdown(16),
+            )
+
+    def test_solve_anytime(self):
+        self.pin_table_size_limit()
+        for i in range(300):
+            pack_sizes = random.sample(range(1, 60), random.randint(1, 5))
+            quantity = random.randint(0, 2000)
+            breakdown, remainder, proven = PackBreaker(quantity, pack_sizes).solve_anytime()
+            filled, packs = get_pack_table(pack_sizes).best_fill(quantity)
+            self.assertTrue(proven)
+            self.assertEqual(quantity - sum(size * amount for size, amount in breakdown.items()), remainder)
+            self.assertEqual((remainder, sum(breakdown.values())), (quantity - filled, packs))
+
+            # stopped early, still a valid breakdown no better than the best
+            breakdown, remainder, proven = PackBreaker(quantity, pack_sizes).solve_anytime(node_budget=1)
+            self.assertEqual(quantity - sum(size * amount for size, amount in breakdown.items()), remainder)
+            self.assertGreaterEqual((remainder, sum(breakdown.values())), (quantity - filled, packs))
+
+        # pack table of these sizes is too large to build on a request
+        product = Product("Pallet", "PLT", {9973: 1, 9967: 1, 9949: 1})
+        self.assertEqual(product._quick_pack(10 ** 18 + 3), ({9973: 100270730973628, 9967: 0, 9949: 0}, 7959))
+        packs, remainder, total_price, proven = product.pack_order_anytime(10 ** 12 + 7, node_budget=2)
+        self.assertEqual((packs, remainder, proven), ({9973: 100270730}, 9717, False))
+        packs, remainder, total_price, proven = product.pack_order_anytime(10 ** 12 + 7, time_budget=10)
+        self.assertEqual((packs, remainder, proven), ({9973: 100269889, 9967: 3, 9949: 841}, 0, True))
+        self.assertIsNone(find_pack_table(product.pack_sizes))
+
+        mb = Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95})
+        bakery = Bakery([mb, product])
+        mb.get_pack_table()
+        order = bakery.process_order(Order({"MB11": 14, "PLT": 10 ** 12 + 7}), node_budget=2)
+        # solved by built table, always proven
+        self.assertEqual(order.get_product("MB11")["packs"], {8: 1, 2: 3})
+        self.assertTrue(order.get_product("MB11").optimal)
+        line = order.get_product("PLT")
+        self.assertEqual((line["packs"], line["remainder"], line.optimal), ({9973: 100270730}, 9717, False))
+        line = bakery.process_order(Order({"PLT": 10 ** 12 + 7}), deadline=10).get_product("PLT")
+        self.assertEqual(
+            (line["packs"], line["remainder"], line.optimal), ({9973: 100269889, 9967: 3, 9949: 841}, 0, True)
+        )
+
+    def test_iter_optimal(self):
+        for i in range(100):
+            random_pack_sizes = sorted(generate_random_list(value_upper_bound=12), reverse=True)
+            quantity = random.randrange(0, 50)
+            remainder, packs_total = brute_force_objective(quantity, random_pack_sizes)
+
+            # every amount combination reaching the optimum, descending
+            expected = []
+            ranges = [range(quantity // size, -1, -1) for size in random_pack_sizes]
+            for amounts in itertools.product(*ranges):
+                filled = sum(size * amount for size, amount in zip(random_pack_sizes, amounts))
+                if (quantity - filled, sum(amounts)) == (remainder, packs_total):
+                    expected.append(dict((s, a) for s, a in zip(random_pack_sizes, amounts) if a))
+
+            breaker = PackBreaker(quantity, list(random_pack_sizes))
+            optimal = list(breaker.iter_optimal())
+            self.assertEqual(optimal, expected)
+            self.assertEqual(optimal[0], breaker.solve()[0])
+
+        self.assertEqual(list(PackBreaker(15, [8, 5, 2]).iter_optimal()), [{8: 1, 5: 1, 2: 1}, {5: 3}])
+        # lazy, huge quantity
+        optimal = PackBreaker(10 ** 18 + 15, [8, 5, 2]).iter_optimal()
+        self.assertEqual(next(optimal), {8: 125000000000000001, 5: 1, 2: 1})
+
+    def test_pack_table(self):
+        for i in range(100):
+            random_pack_sizes = generate_random_list()
+            table = PackTable(random_pack_sizes)
+            largest = max(random_pack_sizes)
+
+            # prefix, periodic part and folded quantities all equal to PackBreaker
+            quantities = list(range(table.limit + 3 * largest))
+            quantities += [random.randrange(table.limit, table.limit * 10) for j in range(10)]
+            for quantity in quantities:
+                self.assertEqual(
+                    table.breakdown(quantity),
+                    PackBreaker(quantity, list(random_pack_sizes)).solve(),
+                )
+
+        # very large quantity
+        self.assertEqual(
+            get_pack_table([2, 5, 8]).breakdown(10 ** 18), ({8: 125000000000000000}, 0)
+        )
+        self.assertEqual(
+            get_pack_table([5, 3]).breakdown(10 ** 18 + 1), ({5: 199999999999999999, 3: 2}, 0)
+        )
+        # one table per pack size set
+        self.assertTrue(get_pack_table([8, 5, 2]) is get_pack_table([2, 5, 8]))
+        self.assertEqual(PackTable([]).breakdown(5), ({}, 5))
+
+    def test_residue_table(self):
+        self.pin_table_size_limit()
+        for i in range(100):
+            random_pack_sizes = generate_random_list()
+            prices = [random.randint(1, 300) for size in random_pack_sizes]
+            key = get_table_key(random_pack_sizes, prices, random.choice(PRICINGS))
+            table, residue_table = PackTable(*key), ResidueTable(*key)
+            quantities = list(range(table.limit + 30)) + [random.randrange(10 ** 12) for j in range(10)]
+            for quantity in quantities:
+                self.assertEqual(residue_table.breakdown(quantity), table.breakdown(quantity))
+                self.assertEqual(residue_table.exact_packs(quantity), table.exact_packs(quantity))
+
+        # large coprime sizes, a dense table would be about 25M entries
+        sizes = [4999, 4993, 4987]
+        product = Product("Big", "BIG", dict((size, 1) for size in sizes))
+        tracemalloc.start()
+        pack_dict, remainder, total_price = product.pack_order(15000)
+        # solved by a table up to the quantity only
+        self.assertEqual(helper._bounded_entries[get_table_key(sizes)], 15000)
+        self.assertIsNone(find_pack_table(sizes))
+        self.assertEqual((pack_dict, remainder), PackBreaker(15000, sizes).solve_anytime()[:2])
+        self.assertEqual(key_breakdown(get_table_key(sizes), 10 ** 6), PackBreaker(10 ** 6, sizes).solve_anytime()[:2])
+        self.assertEqual(product.pack_order(10 ** 18)[1], 0)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertLess(peak, 8 << 20)
+        self.assertTrue(find_pack_table(sizes) is None)
+        self.assertTrue(isinstance(get_pack_solver(sizes), ResidueTable))
+
+        # nothing to pack builds no table
+        product = Product("Large", "LRG", {1000: 1, 991: 1, 503: 1})
+        self.assertEqual(product.pack_order(0), ({}, 0, Decimal("0.00")))
+        self.assertEqual(key_breakdown(product.table_key(), -5), ({}, -5))
+        self.assertIsNone(find_pack_table(product.pack_sizes))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy_pack_table(self):
+        for i in range(100):
+            random_pack_sizes = sorted(generate_random_list(), reverse=True)
+            limit = random.randrange(0, 500)
+            self.assertEqual(
+                _build_pack_table_numpy(random_pack_sizes, limit),
+                _build_pack_table_python(random_pack_sizes, limit),
+            )
+            prices = [random.randint(0, 3000) for size in random_pack_sizes]
+            for price_first in (False, True):
+                self.assertEqual(
+                    _build_priced_table_numpy(random_pack_sizes, prices, limit, price_first),
+                    _build_priced_table_python(random_pack_sizes, prices, limit, price_first),
+                )
+        # keys over int64 are left to pure python
+        self.assertIsNone(_build_priced_table_numpy([8, 5, 2], [2 ** 40, 1, 1], 10 ** 6, True))
+        packs, choice, filled = _build_pack_table_numpy([8, 5, 2], 20)
+        self.assertTrue(all(type(value) is int for value in packs + choice + filled))
+
+    def test_bounded_breakdown(self):
+        self.pin_table_size_limit()
+        for i in range(300):
+            pack_sizes = random.sample(range(1, 25), random.randint(1, 4))
+            stock = dict((size, random.randint(0, 6)) for size in pack_sizes if random.random() < 0.7)
+            quantity = random.randint(0, 120)
+            breakdown, remainder = bounded_breakdown(quantity, pack_sizes, stock)
+            self.assertTrue(all(0 < amount <= stock.get(size, quantity) for size, amount in breakdown.items()))
+            self.assertEqual(quantity - sum(size * amount for size, amount in breakdown.items()), remainder)
+            self.assertEqual(
+                (remainder, sum(breakdown.values())), brute_force_stock_objective(quantity, pack_sizes, stock)
+            )
+
+        # enough stock is same as unlimited
+        self.assertEqual(bounded_breakdown(18, [8, 5, 2], {2: 10}), ({8: 2, 2: 1}, 0))
+        # on ties less short stock is used
+        self.assertEqual(bounded_breakdown(10 ** 18 + 2, [8, 5, 2], {2: 1}), ({8: 124999999999999999, 5: 2}, 0))
+        self.assertEqual(bounded_breakdown(14, [8, 5, 2], {8: 0}), ({5: 2, 2: 2}, 0))
+        self.assertEqual(bounded_breakdown(14, [8, 5, 2], {8: 0, 2: 1}), ({5: 2, 2: 1}, 2))
+        # price is compared after packs amount, or before it
+        self.assertEqual(
+            bounded_breakdown(16, [8, 5, 2], {8: 1}, [2495, 1695, 995], PRICING_PACKS_PRICE), ({5: 2, 2: 3}, 0)
+        )
+        self.assertEqual(bounded_breakdown(16, [8, 5, 2], {8: 1}, [1000, 1695, 995], PRICING_PRICE), ({8: 1, 2: 4}, 0))
+
+        # large short stock, fills past the table limit are looked up once per residue of the table period
+        self.assertEqual(
+            bounded_breakdown(10 ** 6, [8, 5, 2], {8: 10 ** 5, 5: 1000}), ({8: 100000, 5: 1000, 2: 97500}, 0)
+        )
+
+        # stock of a size smaller than an unlimited one is capped, so its capacity is within TABLE_SIZE_LIMIT
+        with mock.patch.object(helper, "TABLE_SIZE_LIMIT", 10 ** 4):
+            breakdown, remainder = bounded_breakdown(10 ** 6 + 1, [97, 91, 3], {91: 10 ** 6})
+        expected, expected_remainder = get_pack_solver([97, 91, 3]).breakdown(10 ** 6 + 1)
+        self.assertEqual((remainder, sum(breakdown.values())), (expected_remainder, sum(expected.values())))
+
+        # past TABLE_SIZE_LIMIT, searched within the stock and marked not proven if the budget runs out
+        self.assertIsNone(bounded_breakdown(10 ** 8, [8, 5, 2], {8: 10 ** 6, 5: 10 ** 6}))
+        product = Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95})
+        self.assertEqual(
+            product.pack_order_with_path(10 ** 8, stock={8: 10 ** 6, 5: 10 ** 6}),
+            ({8: 10 ** 6, 5: 10 ** 6, 2: 435 * 10 ** 5}, 0, Decimal("474725000.00"), PATH_SEARCH),
+        )
+        with mock.patch.object(helper, "TABLE_SIZE_LIMIT", 20):
+            for i in range(100):
+                quantity = random.randint(0, 120)
+                stock = {8: random.randint(0, 6), 5: random.randint(0, 6)}
+                packs, remainder, total_price, proven = product.pack_order_anytime(quantity, stock=stock)
+                self.assertTrue(proven)
+                self.assertTrue(all(amount <= stock.get(size, quantity) for size, amount in packs.items()))
+                objective = brute_force_stock_objective(quantity, [8, 5, 2], stock)
+                self.assertEqual((remainder, sum(packs.values())), objective)
+
+            bakery = Bakery([product])
+            order = bakery.process_order(Order({"MB11": 43}), stock={"MB11": {8: 3, 5: 6}}, node_budget=1)
+            self.assertFalse(order.get_product("MB11").optimal)
+            self.assertEqual(order.get_product("MB11")["packs"], {8: 3, 5: 3, 2: 2})
+
+    def test_pricing(self):
+        for i in range(60):
+            random_pack_sizes = generate_random_list()
+            pack_prices = {size: random.randrange(1, 3000) for size in random_pack_sizes}
+            product = Product("Random", "RND", {size: price / 100 for size, price in pack_prices.items()})
+            for pricing, price_first in ((PRICING_PACKS_PRICE, False), (PRICING_PRICE, True)):
+                table = product.get_pack_table(pricing)
+                for quantity in random.sample(range(table.limit * 3 + 20), 20):
+                    packs, remainder, total_price = product.pack_order(quantity, pricing)
+                    packs_total = sum(packs.values())
+                    cents = int(total_price * 100)
+                    objective = (remainder, cents, packs_total) if price_first else (remainder, packs_total, cents)
+                    self.assertEqual(
+                        objective, brute_force_priced_objective(quantity, pack_prices, price_first)
+                    )
+                    self.assertEqual(list(packs), sorted(packs, reverse=True))
+
+        mb = Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95})
+        # 5 x 3 is cheaper than 8 + 5 + 2, both are 3 packs
+        self.assertEqual(mb.pack_order(15)[0], {8: 1, 5: 1, 2: 1})
+        self.assertEqual(mb.pack_order(15, PRICING_PACKS_PRICE)[0], {5: 3})
+        cheap = Product("Cheap Five", "C5", {2: 9.95, 5: 10, 8: 24.95})
+        # more packs but cheaper
+        self.assertEqual(cheap.pack_order(16)[0], {8: 2})
+        self.assertEqual(cheap.pack_order(16, PRICING_PRICE)[0], {5: 2, 2: 3})
+        self.assertEqual(cheap.pack_order(10 ** 18 + 1, PRICING_PRICE)[0], {5: 199999999999999999, 2: 3})
+
+        bakery = Bakery([cheap], pricing=PRICING_PRICE)
+        order = Order({"C5": 16})
+        bakery.process_order(order)
+        self.assertEqual(order.get_product("C5")["packs"], {5: 2, 2: 3})
+        batch = bakery.process_orders([Order({"C5": 16})])
+        self.assertEqual(batch[0].get_product("C5")["packs"], {5: 2, 2: 3})
+        self.assertRaises(KeyError, Bakery, [cheap], "NOT_EXIST")
+
+    def test_breakdown_cache(self):
+        cache = BreakdownCache(max_size=2)
+        solve = lambda: ({5: 2}, 0)
+        self.assertEqual(cache.get_or_solve([5, 3], 10, solve), ({5: 2}, 0))
+        self.assertEqual(cache.get_or_solve((3, 5), 10, solve), ({5: 2}, 0))  # normalized key
+        cache.get_or_solve([5, 3], 11, lambda: ({5: 1, 3: 2}, 0))
+        cache.get_or_solve([5, 3], 12, lambda: ({3: 4}, 0))  # evict 10
+        self.assertEqual(
+            cache.stats(),
+            {"hits": 1, "misses": 3, "evictions": 1, "size": 2, "max_size": 2},
+        )
+
+        # returned dict is a copy
+        packs, remainder = cache.get_or_solve([5, 3], 12, solve)
+        packs[3] = 100
+        self.assertEqual(cache.get_or_solve([5, 3], 12, solve), ({3: 4}, 0))
+
+        # disabled cache always solve
+        cache = BreakdownCache(max_size=0)
+        cache.get_or_solve([5, 3], 10, solve)
+        cache.get_or_solve([5, 3], 10, solve)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+        # products sharing pack sizes share breakdown, not price
+        breakdown_cache.clear()
+        mb = Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95})
+        other = Product("Other Muffin", "MB12", {2: 1, 5: 2, 8: 3})
+        self.assertEqual(mb.pack_order(14)[2], Decimal("24.95") + Decimal("9.95") * 3)
+        self.assertEqual(other.pack_order(14)[2], Decimal("3") + Decimal("1") * 3)
+        self.assertEqual(breakdown_cache.hits, 1)
+        self.assertEqual(breakdown_cache.misses, 1)
+
+    def test_benchmark(self):
+        # seeded matrix is reproducible
+        self.assertEqual(generate_cases(1), generate_cases(1))
+        self.assertEqual(len(generate_cases(1)), 8 * 3 * 3)
+
+        report = run_benchmark(seed=1, repeat=2, dimensions=[1, 3], magnitudes={"small": 20})
+        self.assertEqual(len(report["cases"]), 2 * 3 * 3)
+        self.assertEqual(find_regressions(report, report), [])
+
+        # slower and bigger than baseline
+        baseline = json.loads(json.dumps(report))
+        name = "pack_breaker/3/small/perfect"
+        report["cases"][name]["median_ms"] += 1
+        report["cases"][name]["peak_kb"] += 100
+        regressions = find_regressions(report, baseline)
+        self.assertTrue(any(message.startswith(f"{name} median_ms") for message in regressions))
+        self.assertTrue(any(message.startswith(f"{name} peak_kb") for message in regressions))
+
+    def test_instrument(self):
+        collector = install_collector(dump_at_exit=False)
+        try:
+            PackBreaker(14, [8, 5, 2], engine=ENGINE_RECURSIVE).solve()
+            PackBreaker(14, [8, 5, 2], engine=ENGINE_DP).solve()
+            bakery = Bakery(
+                [
+                    Product("Vegemite Scroll", "VS5", {3: 6.99, 5: 8.99}),
+                    Product("Donut", "DN", {20: 30, 5: 9}),
+                    Product("Pallet", "PLT", {9973: 1, 9967: 1, 9949: 1}),
+                ]
+            )
+            bakery.process_order(Order({"VS5": 10, "DN": 45, "WRONG_CODE": 1}))
+            bakery.process_order(Order({"DN": 45}), stock={"DN": {20: 1}})
+            bakery.process_order(Order({"PLT": 10 ** 12 + 7}), node_budget=1)
+            paths = []
+            Bakery.hooks.append(paths.append)
+            bakery.process_order(Order({"DN": 45, "VS5": 11}))
+        finally:
+            uninstall_collector(collector)
+            if paths.append in Bakery.hooks:
+                Bakery.hooks.remove(paths.append)
+
+        stats = collector.dump()
+        recursive = stats["solve/recursive"]
+        self.assertEqual(recursive["calls"], 1)
+        self.assertTrue(recursive["nodes_visited"] > 0)
+        self.assertTrue(recursive["candidates_evaluated"] > 0)
+        self.assertTrue(recursive["early_exits"] > 0)  # perfect match found early
+        self.assertEqual(stats["solve/dp"]["nodes_visited"], 1)  # one table lookup
+        self.assertEqual(stats["process_order"]["calls"], 4)
+        self.assertEqual(stats["process_order"]["order_lines"], 7)
+        self.assertEqual(stats["process_order"]["skipped_lines"], 1)
+        self.assertEqual(stats["process_order"]["unproven_lines"], 1)
+        self.assertTrue(stats["process_order"]["wall_time"] >= 0)
+        # real path of each product line, reported as the engine of its solve
+        self.assertEqual([stats["paths"] for stats in paths], [[PATH_GREEDY, PATH_TABLE]])
+        self.assertEqual(stats[f"solve/{PATH_GREEDY}"]["calls"], 2)
+        self.assertEqual(stats[f"solve/{PATH_TABLE}"]["calls"], 2)
+        self.assertEqual(stats[f"solve/{PATH_STOCK}"]["calls"], 1)
+        self.assertEqual(stats[f"solve/{PATH_SEARCH}"]["calls"], 1)
+
+        # no hook, nothing collected
+        PackBreaker(14, [8, 5, 2]).solve()
+        self.assertEqual(collector.dump()["solve/dp"]["calls"], 1)
+
+    def test_stream(self):
+        bakery = Bakery(
+            [
+                Product("Vegemite Scroll", "VS5", {3: 6.99, 5: 8.99}),
+                Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95}),
+            ]
+        )
+        lines = iter(
+            ['{"VS5": 10}\n', '{"id": "a", "products": {"MB11": 14}}\n', "\n", "bad\n", '{"VS5": "x"}\n']
+        )
+        output = io.StringIO()
+        summary = run_stream(bakery, lines, output)
+        self.assertEqual(summary["orders"], 2)
+        self.assertEqual(summary["errors"], 2)
+
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(results[0]["id"], 1)
+        self.assertEqual(results[0]["products"]["VS5"]["packs"], {"5": 2})
+        self.assertEqual(results[0]["products"]["VS5"]["total_price"], "17.98")
+        self.assertEqual(results[1]["id"], "a")
+        self.assertEqual(results[1]["products"]["MB11"]["packs"], {"8": 1, "2": 3})
+        self.assertTrue("error" in results[2] and "error" in results[3])
+
+        output = io.StringIO()
+        summary = run_stream(bakery, io.StringIO("id,VS5,MB11\n7,10,\n8,11,3\n"), output, FORMAT_CSV)
+        self.assertEqual(summary["orders"], 2)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(list(results[0]["products"]), ["VS5"])  # empty cell skipped
+        self.assertEqual(results[0]["products"]["VS5"]["quantity"], 10)  # same int as JSON input
+        self.assertEqual(results[1]["products"]["MB11"]["remainder"], 1)
+
+        self.assertEqual(guess_format("orders.CSV"), FORMAT_CSV)
+        self.assertEqual(guess_format(None), "jsonl")
+
+    def test_order_service(self):
+        bakery = default_bakery()
+        product = bakery.get_product("MB11")
+
+        async def coalesce():
+            service = OrderService(bakery)
+            results = await asyncio.gather(*[service.solve(product, 1014) for i in range(10)])
+            return service, results
+
+        service, results = asyncio.run(coalesce())
+        self.assertEqual(service.solves, 1)
+        self.assertEqual(service.coalesced, 9)
+        self.assertEqual(results[0], ({8: 126, 2: 3}, 0, Decimal("3173.55"), True, PATH_TABLE))
+        results[0][0][8] = 0  # each waiter gets its own copy
+        self.assertEqual(results[1][0], {8: 126, 2: 3})
+
+        # same results, paths and stats as Bakery.process_order
+        order_dicts = [{"VS5": 10, "MB11": 14, "CF": 13, "WRONG_CODE": 1}, {"VS5": 7, "MB11": 10 ** 12}, {"CF": 0}]
+        stocks = [None, {"MB11": {8: 2}}, None]
+        collected = []
+        Bakery.hooks.append(collected.append)
+        try:
+            expected = [bakery.process_order(Order(d), stock=s) for d, s in zip(order_dicts, stocks)]
+            expected_stats, collected[:] = list(collected), []
+
+            async def process(service):
+                return [await service.process_order(Order(d), stock=s) for d, s in zip(order_dicts, stocks)]
+
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                orders = asyncio.run(process(OrderService(bakery, executor=executor)))
+        finally:
+            Bakery.hooks.remove(collected.append)
+        for order, expected_order in zip(orders, expected):
+            self.assertEqual(order.products, expected_order.products)
+        self.assertEqual(len(collected), len(expected_stats))
+        self.assertEqual(expected_stats[1]["paths"][1], PATH_STOCK)
+        for stats, expected_order_stats in zip(collected, expected_stats):
+            for key in ("order_lines", "skipped_lines", "unproven_lines", "paths"):
+                self.assertEqual(stats[key], expected_order_stats[key])
+
+        # process pool workers solve by their own bakery, attached to shared tables
+        if shared_memory is not None:
+            with ProcessPoolExecutor(1, initializer=attach_bakery_worker, initargs=([], "rbtest_")) as executor:
+                orders = asyncio.run(process(OrderService(bakery, executor=executor)))
+            for order, expected_order in zip(orders, expected):
+                self.assertEqual(order.products, expected_order.products)
+
+        async def serve_and_load():
+            service = OrderService(bakery, queue_size=2, workers=2)
+            server = await service.start("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            orders = [{"MB11": 14}] * 20 + [{"MB11": "x"}]
+            summary = await run_load("127.0.0.1", port, orders, concurrency=5)
+            await service.stop(server)
+            return summary
+
+        summary = asyncio.run(serve_and_load())
+        self.assertEqual(summary["requests"], 21)
+        self.assertEqual(summary["errors"], 1)
+        self.assertTrue(summary["p99_ms"] >= summary["p50_ms"])
+
     def test_config(self):
         # test env_bool
         self.assertRaises(Exception, env_bool, "NOT_EXIST")
@@ -98,6 +764,66 @@ class BakeryTestCase(unittest.TestCase):
 
         self.assertRaises(KeyError, order.get_product, "not_exist_code")
 
+    def test_order_batch(self):
+        bakery = Bakery(
+            [
+                Product("Vegemite Scroll", "VS5", {3: 6.99, 5: 8.99}),
+                Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95}),
+            ]
+        )
+        order_dicts = [{"VS5": random.randrange(100), "MB11": random.randrange(100)} for i in range(30)]
+        order_dicts.append({"VS5": "10", "WRONG_CODE": 14})
+
+        batch = OrderBatch(order_dicts)
+        self.assertEqual(len(batch), len(order_dicts))
+        self.assertTrue(batch[-1].get_product("WRONG_CODE")["remainder"] is None)
+        self.assertEqual(batch[-1].get_product("WRONG_CODE")["packs"], {})
+
+        bakery.process_orders(batch)
+        for order_dict, batch_order in zip(order_dicts, batch):
+            order = Order(order_dict)
+            bakery.process_order(order)
+            for code, line in order.products.items():
+                batch_line = batch_order.get_product(code)
+                self.assertEqual(int(batch_line["quantity"]), int(line["quantity"]))
+                for key in ("packs", "remainder", "total_price"):
+                    self.assertEqual(batch_line[key], line[key])
+        self.assertEqual(batch.pack_counts[0], sum(batch[0].get_product("VS5")["packs"].values()))
+
+        # total price in cents over int64
+        batch = OrderBatch([{"MB11": 10 ** 18}])
+        bakery.process_orders(batch)
+        self.assertEqual(batch[0].get_product("MB11")["packs"], {8: 125000000000000000})
+        self.assertEqual(batch[0].get_product("MB11")["total_price"], Decimal("24.95") * 125000000000000000)
+
+        # single order view works with process_order too
+        bakery.process_order(batch[0])
+
+        # solving lines again reuses or compacts pack columns
+        batch = OrderBatch(order_dicts)
+        bakery.process_orders(batch)
+        for i in range(5):
+            for order_dict, batch_order in zip(order_dicts, batch):
+                eights = random.randrange(3)
+                bakery.process_order(batch_order, stock={"MB11": {8: eights}})
+                order = bakery.process_order(Order(order_dict), stock={"MB11": {8: eights}})
+                for code, line in order.products.items():
+                    self.assertEqual(batch_order.get_product(code)["packs"], line["packs"])
+        live = sum(length for length in batch._pack_lengths if length > 0)
+        self.assertLessEqual(len(batch._pack_sizes), 2 * live)
+        self.assertRaises(KeyError, batch[0].get_product, "not_exist_code")
+        self.assertRaises(IndexError, batch.__getitem__, len(order_dicts))
+
+        # compact slots, no dict per object
+        order = Order({"VS5": 10})
+        self.assertFalse(hasattr(order, "__dict__"))
+        self.assertFalse(hasattr(order.get_product("VS5"), "__dict__"))
+        self.assertFalse(hasattr(bakery.get_product("VS5"), "__dict__"))
+        self.assertEqual(
+            order.get_product("VS5"), {"quantity": 10, "packs": {}, "remainder": None, "total_price": None}
+        )
+        self.assertTrue(bakery.get_product("VS5").pack_sizes is bakery.get_product("VS5").pack_sizes)
+
     def test_product(self):
         product = Product(
             "Blueberry Muffin", "MB11", {"5": 16.95, 8: "24.9599", 2: 9.9511111}
@@ -109,7 +835,7 @@ class BakeryTestCase(unittest.TestCase):
             all([isinstance(quantity, int) for quantity in product.pack_sizes])
         )
         self.assertTrue(
-            all([isinstance(price, Decimal) for price in product._packs.values()])
+            all([isinstance(price, Decimal) for price in product.packs.values()])
         )
 
         # test price getter and decimal places
@@ -162,6 +888,202 @@ class BakeryTestCase(unittest.TestCase):
         self.assertEqual(rest, 1)
         self.assertEqual(total_price, Decimal("9.95") * 1)
 
+        packs, rest, total_price = product.pack_order(10 ** 18 + 2)
+        self.assertEqual(packs, {8: 125000000000000000, 2: 1})
+        self.assertEqual(rest, 0)
+
+    def test_greedy_path(self):
+        for i in range(100):
+            pack_sizes = sorted(set(random.sample(range(2, 30), random.randint(0, 4)) + [1]), reverse=True)
+            table = get_pack_table(pack_sizes)
+            greedy_best = all(
+                sum(greedy_breakdown(quantity, pack_sizes)[0].values()) == table.exact_packs(quantity)
+                for quantity in range(1, table.limit + 1)
+            )
+            self.assertEqual(is_canonical(pack_sizes), greedy_best)
+
+        self.assertEqual(get_greedy_threshold([25, 10, 5, 1]), 0)
+        # smallest size divides others, remainder is always quantity mod 5
+        self.assertEqual(get_greedy_threshold([20, 10, 5]), 0)
+        self.assertIsNone(get_greedy_threshold([4, 3, 1]))
+        self.assertIsNone(get_greedy_threshold([8, 5, 2]))
+
+        product = Product("Donut", "DN", {20: 30, 10: 16, 5: 9})
+        self.assertEqual(product.greedy_from, 0)
+        for quantity in range(0, 300):
+            self.assertEqual(product.pack_order(quantity)[:2], get_pack_table([20, 10, 5]).breakdown(quantity))
+        self.assertEqual(
+            product.pack_order_with_path(10 ** 18 + 38),
+            ({20: 5 * 10 ** 16 + 1, 10: 1, 5: 1}, 3, Decimal("1500000000000000055"), PATH_GREEDY),
+        )
+        # price is not compared by greedy
+        self.assertEqual(product.pack_order_with_path(15, PRICING_PRICE)[3], PATH_TABLE)
+        self.assertEqual(product.pack_order_with_path(45, stock={20: 1})[3], PATH_STOCK)
+
+        # analysed again on pack change
+        product.add_pack(3, 5)
+        self.assertIsNone(product.greedy_from)
+        self.assertEqual(product.pack_order_with_path(45)[3], PATH_TABLE)
+        self.assertFalse(hasattr(product, "last_path"))
+
+    def test_fulfill(self):
+        mb = Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95})
+        self.assertTrue(mb.can_fulfill(14))
+        self.assertTrue(mb.can_fulfill("0"))
+        self.assertFalse(mb.can_fulfill(1))
+        self.assertFalse(mb.can_fulfill(3))
+        self.assertFalse(mb.can_fulfill(-2))
+        self.assertTrue(mb.can_fulfill(10 ** 18 + 1))
+        self.assertEqual(mb.min_remainder(3), 1)
+        self.assertEqual(mb.min_remainder(10 ** 18 + 1), 0)
+        self.assertEqual(mb.min_remainder(-2), -2)
+        self.assertRaises(Exception, mb.min_remainder, "NOT_NUMBER")
+        self.assertEqual(Product("Empty", "E", {}).min_remainder(7), 7)
+        self.assertFalse(Product("Empty", "E", {}).can_fulfill(7))
+
+        # multiples of gcd only, same remainder as pack_order
+        cf = Product("Croissant", "CF", {6: 5.95, 10: 9.95, 18: 16.99})
+        self.assertFalse(cf.can_fulfill(10 ** 18 + 1))
+        self.assertEqual(cf.min_remainder(10 ** 18 + 1), 1)
+        for i in range(50):
+            product = Product("Random", "R", {size: 1 for size in random.sample(range(1, 40), random.randint(1, 4))})
+            for quantity in list(range(120)) + [random.randrange(10 ** 12) for j in range(5)]:
+                remainder = product.pack_order(quantity)[1]
+                self.assertEqual(product.min_remainder(quantity), remainder)
+                self.assertEqual(product.can_fulfill(quantity), remainder == 0)
+
+        # shared by pack sizes, follows pack changes
+        self.assertIs(mb.catalogue.get_reach_set(), get_reach_set([8, 5, 2]))
+        mb.remove_pack(2)
+        self.assertFalse(mb.can_fulfill(14))
+        self.assertEqual(mb.min_remainder(14), 1)
+
+        # bound over TABLE_SIZE_LIMIT reads the residue table instead of a bitset
+        reach_set = get_reach_set([20000, 19999])
+        self.assertIsNone(reach_set.bits)
+        self.assertIsInstance(reach_set.residues, ResidueTable)
+        expected = get_reach_set([38, 23, 9])
+        with mock.patch.object(helper, "TABLE_SIZE_LIMIT", -1):
+            residue_reach_set = helper.ReachSet([38, 23, 9])
+        self.assertIsNone(residue_reach_set.bits)
+        for quantity in range(-2, expected.limit + 50):
+            self.assertEqual(residue_reach_set.can_fill(quantity), expected.can_fill(quantity))
+            self.assertEqual(residue_reach_set.min_remainder(quantity), expected.min_remainder(quantity))
+
+    def test_quote_range(self):
+        for i in range(30):
+            pack_sizes = random.sample(range(1, 40), random.randint(1, 4))
+            product = Product("Random", "RND", {size: random.randint(100, 9999) / 100 for size in pack_sizes})
+            for pricing in (PRICING_PACKS, PRICING_PACKS_PRICE, PRICING_PRICE):
+                limit = product.get_pack_table(pricing).limit
+                start = random.randint(-2, limit * 2)
+                stop = start + random.randint(0, limit * 3)
+                self.assertEqual(
+                    list(product.quote_range(start, stop, pricing)),
+                    [(quantity,) + product.pack_order(quantity, pricing) for quantity in range(start, stop)],
+                )
+
+        mb = Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95})
+        quotes = mb.quote_range(10 ** 18, 10 ** 18 + 3)
+        self.assertEqual(next(quotes), (10 ** 18, {8: 125000000000000000}, 0, Decimal("24.95") * 125000000000000000))
+        self.assertEqual(len(list(quotes)), 2)
+        self.assertEqual(list(mb.quote_range(5, 5)), [])
+
+    def test_stock(self):
+        mb = Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95})
+        stock = {8: 1, 5: 10}
+        self.assertEqual(mb.pack_order(14, stock=stock), mb.pack_order(14))
+        self.assertEqual(mb.pack_order(24, stock=stock), ({5: 4, 2: 2}, 0, Decimal("16.95") * 4 + Decimal("9.95") * 2))
+        # caller's stock is not changed by product
+        self.assertEqual(stock, {8: 1, 5: 10})
+
+        vs = Product("Vegemite Scroll", "VS5", {3: 6.99, 5: 8.99})
+        bakery = Bakery([mb, vs])
+        stock = {"MB11": {8: 2, 5: 1}, "VS5": {5: 1}}
+        orders = bakery.process_orders([Order({"MB11": 16, "VS5": 8}), Order({"MB11": 13, "VS5": 8})], stock=stock)
+        self.assertEqual(orders[0].get_product("MB11")["packs"], {8: 2})
+        self.assertEqual(orders[0].get_product("VS5")["packs"], {5: 1, 3: 1})
+        # second order gets what is left
+        self.assertEqual(orders[1].get_product("MB11")["packs"], {5: 1, 2: 4})
+        self.assertEqual(orders[1].get_product("VS5")["packs"], {3: 2})
+        self.assertEqual(orders[1].get_product("VS5")["remainder"], 2)
+        self.assertEqual(stock, {"MB11": {8: 0, 5: 0}, "VS5": {5: 0}})
+
+        order = Order({"MB11": 16})
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            bakery.process_order(order, executor, stock={"MB11": {8: 1}})
+        self.assertEqual(order.get_product("MB11")["packs"], {5: 2, 2: 3})
+
+    def test_catalogue_update(self):
+        # extending a table by one size is same as building it from scratch
+        for i in range(50):
+            sizes = random.sample(range(2, 30), random.randint(1, 4))
+            size = random.choice([x for x in range(1, 40) if x not in sizes])
+            extended = extend_pack_table(PackTable(sizes), size)
+            fresh = PackTable(sizes + [size])
+            self.assertEqual(extended.limit, fresh.limit)
+            self.assertEqual(list(extended.packs), list(fresh.packs))
+            self.assertEqual(list(extended.choice), list(fresh.choice))
+            self.assertEqual(list(extended.filled), list(fresh.filled))
+
+        mb = Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95})
+        bakery = Bakery([mb])
+        table = mb.get_pack_table()
+        catalogue = mb.catalogue
+
+        # price change keeps pack table
+        bakery.set_pack_price("MB11", 2, 8.95)
+        self.assertIs(mb.get_pack_table(), table)
+        self.assertEqual(mb.get_pack_price(2), Decimal("8.95"))
+        # old catalogue is untouched
+        self.assertEqual(catalogue.packs[2], Decimal("9.95"))
+        self.assertRaises(KeyError, mb.set_pack_price, 3, 1)
+
+        bakery.add_pack("MB11", 3, 12.95)
+        self.assertEqual(mb.pack_sizes, (8, 5, 3, 2))
+        self.assertEqual(list(mb.get_pack_table().packs), list(PackTable([8, 5, 3, 2]).packs))
+        self.assertEqual(mb.pack_order(11), ({8: 1, 3: 1}, 0, Decimal("24.95") + Decimal("12.95")))
+        # existing size is a price change
+        bakery.add_pack("MB11", 3, 11.95)
+        self.assertEqual(mb.get_pack_price(3), Decimal("11.95"))
+        self.assertRaises(Exception, mb.add_pack, 0, 1)
+        self.assertRaises(Exception, mb.add_pack, "INVALID", 1)
+
+        bakery.remove_pack("MB11", 2)
+        self.assertEqual(mb.pack_sizes, (8, 5, 3))
+        self.assertRaises(KeyError, bakery.remove_pack, "MB11", 2)
+
+        order = Order({"MB11": 4})
+        bakery.process_order(order)
+        self.assertEqual(order.get_product("MB11")["packs"], {3: 1})
+        self.assertEqual(order.get_product("MB11")["remainder"], 1)
+        self.assertEqual(order.get_product("MB11")["total_price"], Decimal("11.95"))
+
+    def test_catalogue_file(self):
+        rows = ["code,name,size,price", "VS5,Vegemite Scroll,3,6.99", "VS5,Vegemite Scroll,5,8.99", ",,1,1"]
+        self.assertEqual(
+            list(read_catalogue(rows, CATALOGUE_CSV)), [("VS5", "Vegemite Scroll", {"3": "6.99", "5": "8.99"})]
+        )
+
+        bakery = Bakery([])
+        summary = load_catalogue(bakery, os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogue.json"))
+        self.assertEqual(summary["products"], 3)
+        # registered, not created yet
+        self.assertTrue(bakery.has_product("MB11"))
+        self.assertFalse(bakery.has_product("WRONG_CODE"))
+        self.assertEqual(bakery._products, {})
+
+        order = Order({"MB11": 14, "WRONG_CODE": 1})
+        bakery.process_order(order)
+        self.assertEqual(order.get_product("MB11")["packs"], {8: 1, 2: 3})
+        self.assertEqual(list(bakery._products), ["MB11"])
+
+        summary = bakery.warmup(["VS5"], max_quantity=10)
+        self.assertEqual(summary["products"], 1)
+        self.assertEqual(sorted(bakery._products), ["MB11", "VS5"])
+        self.assertEqual(bakery.get_product("CF").pack_sizes, (9, 5, 3))
+        self.assertRaises(KeyError, bakery.warmup, ["WRONG_CODE"])
+
     def test_bakery(self):
         vs = Product("Vegemite Scroll", "VS5", {3: 6.99, 5: 8.99})
         mb = Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95})
@@ -193,3 +1115,187 @@ class BakeryTestCase(unittest.TestCase):
         self.assertEqual(order.get_product("MB11")["remainder"], 0)
         self.assertEqual(order.get_product("CF")["remainder"], 0)
         self.assertEqual(order.get_product("CF")["packs"], {5: 2, 3: 1})
+
+    def test_thread_safety(self):
+        # caller's list is never changed
+        pack_sizes = [2, 8, 5]
+        self.assertEqual(solve_breakdown(14, pack_sizes), ({8: 1, 2: 3}, 0))
+        PackBreaker(14, pack_sizes, engine=ENGINE_RECURSIVE).solve()
+        self.assertEqual(pack_sizes, [2, 8, 5])
+
+        # many threads solving on shared inputs, same results as sequential
+        cases = [(random.randrange(1, 300), random.sample(range(2, 40), random.randint(1, 4))) for i in range(200)]
+        inputs = [(quantity, list(sizes)) for quantity, sizes in cases]
+        expected = [solve_breakdown(quantity, sizes) for quantity, sizes in cases]
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            return [solve_breakdown(quantity, sizes) for quantity, sizes in cases]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(worker) for i in range(8)]
+            for future in futures:
+                self.assertEqual(future.result(), expected)
+        self.assertEqual(cases, inputs)
+
+        # lines of orders solved concurrently on a shared pool, lazy products created once
+        bakery = Bakery([])
+        bakery.register("VS5", "Vegemite Scroll", {3: 6.99, 5: 8.99})
+        bakery.register("MB11", "Blueberry Muffin", {2: 9.95, 5: 16.95, 8: 24.95})
+        bakery.register("CF", "Croissant", {3: 5.95, 5: 9.95, 9: 16.99})
+        order_dicts = [{code: random.randrange(1, 10 ** 6) for code in ("VS5", "MB11", "CF")} for i in range(300)]
+        orders = [Order(order_dict) for order_dict in order_dicts]
+        with ThreadPoolExecutor(max_workers=8) as executor, ThreadPoolExecutor(max_workers=8) as callers:
+            # orders from many threads, their lines on the shared pool
+            for future in [callers.submit(bakery.process_order, order, executor) for order in orders]:
+                future.result()
+        self.assertEqual(len(bakery.products), 3)
+
+        sequential = Bakery(list(bakery.products.values()))
+        for order_dict, order in zip(order_dicts, orders):
+            expected = Order(order_dict)
+            sequential.process_order(expected)
+            for code in order_dict:
+                self.assertEqual(order.get_product(code), expected.get_product(code))
+
+    def test_thread_safety_table_file(self):
+        self.pin_table_size_limit()
+        # threads racing on first use of a table with a cache dir build and write it once
+        product = Product("Pallet", "PLT3", {197: 99.95, 191: 97.95, 183: 94.95})
+        quantities = [random.randrange(10 ** 5, 10 ** 7) for i in range(16)]
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(helper, "TABLE_CACHE_DIR", directory):
+            barrier = threading.Barrier(16)
+
+            def worker(quantity):
+                barrier.wait()
+                return product.pack_order(quantity)
+
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                results = list(executor.map(worker, quantities))
+            self.assertEqual(os.listdir(directory), [os.path.basename(table_file_path(directory, product.table_key()))])
+            table = product.get_pack_table()
+            unregister_pack_table(table)
+
+        expected = Product("Pallet", "PLT3", {197: 99.95, 191: 97.95, 183: 94.95})
+        for quantity, result in zip(quantities, results):
+            self.assertEqual(result, expected.pack_order(quantity))
+
+    def test_process_orders(self):
+        vs = Product("Vegemite Scroll", "VS5", {3: 6.99, 5: 8.99})
+        mb = Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95})
+        mb2 = Product("Other Muffin", "MB12", {2: 1, 5: 2, 8: 3})
+        bakery = Bakery([vs, mb, mb2])
+
+        order_dicts = [
+            {"VS5": random.randrange(100), "MB11": random.randrange(100), "MB12": 14}
+            for i in range(50)
+        ]
+        order_dicts.append({"VS5": "10", "WRONG_CODE": 14, "MB12": 10 ** 18})
+        batch = bakery.process_orders([Order(d) for d in order_dicts])
+        self.assertEqual(len(batch), len(order_dicts))
+
+        for order_dict, batch_order in zip(order_dicts, batch):
+            order = Order(order_dict)
+            bakery.process_order(order)
+            self.assertEqual(batch_order.products, order.products)
+
+        self.assertTrue(batch[-1].get_product("WRONG_CODE")["total_price"] is None)
+        self.assertRaises(Exception, bakery.process_orders, [Order({"VS5": "NOT_NUMBER"})])
+
+        # process pool gives same result
+        parallel = bakery.process_orders_parallel(
+            [Order(d) for d in order_dicts], workers=2, chunk_size=8
+        )
+        for batch_order, parallel_order in zip(batch, parallel):
+            self.assertEqual(batch_order.products, parallel_order.products)
+
+    def test_loadgen(self):
+        codes = ["CF", "MB11", "VS5"]
+        orders = list(generate_orders(codes, 2000, seed=3, burst_rate=0.01, huge_rate=0.01))
+        self.assertEqual(orders, list(generate_orders(codes, 2000, seed=3, burst_rate=0.01, huge_rate=0.01)))
+        self.assertEqual(len(orders), 2000)
+
+        # popularity is skewed to the first code, bulk and huge quantities appear
+        lines = [code for order_dict in orders for code in order_dict]
+        self.assertGreater(lines.count("CF"), lines.count("VS5"))
+        quantities = [quantity for order_dict in orders for quantity in order_dict.values()]
+        self.assertTrue(any(100 < quantity < 10 ** 9 for quantity in quantities))
+        self.assertTrue(any(quantity >= 10 ** 9 for quantity in quantities))
+        uniform = [code for order_dict in generate_orders(codes, 2000, skew=0) for code in order_dict]
+        self.assertLess(abs(uniform.count("CF") - uniform.count("VS5")), 200)
+
+        # recorded log replays same orders
+        log = io.StringIO()
+        self.assertEqual(write_order_log(orders, log), 2000)
+        replayed = list(read_order_log(io.StringIO(log.getvalue() + "not json\n")))
+        self.assertEqual(replayed, orders)
+
+        bakery = Bakery(
+            [
+                Product("Vegemite Scroll", "VS5", {3: 6.99, 5: 8.99}),
+                Product("Blueberry Muffin", "MB11", {2: 9.95, 5: 16.95, 8: 24.95}),
+                Product("Croissant", "CF", {3: 5.95, 5: 9.95, 9: 16.99}),
+            ]
+        )
+        report = run_load_test(bakery, replayed + [{"VS5": "NOT_NUMBER"}], window=0.01)
+        self.assertEqual(report["orders"], 2000)
+        self.assertEqual(report["errors"], 1)
+        self.assertEqual(sum(w["orders"] for w in report["windows"]), 2000)
+        self.assertGreater(report["orders_per_second"], 0)
+        self.assertLessEqual(report["p50_ms"], report["p99_ms"])
+        self.assertLessEqual(report["p99_ms"], report["max_ms"])
+        self.assertGreater(report["peak_rss_kb"], 0)
+        self.assertEqual(run_load_test(bakery, [])["orders"], 0)
+
+        self.assertEqual(find_load_regressions(report, report), [])
+        slower = dict(report, orders_per_second=report["orders_per_second"] / 2, p99_ms=report["p99_ms"] * 2 + 1)
+        self.assertEqual(len(find_load_regressions(slower, report)), 2)
+
+    @unittest.skipIf(shared_memory is None, "multiprocessing.shared_memory is not available")
+    def test_shared_tables(self):
+        import shared_tables
+        from shared_tables import SharedTables
+
+        # tables of these sizes are published whatever TABLE_SIZE_LIMIT is configured
+        for module in (helper, shared_tables):
+            patcher = mock.patch.object(module, "TABLE_SIZE_LIMIT", 1 << 20)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        prefix = f"rbtest{os.getpid()}_"
+        key = get_table_key([53, 47, 29])
+        expected = PackTable(*key)
+        with SharedTables(prefix) as owner:
+            table = owner.publish(key)
+            self.assertTrue(table.packs.readonly)  # zero-copy view of the segment
+            self.assertIs(owner.publish(key), table)
+            self.assertIs(find_pack_table(*key), table)
+            for quantity in range(expected.limit * 2):
+                self.assertEqual(table.breakdown(quantity), expected.breakdown(quantity))
+
+            # another process attaches to the same segment
+            worker = SharedTables(prefix)
+            attached = worker.attach(key)
+            self.assertEqual(attached.breakdown(10 ** 12), expected.breakdown(10 ** 12))
+            del attached
+            worker.close()
+            self.assertIs(find_pack_table(*key), table)
+
+            # workers of the pool attach instead of building
+            bakery = Bakery([Product("Pie", "PI", {53: 10, 47: 9, 29: 6}), Product("Tart", "TA", {3: 1, 5: 2})])
+            order_dicts = [{"PI": random.randrange(1, 10 ** 6), "TA": random.randrange(1, 100)} for i in range(50)]
+            parallel = bakery.process_orders_parallel(
+                [Order(d) for d in order_dicts], workers=2, chunk_size=8, shared_tables=owner
+            )
+            self.assertEqual(len(owner), 2)
+            for order_dict, parallel_order in zip(order_dicts, parallel):
+                order = Order(order_dict)
+                bakery.process_order(order)
+                self.assertEqual(parallel_order.products, order.products)
+            del table, bakery
+
+        # released, segment is removed
+        self.assertEqual(len(owner), 0)
+        self.assertIsNone(find_pack_table(*key))
+        self.assertIsNone(SharedTables(prefix).attach(key))